@@ -0,0 +1,166 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from botocore.exceptions import BotoCoreError, ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from langchain_core.embeddings import Embeddings
+
+# The Lambda image ships the same module as lambda_functions/src/bedrock_embeddings.py,
+# tests/test_bedrock_embeddings.py checks the two copies do not drift apart.
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_INITIAL_CONCURRENCY = 8
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BACKOFF_BASE_SECONDS = 0.25
+DEFAULT_BACKOFF_CAP_SECONDS = 8.0
+
+THROTTLING_ERRORS = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+
+# Server errors worth retrying, besides any 5xx response.
+TRANSIENT_ERRORS = {
+    "InternalServerException",
+    "ModelTimeoutException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+}
+
+
+def is_throttling(error: Exception) -> bool:
+    """Whether the error is Bedrock asking us to slow down."""
+    return (
+        isinstance(error, ClientError)
+        and error.response.get("Error", {}).get("Code") in THROTTLING_ERRORS
+    )
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether the error is a dropped connection, a timeout or a server error."""
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return status >= 500 or error.response.get("Error", {}).get("Code") in TRANSIENT_ERRORS
+    return False
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that adapts to throttling, additive increase and multiplicative decrease.
+
+    Every successful request raises the limit by ``1 / limit``, about one per
+    round of requests, and every throttled request halves it, at most once per
+    round so a burst of throttles from the same round counts as one.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started_at: float, throttled: bool) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                if started_at >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = time.monotonic()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class BedrockBulkEmbeddings(Embeddings):
+    """Titan embeddings that sends many ``invoke_model`` requests concurrently.
+
+    Requests share the client's connection pool, so create the client with
+    ``max_pool_connections`` of at least ``max_concurrency``. The number of
+    requests in flight adapts to throttling. Throttled requests, and the
+    connection errors, timeouts and server errors botocore would retry, are
+    retried with exponential backoff and full jitter. Only throttling lowers
+    the concurrency. The vectors come back in the order of the texts.
+    """
+
+    def __init__(
+        self,
+        client,
+        model_id: str,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backoff_base: float = DEFAULT_BACKOFF_BASE_SECONDS,
+        backoff_cap: float = DEFAULT_BACKOFF_CAP_SECONDS,
+    ):
+        self.client = client
+        self.model_id = model_id
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.limiter = AdaptiveLimiter(initial_concurrency, max_concurrency)
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="bedrock-embeddings"
+        )
+
+    def _invoke(self, text: str) -> List[float]:
+        response = self.client.invoke_model(
+            body=json.dumps({"inputText": text.replace(os.linesep, " ")}),
+            modelId=self.model_id,
+            accept="application/json",
+            contentType="application/json",
+        )
+        return json.loads(response["body"].read())["embedding"]
+
+    def _embed(self, text: str) -> List[float]:
+        for attempt in range(self.max_attempts):
+            started_at = self.limiter.acquire()
+            throttled = False
+            try:
+                return self._invoke(text)
+            except (ClientError, BotoCoreError) as e:
+                throttled = is_throttling(e)
+                if not (throttled or is_transient(e)) or attempt == self.max_attempts - 1:
+                    raise
+            finally:
+                self.limiter.release(started_at, throttled)
+                with self._lock:
+                    self.requests += 1
+                    self.throttled += throttled
+            time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt)))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return list(self._executor.map(self._embed, texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "concurrency": round(self.limiter.limit, 2),
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
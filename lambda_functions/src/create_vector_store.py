@@ -1,48 +1,303 @@
 import boto3
+import hashlib
+import io
 import json
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores.qdrant import Qdrant
-from qdrant_client import QdrantClient
+import os
+import threading
+import uuid
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterator
 from utils import Embedding, Embeddings, get_embeddings
 
+# langchain, pypdf and qdrant_client take most of the cold start, so they are
+# imported on first use rather than when the function is initialized.
+if TYPE_CHECKING:
+    from embedding_store import EmbeddingStore
+    from langchain_core.documents import Document
+    from qdrant_client import QdrantClient
+
 # Constants
 AWS_EMBEDDINGS = ["amazon.titan-embed-text-v1"]
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+UPSERT_BATCH_SIZE = 256
+# Larger objects are read with ranged GETs instead of being held in memory.
+IN_MEMORY_MAX_BYTES = 64 * 1024 * 1024
+RANGE_SIZE = 1024 * 1024
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+DOCUMENT_KEY = "document"
+# Shared with the CLI ingestion engine so both produce the same point ids.
+POINT_ID_NAMESPACE = uuid.UUID("6fe702a9-4562-4d12-98b1-6caff2356852")
+# /tmp is the only writable path in Lambda; it survives between warm invocations.
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "/tmp/embedding_store.sqlite3")
+# Warmed store exported with `qdrant_cli.py embeddings-export` and shipped in the image.
+EMBEDDING_STORE_SEED = os.getenv(
+    "EMBEDDING_STORE_SEED",
+    os.path.join(os.getenv("LAMBDA_TASK_ROOT", "."), "embedding_store.sqlite3"),
+)
+
+# Prefix of the documents in the bucket, documents are identified by their key without it.
+DOCUMENTS_PREFIX = os.getenv("DOCUMENTS_PREFIX", "")
+
+# Settings of a new collection: "scalar", "product" or "binary" quantization of the
+# vectors, kept in RAM, and whether the original vectors are stored on disk.
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none")
+QDRANT_ON_DISK = os.getenv("QDRANT_ON_DISK", "false").lower() == "true"
 
-# AWS S3 client
-s3 = boto3.client("s3")
+# Records of one event are indexed concurrently and share the embedding store.
+_store_lock = threading.Lock()
+_store = None
 
 # Logging setup
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def get_client(url: str, api_key: str) -> QdrantClient:
-    """Create and return a Qdrant client."""
+@lru_cache
+def get_s3_client():
+    """Create the S3 client once and reuse it across warm invocations."""
+    return boto3.client("s3")
+
+@lru_cache
+def get_client(url: str, api_key: str) -> "QdrantClient":
+    """Create a Qdrant client once and reuse it across warm invocations."""
+    from qdrant_client import QdrantClient
+
     return QdrantClient(url=url, api_key=api_key)
 
+def get_embedding_store() -> "EmbeddingStore":
+    """Open the embedding store once, seeding it from the image on a cold start."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            from embedding_store import EmbeddingStore
+
+            seed = not os.path.exists(EMBEDDING_STORE_PATH) and os.path.exists(EMBEDDING_STORE_SEED)
+            _store = EmbeddingStore(EMBEDDING_STORE_PATH)
+            if seed:
+                added = _store.import_from(EMBEDDING_STORE_SEED)
+                logger.info(f"Seeded embedding store with {added} embeddings")
+    return _store
+
 def get_collection_info(url: str, api_key: str, collection_name: str) -> None:
     """Log the collection info."""
     client = get_client(url, api_key)
     info = client.get_collection(collection_name=collection_name)
     logger.info(json.dumps(f"Collection info\n: {info}", indent=4))
 
-def get_documents_from_pdf(bucket_name: str, key: str) -> list:
-    """Download a PDF from S3, load it, and split it into documents."""
-    s3_object_name = key.split("/")[-1]
+class S3RangeReader(io.RawIOBase):
+    """Seekable read-only view of an S3 object that fetches byte ranges on demand.
+
+    Wrapped in an ``io.BufferedReader`` it lets the PDF parser jump around
+    the object without the whole file ever being in memory or on disk.
+    """
+
+    def __init__(self, bucket_name: str, key: str, size: int):
+        self.bucket_name = bucket_name
+        self.key = key
+        self.size = size
+        self.position = 0
+        self.requests = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        if self.position >= self.size:
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = get_s3_client().get_object(
+            Bucket=self.bucket_name, Key=self.key, Range=f"bytes={self.position}-{end}"
+        )
+        data = response["Body"].read()
+        self.requests += 1
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def open_s3_object(bucket_name: str, key: str) -> io.BufferedIOBase:
+    """Open an S3 object for random access, in memory when it is small enough."""
+    s3 = get_s3_client()
+    size = s3.head_object(Bucket=bucket_name, Key=key)["ContentLength"]
+    logger.info(f"Reading s3://{bucket_name}/{key} ({size} bytes)")
+    if size <= IN_MEMORY_MAX_BYTES:
+        return io.BytesIO(s3.get_object(Bucket=bucket_name, Key=key)["Body"].read())
+    return io.BufferedReader(S3RangeReader(bucket_name, key, size), buffer_size=RANGE_SIZE)
+
+def iter_pages(bucket_name: str, key: str) -> Iterator["Document"]:
+    """Yield the pages of a PDF in S3 one at a time."""
+    from langchain_core.documents import Document
+    from pypdf import PdfReader
+
+    with open_s3_object(bucket_name, key) as stream:
+        reader = PdfReader(stream)
+        for page_number, page in enumerate(reader.pages):
+            yield Document(
+                page_content=page.extract_text(),
+                metadata={"source": f"s3://{bucket_name}/{key}", "page": page_number},
+            )
+
+def get_documents_from_pdf(bucket_name: str, key: str) -> Iterator["Document"]:
+    """Stream a PDF from S3 and yield its chunks page by page, with their offsets in the page."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_core.documents import Document
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    for page in iter_pages(bucket_name, key):
+        start = -1
+        for chunk in text_splitter.split_text(page.page_content):
+            # Chunks come in order and overlap, so the next one starts after the previous start.
+            start = page.page_content.find(chunk, start + 1)
+            metadata = {**page.metadata, "start_index": start, "end_index": start + len(chunk)}
+            metadata[DOCUMENT_KEY] = document_key(key)
+            yield Document(page_content=chunk, metadata=metadata)
+
+def document_key(key: str) -> str:
+    """Identify a document by its S3 key without the documents prefix.
+
+    ``download-docs`` mirrors the keys under the collection's documents folder,
+    so the CLI gets the same key from the path relative to that folder.
+    """
+    if key.startswith(DOCUMENTS_PREFIX):
+        key = key[len(DOCUMENTS_PREFIX):]
+    return key.lstrip("/")
+
+def legacy_document_key(source: str, collection_name: str) -> str:
+    """Document key of a point stored before points had one, from its ``metadata.source``.
 
-    logger.info(f"Downloading file from s3://{bucket_name}/{key}")
-    logger.info(f"File name: {s3_object_name}")
+    ``create`` stored the path under ``documents/<collection>``, this function
+    only kept the file name.
+    """
+    source = os.path.normpath(source).replace(os.sep, "/")
+    folder = f"documents/{collection_name}/"
+    return source[len(folder):] if source.startswith(folder) else os.path.basename(source)
 
-    s3.download_file(bucket_name, key, f"/tmp/{s3_object_name}")
+def point_id(document: str, content: str) -> str:
+    """Deterministic point id of a chunk, so re-ingesting it overwrites the same point."""
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{document}:{CHUNK_SIZE}:{CHUNK_OVERLAP}:{digest}"))
 
-    loader = PyPDFLoader(f"/tmp/{s3_object_name}")
-    documents = loader.load()
+def existing_point_ids(client: "QdrantClient", collection_name: str, document: str) -> set:
+    """Get the ids of the points already stored for a document."""
+    from qdrant_client.http import models
+
+    ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=models.Filter(
+                must=[
+                    models.FieldCondition(
+                        key=f"{METADATA_KEY}.{DOCUMENT_KEY}",
+                        match=models.MatchValue(value=document),
+                    )
+                ]
+            ),
+            limit=1000,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        ids.update(str(point.id) for point in points)
+        if offset is None:
+            return ids
+
+def legacy_point_ids(client: "QdrantClient", collection_name: str, document: str) -> set:
+    """Get the ids of the points a document got before ids were content hashes.
+
+    ``Qdrant.from_documents`` gave those points random ids and no
+    ``metadata.document``, so re-indexing never overwrites them. They are
+    matched to the document by ``metadata.source``.
+    """
+    from qdrant_client.http import models
+
+    ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=models.Filter(
+                must=[
+                    models.IsEmptyCondition(
+                        is_empty=models.PayloadField(key=f"{METADATA_KEY}.{DOCUMENT_KEY}")
+                    )
+                ]
+            ),
+            limit=1000,
+            offset=offset,
+            with_payload=[f"{METADATA_KEY}.source"],
+            with_vectors=False,
+        )
+        for point in points:
+            source = (point.payload or {}).get(METADATA_KEY, {}).get("source")
+            if source and legacy_document_key(source, collection_name) == document:
+                ids.add(str(point.id))
+        if offset is None:
+            return ids
+
+def collection_exists(client: "QdrantClient", collection_name: str) -> bool:
+    """Check whether the collection exists."""
+    collections = client.get_collections().collections
+    return collection_name in {collection.name for collection in collections}
+
+def quantization_config(kind: str):
+    """Qdrant quantization of the given kind, the quantized vectors kept in RAM."""
+    from qdrant_client.http import models
+
+    if kind == "none":
+        return None
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if kind == "product":
+        return models.ProductQuantization(
+            product=models.ProductQuantizationConfig(
+                compression=models.CompressionRatio.X16, always_ram=True
+            )
+        )
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Invalid quantization {kind}")
+
+def ensure_collection(client: "QdrantClient", collection_name: str, vector_size: int) -> None:
+    """Create the collection and its document index if they do not exist yet."""
+    from qdrant_client.http import models
+
+    if collection_exists(client, collection_name):
+        return
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(
+            size=vector_size, distance=models.Distance.COSINE, on_disk=QDRANT_ON_DISK
+        ),
+        quantization_config=quantization_config(QDRANT_QUANTIZATION),
+    )
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name=f"{METADATA_KEY}.{DOCUMENT_KEY}",
+        field_schema=models.PayloadSchemaType.KEYWORD,
+    )
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-    docs = text_splitter.split_documents(documents)
-    logger.info(f"Number of documents after split: {len(docs)}")
-    return docs
 
 def create_vectorstore(
     url: str,
@@ -52,24 +307,83 @@ def create_vectorstore(
     collection_name: str,
     region_name: str,
     embedding_model: str,
-) -> None:
-    """Create a vector store from a PDF in an S3 bucket."""
-    docs = get_documents_from_pdf(bucket_name=bucket_name, key=object_key)
+) -> dict:
+    """Index a PDF in an S3 bucket into a Qdrant collection.
 
-    embeddings = get_embeddings(
-        embedding=Embedding(embeddings=Embeddings.BEDROCK, model_name=embedding_model),
-        region_name=region_name,
-    )
-    logger.info("Creating collection...")
-
-    vectorstore = Qdrant.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        url=url,
-        prefer_grpc=True,
-        api_key=api_key,
-        collection_name=collection_name,
-        force_recreate=False,
+    Chunks are embedded and upserted in batches while the PDF is still being
+    parsed. Only the chunks that are not stored yet are embedded, and points
+    left over from a previous version of the document are deleted at the end,
+    including the ones it got before point ids were content hashes.
+    """
+    from embedding_store import CachedEmbeddings
+    from qdrant_client.http import models
+
+    document = document_key(object_key)
+    client = get_client(url, api_key)
+    existing = set()
+    if collection_exists(client, collection_name):
+        existing = existing_point_ids(client, collection_name, document)
+        existing |= legacy_point_ids(client, collection_name, document)
+
+    embeddings = CachedEmbeddings(
+        get_embeddings(
+            embedding=Embedding(embeddings=Embeddings.BEDROCK, model_name=embedding_model),
+            region_name=region_name,
+        ),
+        get_embedding_store(),
+        embedding_model,
     )
-    vectorstore.client.close()
-    get_collection_info(url, api_key, collection_name)
\ No newline at end of file
+
+    seen = set()
+    batch = {}
+    upserted = 0
+
+    def flush() -> None:
+        vectors = embeddings.embed_documents([doc.page_content for doc in batch.values()])
+        ensure_collection(client, collection_name, len(vectors[0]))
+        client.upsert(
+            collection_name=collection_name,
+            points=[
+                models.PointStruct(
+                    id=chunk_id,
+                    vector=vector,
+                    payload={CONTENT_KEY: doc.page_content, METADATA_KEY: doc.metadata},
+                )
+                for (chunk_id, doc), vector in zip(batch.items(), vectors)
+            ],
+        )
+
+    for doc in get_documents_from_pdf(bucket_name=bucket_name, key=object_key):
+        chunk_id = point_id(document, doc.page_content)
+        if chunk_id in seen:
+            continue
+        seen.add(chunk_id)
+        if chunk_id in existing:
+            continue
+        batch[chunk_id] = doc
+        if len(batch) >= UPSERT_BATCH_SIZE:
+            flush()
+            upserted += len(batch)
+            batch = {}
+    if batch:
+        flush()
+        upserted += len(batch)
+
+    # Stale points go only after their replacements are in.
+    stale_ids = list(existing - seen)
+    if stale_ids:
+        client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=stale_ids),
+        )
+
+    stats = {
+        "document": document,
+        "chunks": len(seen),
+        "upserted": upserted,
+        "unchanged": len(seen) - upserted,
+        "deleted": len(stale_ids),
+        "embedding_store_hits": embeddings.hits,
+    }
+    logger.info(f"Indexed {json.dumps(stats)}")
+    return stats
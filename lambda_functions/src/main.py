@@ -1,13 +1,19 @@
 import json
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
 from dotenv import load_dotenv
-from create_vector_store import create_vectorstore
+from create_vector_store import create_vectorstore, get_collection_info
 
 # Load environment variables
 load_dotenv()
 
 EMBEDDING_MODEL = "amazon.titan-embed-text-v1"
 COLLECTION_NAME = "cnu"
+# Memory set aside for each record indexed concurrently, parsing plus one batch of vectors.
+RECORD_MEMORY_MB = 256
+MAX_CONCURRENT_RECORDS = 8
 
 # Environment variables
 QDRANT_URL = os.getenv("QDRANT_URL_AWS")
@@ -15,14 +21,24 @@ QDRANT_API_KEY = os.getenv("QDRANT_API_KEY_AWS")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 AWS_REGION = os.getenv("REGION")
 
-def lambda_handler(event, context):
-    """AWS Lambda function handler."""
-    # Extract bucket name and object key from event
-    bucket_name = event["Records"][0]["s3"]["bucket"]["name"]
-    object_key = event["Records"][0]["s3"]["object"]["key"]
+# Logging setup
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+def get_objects(event: dict) -> list:
+    """Get the (bucket, key) of every S3 object in the event."""
+    return [
+        (record["s3"]["bucket"]["name"], unquote_plus(record["s3"]["object"]["key"]))
+        for record in event.get("Records", [])
+    ]
 
-    # Create vector store
-    create_vectorstore(
+def max_concurrent_records() -> int:
+    """How many records fit in the function's memory at the same time."""
+    memory_mb = int(os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", RECORD_MEMORY_MB))
+    return max(1, min(MAX_CONCURRENT_RECORDS, memory_mb // RECORD_MEMORY_MB))
+
+def index_object(bucket_name: str, object_key: str) -> dict:
+    return create_vectorstore(
         url=QDRANT_URL,
         api_key=QDRANT_API_KEY,
         bucket_name=bucket_name,
@@ -32,4 +48,26 @@ def lambda_handler(event, context):
         embedding_model=EMBEDDING_MODEL,
     )
 
-    return {"statusCode": 200, "body": json.dumps("Successful!")}
\ No newline at end of file
+def lambda_handler(event, context):
+    """AWS Lambda function handler."""
+    objects = get_objects(event)
+    if not objects:
+        return {"statusCode": 200, "body": json.dumps([])}
+
+    # Index every object of the event concurrently
+    with ThreadPoolExecutor(max_workers=min(len(objects), max_concurrent_records())) as executor:
+        futures = [executor.submit(index_object, bucket, key) for bucket, key in objects]
+
+    results, errors = [], []
+    for (bucket, key), future in zip(objects, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.error(f"Error indexing s3://{bucket}/{key}: {e}")
+            errors.append(e)
+    if errors:
+        # Re-indexing is idempotent, so let Lambda retry the whole event.
+        raise errors[0]
+
+    get_collection_info(QDRANT_URL, QDRANT_API_KEY, COLLECTION_NAME)
+    return {"statusCode": 200, "body": json.dumps(results)}
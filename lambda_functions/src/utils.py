@@ -1,8 +1,12 @@
 import boto3
 import logging
+from botocore.config import Config
 from dataclasses import dataclass
 from enum import Enum
-from langchain_community.embeddings import BedrockEmbeddings
+from functools import lru_cache
+
+# Most Bedrock embedding requests in flight, shared by the records of an event.
+BEDROCK_MAX_CONCURRENCY = 32
 
 # Logging setup
 logger = logging.getLogger()
@@ -18,10 +22,28 @@ class Embedding:
     embeddings: Embeddings
     model_name: str
 
-def get_bedrock_embeddings(model_name: str, region_name: str) -> BedrockEmbeddings:
-    """Create and return Bedrock embeddings."""
-    bedrock_runtime = boto3.client("bedrock-runtime", region_name=region_name)
-    embeddings = BedrockEmbeddings(client=bedrock_runtime, model_id=model_name)
+@lru_cache
+def get_bedrock_runtime(region_name: str):
+    """Create the bedrock-runtime client once and reuse it across warm invocations."""
+    # A pool large enough for every concurrent request, retries are done by the embeddings.
+    return boto3.client(
+        "bedrock-runtime",
+        region_name=region_name,
+        config=Config(
+            max_pool_connections=BEDROCK_MAX_CONCURRENCY,
+            retries={"mode": "standard", "max_attempts": 1},
+        ),
+    )
+
+@lru_cache
+def get_bedrock_embeddings(model_name: str, region_name: str):
+    """Create and return Bedrock embeddings, reused across warm invocations."""
+    # Imported on first use to keep langchain out of the cold start.
+    from bedrock_embeddings import BedrockBulkEmbeddings
+
+    embeddings = BedrockBulkEmbeddings(
+        get_bedrock_runtime(region_name), model_name, max_concurrency=BEDROCK_MAX_CONCURRENCY
+    )
     logger.info("Embedding finished!")
     return embeddings
 
@@ -32,4 +54,4 @@ def get_embeddings(embedding: Embedding, region_name: str):
     if embedding.embeddings == Embeddings.BEDROCK:
         return get_bedrock_embeddings(embedding.model_name, region_name=region_name)
     else:
-        raise ValueError("Invalid embedding type")
\ No newline at end of file
+        raise ValueError("Invalid embedding type")
@@ -0,0 +1,146 @@
+"""Measure cold and warm start times of the indexing Lambda.
+
+Every run starts a fresh Python process, the way Lambda starts a new
+execution environment, and reports:
+
+- init: time to import the handler module (the Lambda init phase)
+- cold: the first invocation, which creates the clients and loads the libraries
+- warm: the following invocations in the same process
+
+By default S3 is mocked with moto, Qdrant runs in memory and embeddings are
+faked, so the numbers only cover the function's own overhead and can be
+compared between commits. Pass --live to use the real services configured in
+the environment instead.
+
+    python lambda_functions/start_time.py --pdf documents/cnu/edital.pdf --runs 5
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+
+
+def event(bucket, keys):
+	return {
+		"Records": [{"s3": {"bucket": {"name": bucket}, "object": {"key": key}}} for key in keys]
+	}
+
+
+class FakeEmbeddings:
+	"""Deterministic embeddings that cost nothing to import or call."""
+
+	def __init__(self, size=1536):
+		self.size = size
+
+	def embed_documents(self, texts):
+		return [self.embed_query(text) for text in texts]
+
+	def embed_query(self, text):
+		seed = hash(text)
+		return [((seed >> (i % 48)) & 0xFF) / 255.0 + 0.001 for i in range(self.size)]
+
+
+def child(args) -> None:
+	"""One execution environment: init, then one cold and several warm invocations."""
+	timings = {}
+	sys.path.insert(0, SRC)
+	os.environ.setdefault("EMBEDDING_STORE_PATH", os.path.join(args.tmp, "store.sqlite3"))
+
+	start = time.perf_counter()
+	import main
+
+	timings["init"] = time.perf_counter() - start
+
+	if not args.live:
+		# Set up after the init so moto's own imports are not measured.
+		import boto3
+		import create_vector_store
+		from moto import mock_aws
+
+		mock = mock_aws()
+		mock.start()
+		s3 = boto3.client("s3", region_name="us-east-1")
+		s3.create_bucket(Bucket=args.bucket)
+		for invocation in range(args.invocations):
+			s3.upload_file(args.pdf, args.bucket, f"{invocation}/{os.path.basename(args.pdf)}")
+
+		client = []
+
+		def get_client(url, api_key):
+			if not client:
+				from qdrant_client import QdrantClient
+
+				client.append(QdrantClient(":memory:"))
+			return client[0]
+
+		create_vector_store.get_client = get_client
+		create_vector_store.get_embeddings = lambda **kwargs: FakeEmbeddings()
+
+	timings["invocations"] = []
+	for invocation in range(args.invocations):
+		key = f"{invocation}/{os.path.basename(args.pdf)}" if not args.live else args.key
+		start = time.perf_counter()
+		main.lambda_handler(event(args.bucket, [key]), None)
+		timings["invocations"].append(time.perf_counter() - start)
+	print(json.dumps(timings))
+
+
+def run(args) -> dict:
+	command = [sys.executable, os.path.abspath(__file__), "--child", "--pdf", args.pdf]
+	command += ["--invocations", str(args.invocations), "--tmp", args.tmp, "--bucket", args.bucket]
+	if args.live:
+		command += ["--live", "--key", args.key]
+	env = {**os.environ, "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1")}
+	if not args.live:
+		env.update(AWS_ACCESS_KEY_ID="testing", AWS_SECRET_ACCESS_KEY="testing")
+	output = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+	return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+	parser.add_argument("--pdf", default=(sorted(glob.glob("documents/*/*")) or [None])[0])
+	parser.add_argument("--runs", type=int, default=3, help="Fresh processes to start")
+	parser.add_argument("--invocations", type=int, default=3, help="Invocations per process")
+	parser.add_argument("--live", action="store_true", help="Use the real S3, Bedrock and Qdrant")
+	parser.add_argument("--bucket", default="start-time", help="S3 bucket of the PDFs")
+	parser.add_argument("--key", help="S3 key to index with --live")
+	parser.add_argument("--max-init-ms", type=float, help="Fail if the median init is slower")
+	parser.add_argument("--tmp", default="/tmp/start-time")
+	parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child:
+		child(args)
+		return
+
+	os.makedirs(args.tmp, exist_ok=True)
+	init, cold, warm = [], [], []
+	for _ in range(args.runs):
+		store = os.path.join(args.tmp, "store.sqlite3")
+		if os.path.exists(store):
+			os.remove(store)
+		timings = run(args)
+		init.append(timings["init"])
+		cold.append(timings["invocations"][0])
+		warm.extend(timings["invocations"][1:])
+
+	print(f"{'phase':<6} {'median ms':>10} {'max ms':>10}")
+	for name, values in (("init", init), ("cold", cold), ("warm", warm)):
+		if values:
+			print(
+				f"{name:<6} {statistics.median(values) * 1000:>10.1f} {max(values) * 1000:>10.1f}"
+			)
+	if args.max_init_ms is not None and statistics.median(init) * 1000 > args.max_init_ms:
+		sys.exit(f"Median init {statistics.median(init) * 1000:.1f} ms > {args.max_init_ms} ms")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+from botocore.exceptions import BotoCoreError, ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+
+from .metrics import SHED_REQUESTS
+
+logger = logging.getLogger()
+
+DEFAULT_DEADLINE_SECONDS = 30.0
+DEFAULT_RETRY_ATTEMPTS = 4
+DEFAULT_BACKOFF_BASE_SECONDS = 0.25
+DEFAULT_BACKOFF_CAP_SECONDS = 4.0
+
+THROTTLING_ERRORS = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+# Server errors worth retrying, besides any 5xx response.
+TRANSIENT_ERRORS = {
+    "InternalServerException",
+    "ModelTimeoutException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+}
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of queued."""
+
+    def __init__(self, detail: str, status_code: int = 503, retry_after: float = 1.0):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> dict:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+def set_deadline(seconds: float = DEFAULT_DEADLINE_SECONDS) -> None:
+    """Give the current request ``seconds`` to complete."""
+    _deadline.set(time.monotonic() + seconds)
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current request's deadline, or None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue in front of a backend.
+
+    Requests beyond ``max_concurrency`` wait in a queue of at most ``max_queue``
+    entries. A request is rejected right away with 429 when the queue is full,
+    and with 503 when its expected wait would run past its deadline. The
+    expected wait comes from a moving average of how long each slot is held.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.service_time = 0.0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def expected_wait(self) -> float:
+        """Expected time in the queue for a request arriving now."""
+        if self.active < self.max_concurrency:
+            return 0.0
+        return self.service_time * (self.waiting + 1) / self.max_concurrency
+
+    def reject(self, detail: str, status_code: int = 503) -> Overloaded:
+        self.rejected += 1
+        SHED_REQUESTS.labels(self.name, str(status_code)).inc()
+        return Overloaded(
+            f"{self.name} {detail}", status_code=status_code, retry_after=self.expected_wait()
+        )
+
+    def check(self) -> None:
+        """Reject the request now if it could not be admitted."""
+        if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+            raise self.reject("queue is full", status_code=429)
+        remaining = time_left()
+        if remaining is not None and self.expected_wait() >= remaining:
+            raise self.reject("cannot answer before the deadline")
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the backend's concurrency slots."""
+        self.check()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=time_left())
+        except asyncio.TimeoutError:
+            raise self.reject("deadline exceeded while queued")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            elapsed = time.monotonic() - start
+            self.service_time = elapsed if not self.service_time else (
+                0.8 * self.service_time + 0.2 * elapsed
+            )
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "service_time": round(self.service_time, 4),
+        }
+
+
+def is_throttling(error: Exception) -> bool:
+    """Whether the error is Bedrock asking us to slow down."""
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in THROTTLING_ERRORS
+    # langchain wraps the botocore error in a ValueError with the original message.
+    return any(code in str(error) for code in THROTTLING_ERRORS)
+
+
+def _botocore_error(error: Exception) -> Optional[Exception]:
+    """The botocore error behind ``error``, langchain re-raises it as a ValueError."""
+    while error is not None:
+        if isinstance(error, (ClientError, BotoCoreError)):
+            return error
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether the error is a dropped connection, a timeout or a Bedrock server error."""
+    error = _botocore_error(error)
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return status >= 500 or error.response.get("Error", {}).get("Code") in TRANSIENT_ERRORS
+    return False
+
+
+def retry_delay(
+    error: Exception,
+    attempt: int,
+    attempts: int = DEFAULT_RETRY_ATTEMPTS,
+    base: float = DEFAULT_BACKOFF_BASE_SECONDS,
+    cap: float = DEFAULT_BACKOFF_CAP_SECONDS,
+) -> Optional[float]:
+    """Seconds to wait before retrying a failed Bedrock call, None if it is not retried.
+
+    Throttling and transient errors get exponential backoff with full jitter.
+    Raises ``Overloaded`` once the attempts or the request's deadline run out.
+    """
+    throttled = is_throttling(error)
+    if not throttled and not is_transient(error):
+        return None
+    detail = "Bedrock is throttling requests" if throttled else "Bedrock is unavailable"
+    if attempt == attempts - 1:
+        raise Overloaded(detail, retry_after=cap) from error
+    delay = random.uniform(0, min(cap, base * 2**attempt))
+    remaining = time_left()
+    if remaining is not None and delay >= remaining:
+        raise Overloaded(detail, retry_after=cap) from error
+    logger.warning(f"{detail}, retrying in {delay:.2f} seconds")
+    return delay
+
+
+async def retry_bedrock(
+    func: Callable[[], Awaitable[Any]],
+    attempts: int = DEFAULT_RETRY_ATTEMPTS,
+    base: float = DEFAULT_BACKOFF_BASE_SECONDS,
+    cap: float = DEFAULT_BACKOFF_CAP_SECONDS,
+) -> Any:
+    """Call ``func``, retrying throttling and transient errors."""
+    for attempt in range(attempts):
+        try:
+            return await func()
+        except Exception as e:
+            delay = retry_delay(e, attempt, attempts, base, cap)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
@@ -0,0 +1,296 @@
+import hashlib
+import logging
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger()
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_ANSWER_CACHE_SIZE = 512
+DEFAULT_ANSWER_CACHE_TTL_SECONDS = 60 * 60
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_TEMPERATURE_STEP = 0.1
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a question so trivially different spellings share a cache key."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class LRUCache:
+    """In-process LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisEmbeddingBackend:
+    """Shared embedding store in Redis, so every ECS task benefits from a hit."""
+
+    def __init__(self, url: str, ttl: float = DEFAULT_CACHE_TTL_SECONDS, prefix: str = "emb:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError("Install redis to use a shared embedding cache: pip install redis")
+        self.client = redis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        value = await self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return array("f", value).tolist()
+
+    async def set(self, key: str, embedding: List[float]) -> None:
+        await self.client.set(self.prefix + key, array("f", embedding).tobytes(), ex=self.ttl)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class EmbeddingCache:
+    """Query embedding cache keyed by model id and normalized text.
+
+    Lookups go to the in-process LRU first and then to the optional shared
+    backend. A miss in both calls ``embed`` and stores the result in both.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        ttl: float = DEFAULT_CACHE_TTL_SECONDS,
+        shared=None,
+    ):
+        self.model_id = model_id
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        data = f"{self.model_id}\n{normalize_text(text)}".encode()
+        return hashlib.sha256(data).hexdigest()
+
+    async def get_or_embed(
+        self, text: str, embed: Callable[[str], Awaitable[List[float]]]
+    ) -> List[float]:
+        """Return the cached embedding of the text, embedding it on a miss."""
+        key = self.key(text)
+        embedding = self.local.get(key)
+        if embedding is None and self.shared is not None:
+            try:
+                embedding = await self.shared.get(key)
+            except Exception as e:
+                logger.error(f"Error reading the shared embedding cache: {e}")
+            if embedding is not None:
+                self.local.set(key, embedding)
+
+        if embedding is not None:
+            self.hits += 1
+            return embedding
+
+        self.misses += 1
+        embedding = await embed(text)
+        self.local.set(key, embedding)
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, embedding)
+            except Exception as e:
+                logger.error(f"Error writing the shared embedding cache: {e}")
+        return embedding
+
+    async def get_or_embed_many(
+        self, texts: List[str], embed_many: Callable[[List[str]], Awaitable[List[List[float]]]]
+    ) -> List[List[float]]:
+        """Return the embeddings of the texts, embedding only the cache misses in one call."""
+        keys = [self.key(text) for text in texts]
+        embeddings = [self.local.get(key) for key in keys]
+        if self.shared is not None:
+            for i, key in enumerate(keys):
+                if embeddings[i] is None:
+                    try:
+                        embeddings[i] = await self.shared.get(key)
+                    except Exception as e:
+                        logger.error(f"Error reading the shared embedding cache: {e}")
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            new_embeddings = await embed_many([texts[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+                if self.shared is not None:
+                    try:
+                        await self.shared.set(keys[i], embedding)
+                    except Exception as e:
+                        logger.error(f"Error writing the shared embedding cache: {e}")
+        for key, embedding in zip(keys, embeddings):
+            self.local.set(key, embedding)
+        return embeddings
+
+    def stats(self) -> dict:
+        return {
+            "model_id": self.model_id,
+            "size": len(self.local),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared is not None,
+        }
+
+    async def aclose(self) -> None:
+        if self.shared is not None:
+            await self.shared.aclose()
+
+
+@dataclass
+class AnswerEntry:
+    """A generated answer and the question embedding that produced it."""
+    vector: np.ndarray
+    answer: str
+    created_at: float
+
+
+class AnswerCache:
+    """Semantic answer cache.
+
+    Answers are grouped by temperature bucket and the ids of the retrieved
+    chunks, so a cached answer is only reused when the new question sees
+    exactly the same context. Within a group, the answer is reused when the
+    cosine similarity of the question embeddings reaches ``threshold``.
+    Re-indexed chunks get new point ids, so they never match old entries;
+    ``check_collection`` also drops everything when the collection changes.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        max_size: int = DEFAULT_ANSWER_CACHE_SIZE,
+        ttl: float = DEFAULT_ANSWER_CACHE_TTL_SECONDS,
+        temperature_step: float = DEFAULT_TEMPERATURE_STEP,
+    ):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.temperature_step = temperature_step
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._ids = count()
+        self._entries: "OrderedDict[int, Tuple[tuple, AnswerEntry]]" = OrderedDict()
+        self._groups: Dict[tuple, Dict[int, AnswerEntry]] = {}
+        self._fingerprint = None
+
+    def group_key(self, chunk_ids: Sequence[str], temperature: Optional[float]) -> tuple:
+        bucket = None
+        if temperature is not None:
+            bucket = round(round(temperature / self.temperature_step) * self.temperature_step, 6)
+        return (bucket, tuple(chunk_ids))
+
+    def lookup(
+        self, embedding: Sequence[float], chunk_ids: Sequence[str], temperature: Optional[float]
+    ) -> Optional[str]:
+        """Return a cached answer for a similar question with the same context."""
+        group = self._groups.get(self.group_key(chunk_ids, temperature))
+        if group:
+            vector = _unit_vector(embedding)
+            now = time.monotonic()
+            best_id, best_score = None, self.threshold
+            for entry_id, entry in list(group.items()):
+                if now - entry.created_at >= self.ttl:
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(vector, entry.vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is not None:
+                self.hits += 1
+                self._entries.move_to_end(best_id)
+                return group[best_id].answer
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        embedding: Sequence[float],
+        chunk_ids: Sequence[str],
+        temperature: Optional[float],
+        answer: str,
+        generation: Optional[int] = None,
+    ) -> None:
+        """Cache an answer, unless the cache was invalidated while it was generated."""
+        if generation is not None and generation != self.generation:
+            return
+        key = self.group_key(chunk_ids, temperature)
+        entry_id = next(self._ids)
+        entry = AnswerEntry(vector=_unit_vector(embedding), answer=answer, created_at=time.monotonic())
+        self._entries[entry_id] = (key, entry)
+        self._groups.setdefault(key, {})[entry_id] = entry
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self) -> None:
+        """Drop every cached answer."""
+        self.generation += 1
+        self._entries.clear()
+        self._groups.clear()
+
+    def check_collection(self, fingerprint) -> bool:
+        """Invalidate the cache when the collection fingerprint changes."""
+        changed = self._fingerprint is not None and fingerprint != self._fingerprint
+        self._fingerprint = fingerprint
+        if changed:
+            logger.info("Collection changed, invalidating the answer cache")
+            self.invalidate()
+        return changed
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, entry_id: int) -> None:
+        key, _ = self._entries.pop(entry_id)
+        group = self._groups[key]
+        del group[entry_id]
+        if not group:
+            del self._groups[key]
+
+
+def _unit_vector(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
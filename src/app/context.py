@@ -0,0 +1,211 @@
+import re
+from dataclasses import dataclass
+from itertools import permutations
+from typing import List, Optional, Set
+
+from langchain_core.documents import Document
+
+from .metrics import estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 1024
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+# Shortest shared text taken as the overlap of two chunks without offsets.
+MIN_OVERLAP_CHARS = 20
+# Chunks of a page this close are adjacent, the splitter drops the whitespace between them.
+MAX_GAP_CHARS = 2
+# A chunk cut to fit the budget is dropped instead when less than this fits.
+MIN_TRUNCATED_TOKENS = 32
+SHINGLE_SIZE = 3
+SEPARATOR = "\n\n"
+START_INDEX_KEY = "start_index"
+END_INDEX_KEY = "end_index"
+
+_WORD = re.compile(r"\w+")
+
+
+def _shingles(text: str) -> Set[tuple]:
+    words = _WORD.findall(text.lower())
+    count = max(1, len(words) - SHINGLE_SIZE + 1)
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(count)}
+
+
+def _text_overlap(a: str, b: str) -> int:
+    """Length of the longest end of ``a`` that ``b`` starts with, 0 if shorter than the minimum."""
+    if len(b) < MIN_OVERLAP_CHARS:
+        return 0
+    head = b[:MIN_OVERLAP_CHARS]
+    start = a.find(head, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(head, start + 1)
+    return 0
+
+
+@dataclass
+class AssembledContext:
+    docs: List[Document]
+    text: str
+    retrieved_tokens: int
+    tokens: int
+    merged: int = 0
+    duplicates: int = 0
+    truncated: int = 0
+    dropped: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.retrieved_tokens - self.tokens
+
+
+@dataclass
+class _Block:
+    rank: int
+    doc: Document
+    start: Optional[int] = None
+    end: Optional[int] = None
+
+
+class ContextAssembler:
+    """Turn the retrieved chunks into the context of the prompt.
+
+    Chunks of the same source and page that overlap or touch are merged into
+    one passage, using their ``start_index`` and ``end_index`` when the
+    splitter recorded them and the repeated text otherwise. Passages whose
+    words are mostly contained in a better ranked passage are dropped. The
+    passages are then taken in retrieval order until ``token_budget``, the
+    last one cut at a word boundary when enough of it fits.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        duplicate_threshold: float = DEFAULT_DUPLICATE_THRESHOLD,
+    ):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+
+    def assemble(self, docs: List[Document]) -> AssembledContext:
+        retrieved_tokens = estimate_tokens(SEPARATOR.join(doc.page_content for doc in docs))
+        blocks, merged = self._merge(docs)
+        blocks, duplicates = self._deduplicate(blocks)
+        selected, truncated, dropped = self._fit(blocks)
+        text = SEPARATOR.join(doc.page_content for doc in selected)
+        return AssembledContext(
+            docs=selected,
+            text=text,
+            retrieved_tokens=retrieved_tokens,
+            tokens=estimate_tokens(text),
+            merged=merged,
+            duplicates=duplicates,
+            truncated=truncated,
+            dropped=dropped,
+        )
+
+    def _merge(self, docs: List[Document]):
+        """Merge the overlapping and adjacent chunks of each source and page."""
+        groups = {}
+        for rank, doc in enumerate(docs):
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            start, end = doc.metadata.get(START_INDEX_KEY), doc.metadata.get(END_INDEX_KEY)
+            groups.setdefault(key, []).append(_Block(rank, doc, start, end))
+
+        blocks, merged = [], 0
+        for group in groups.values():
+            if all(block.start is not None and block.end is not None for block in group):
+                group, count = self._merge_by_offsets(group)
+            else:
+                group, count = self._merge_by_text(group)
+            blocks.extend(group)
+            merged += count
+        blocks.sort(key=lambda block: block.rank)
+        return blocks, merged
+
+    def _merge_by_offsets(self, group: List[_Block]):
+        group.sort(key=lambda block: block.start)
+        blocks, merged = [group[0]], 0
+        for block in group[1:]:
+            current = blocks[-1]
+            gap = block.start - current.end
+            if gap > MAX_GAP_CHARS:
+                blocks.append(block)
+                continue
+            text = current.doc.page_content
+            if block.end > current.end:
+                tail = block.doc.page_content[max(0, -gap):]
+                text += (" " if gap > 0 else "") + tail
+            end = max(current.end, block.end)
+            blocks[-1] = self._join(current, block, text, current.start, end)
+            merged += 1
+        return blocks, merged
+
+    def _merge_by_text(self, group: List[_Block]):
+        # Without offsets only a chunk starting with the end of another is merged.
+        merged = 0
+        changed = True
+        while changed:
+            changed = False
+            for first, second in permutations(group, 2):
+                overlap = _text_overlap(first.doc.page_content, second.doc.page_content)
+                if overlap:
+                    text = first.doc.page_content + second.doc.page_content[overlap:]
+                    group.remove(first)
+                    group.remove(second)
+                    group.append(self._join(first, second, text))
+                    merged += 1
+                    changed = True
+                    break
+        return group, merged
+
+    @staticmethod
+    def _join(
+        first: _Block,
+        second: _Block,
+        text: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> _Block:
+        """One passage with the text of both, the metadata of the better ranked one."""
+        best = first if first.rank <= second.rank else second
+        metadata = dict(best.doc.metadata)
+        if start is not None:
+            metadata[START_INDEX_KEY], metadata[END_INDEX_KEY] = start, end
+        return _Block(best.rank, Document(page_content=text, metadata=metadata), start, end)
+
+    def _deduplicate(self, blocks: List[_Block]):
+        """Drop passages mostly contained in a better ranked one."""
+        kept, shingles, duplicates = [], [], 0
+        for block in blocks:
+            words = _shingles(block.doc.page_content)
+            if any(
+                len(words & other) >= self.duplicate_threshold * len(words) for other in shingles
+            ):
+                duplicates += 1
+                continue
+            kept.append(block)
+            shingles.append(words)
+        return kept, duplicates
+
+    def _fit(self, blocks: List[_Block]):
+        """Take the passages in order until the token budget is spent.
+
+        Returns the documents, whether the last one was truncated and how many
+        passages did not fit.
+        """
+        selected, used, truncated = [], 0, 0
+        for block in blocks:
+            separator = estimate_tokens(SEPARATOR) if selected else 0
+            tokens = estimate_tokens(block.doc.page_content)
+            if used + separator + tokens <= self.token_budget:
+                selected.append(block.doc)
+                used += separator + tokens
+                continue
+            left = self.token_budget - used - separator
+            # The best passage is always sent, cut to the budget if needed.
+            if left >= MIN_TRUNCATED_TOKENS or not selected:
+                text = block.doc.page_content[: left * 4]
+                text = text[: text.rfind(" ")] if " " in text else text
+                selected.append(Document(page_content=text, metadata=dict(block.doc.metadata)))
+                truncated = 1
+            return selected, truncated, len(blocks) - len(selected)
+        return selected, truncated, 0
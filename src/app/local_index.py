@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from qdrant_client.http import models
+
+logger = logging.getLogger()
+
+MANIFEST_FILE_NAME = "manifest.json"
+FORMAT_VERSION = 1
+# Distances whose scores are a plain dot product of the stored vectors, which
+# Qdrant normalizes on insert for cosine.
+DISTANCES = ("Cosine", "Dot")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _write_json(path: str, data) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as stream:
+        json.dump(data, stream, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def write_snapshot(
+    directory: str,
+    collection_name: str,
+    distance: str,
+    ids: List[Any],
+    vectors: np.ndarray,
+    payloads: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Write the points of a collection as a snapshot a ``LocalIndex`` can load.
+
+    The vectors and payloads of every snapshot are written to new files and
+    the manifest pointing to them is replaced last, so a reader never sees a
+    partial snapshot. The files of older snapshots are removed, except the
+    previous one that readers may still be using.
+    """
+    if distance not in DISTANCES:
+        raise ValueError(f"Unsupported distance {distance}, expected one of {DISTANCES}")
+    if not ids:
+        raise ValueError(f"No points to write to the snapshot of {collection_name}")
+    os.makedirs(directory, exist_ok=True)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+    if distance == "Cosine":
+        vectors = _normalize(vectors)
+
+    version = str(time.time_ns())
+    np.save(os.path.join(directory, f"vectors-{version}.npy"), vectors)
+    _write_json(
+        os.path.join(directory, f"payloads-{version}.json"), {"ids": ids, "payloads": payloads}
+    )
+    previous = LocalIndex.read_manifest(directory)
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "collection_name": collection_name,
+        "distance": distance,
+        "points": len(ids),
+        "dimension": int(vectors.shape[1]),
+    }
+    _write_json(os.path.join(directory, MANIFEST_FILE_NAME), manifest)
+
+    keep = {version, previous and previous["version"]}
+    for name in os.listdir(directory):
+        stem, extension = os.path.splitext(name)
+        if extension in (".npy", ".json") and "-" in stem and stem.split("-", 1)[1] not in keep:
+            os.remove(os.path.join(directory, name))
+    return manifest
+
+
+def export_snapshot(client, collection_name: str, directory: str, batch_size: int = 1024):
+    """Scroll every point of a Qdrant collection, with its vector, into a snapshot."""
+    info = client.get_collection(collection_name=collection_name)
+    distance = info.config.params.vectors.distance
+    ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        for point in points:
+            ids.append(point.id if isinstance(point.id, int) else str(point.id))
+            vectors.append(point.vector)
+            payloads.append(point.payload)
+        if offset is None:
+            break
+    return write_snapshot(
+        directory, collection_name, getattr(distance, "value", distance), ids, vectors, payloads
+    )
+
+
+@dataclass
+class Snapshot:
+    version: str
+    distance: str
+    ids: List[Any]
+    vectors: np.ndarray
+    payloads: List[Dict[str, Any]]
+
+
+class LocalIndex:
+    """In-process exact search over a collection snapshot.
+
+    The vectors are memory-mapped from the snapshot, so they are paged in from
+    the OS page cache on first use and shared between the workers of a host.
+    Searches score every vector with one matrix product and select the top
+    ``limit`` with ``argpartition``, and return ``ScoredPoint``s like the
+    Qdrant client does. ``reload`` swaps in a newer snapshot when one was
+    written, searches in flight keep using the one they started with.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._snapshot: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE_NAME), encoding="utf-8") as stream:
+                return json.load(stream)
+        except FileNotFoundError:
+            return None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._snapshot.version if self._snapshot is not None else None
+
+    def __len__(self) -> int:
+        return len(self._snapshot.ids) if self._snapshot is not None else 0
+
+    def reload(self) -> bool:
+        """Load the latest snapshot if it is not the one in use, return whether it changed."""
+        with self._lock:
+            manifest = self.read_manifest(self.directory)
+            if manifest is None:
+                raise FileNotFoundError(f"No snapshot in {self.directory}")
+            if manifest["version"] == self.version:
+                return False
+            version = manifest["version"]
+            vectors = np.load(
+                os.path.join(self.directory, f"vectors-{version}.npy"), mmap_mode="r"
+            )
+            with open(
+                os.path.join(self.directory, f"payloads-{version}.json"), encoding="utf-8"
+            ) as stream:
+                points = json.load(stream)
+            self._snapshot = Snapshot(
+                version, manifest["distance"], points["ids"], vectors, points["payloads"]
+            )
+            logger.info(f"Loaded snapshot {version} with {len(points['ids'])} points")
+            return True
+
+    def search_batch(
+        self, vectors: List[List[float]], limit: int
+    ) -> List[List[models.ScoredPoint]]:
+        """Find the ``limit`` points closest to each vector."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise RuntimeError("The local index is not loaded")
+        queries = np.asarray(vectors, dtype=np.float32)
+        if snapshot.distance == "Cosine":
+            queries = _normalize(queries)
+        scores = queries @ snapshot.vectors.T
+        k = min(limit, scores.shape[1])
+        if k == 0:
+            return [[] for _ in vectors]
+
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top], kind="stable")]
+            results.append(
+                [
+                    models.ScoredPoint(
+                        id=snapshot.ids[i],
+                        version=0,
+                        score=float(row[i]),
+                        payload=snapshot.payloads[i],
+                    )
+                    for i in top
+                ]
+            )
+        return results
+
+    def search(self, vector: List[float], limit: int) -> List[models.ScoredPoint]:
+        return self.search_batch([vector], limit)[0]
+
+    def vectors_sample(self, size: int, rng: np.random.Generator) -> np.ndarray:
+        """Copy of ``size`` distinct random stored vectors, e.g. to build benchmark queries."""
+        vectors = self._snapshot.vectors
+        picked = rng.choice(len(vectors), size=min(size, len(vectors)), replace=False)
+        return np.array(vectors[picked])
+
+
+def compare_latency(
+    client, collection_name: str, index: LocalIndex, vectors: List[List[float]], limit: int = 2
+) -> Dict[str, Dict[str, float]]:
+    """Time the same searches on the Qdrant collection and on the local index.
+
+    Returns the median and p95 latency in milliseconds of each, and the
+    fraction of searches where both returned the same point ids.
+    """
+    timings = {"remote": [], "local": []}
+    same = 0
+    for vector in vectors:
+        start = time.perf_counter()
+        remote = client.search(
+            collection_name=collection_name, query_vector=vector, limit=limit, with_payload=True
+        )
+        timings["remote"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        local = index.search(vector, limit)
+        timings["local"].append(time.perf_counter() - start)
+        same += [point.id for point in remote] == [point.id for point in local]
+
+    report = {
+        name: {
+            "median_ms": statistics.median(values) * 1000,
+            "p95_ms": float(np.percentile(values, 95)) * 1000,
+        }
+        for name, values in timings.items()
+    }
+    report["agreement"] = {"same_ids": same / len(vectors) if vectors else 1.0}
+    return report
@@ -1,34 +1,72 @@
+import asyncio
 import boto3
+import hmac
+import json
 import logging
 import os
 import time
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
-from langchain.chains import RetrievalQA
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from functools import lru_cache
 from langchain.prompts import PromptTemplate
 from langchain_community.embeddings.bedrock import BedrockEmbeddings
 from langchain_community.llms.bedrock import Bedrock
-from langchain_community.vectorstores.qdrant import Qdrant
+from langchain_core.documents import Document
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models
+from typing import List
+
+from .admission import AdmissionController, Overloaded, set_deadline
+from .cache import AnswerCache, EmbeddingCache, RedisEmbeddingBackend
+from .context import ContextAssembler
+from .local_index import LocalIndex
+from .metrics import ServerTimingMiddleware, current_timings, timed
+from .pipeline import QAPipeline
 
 COLLECTION_NAME = "cnu"
 BEDROCK_MODEL_NAME = "anthropic.claude-v2"
 BEDROCK_EMBEDDINGS_MODEL_NAME = "amazon.titan-embed-text-v1"
 AWS_DEFAULT_REGION = "us-east-1"
+BEDROCK_MAX_POOL_CONNECTIONS = 50
+QDRANT_TIMEOUT = 10
+SECRET_TTL_SECONDS = 300
+SECRET_MAX_STALE_SECONDS = 3600
+# Searches already running on replaced Qdrant clients get this long to finish.
+QDRANT_CLIENT_CLOSE_DELAY_SECONDS = 30
+EMBEDDING_CACHE_SIZE = 1024
+EMBEDDING_CACHE_TTL_SECONDS = 24 * 60 * 60
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_TTL_SECONDS = 60 * 60
+ANSWER_CACHE_SIMILARITY = 0.95
+BATCH_SIZE = 32
+BATCH_CONCURRENCY = 8
+LLM_MAX_CONCURRENCY = 16
+LLM_MAX_QUEUE = 64
+EMBEDDING_MAX_CONCURRENCY = 32
+EMBEDDING_MAX_QUEUE = 128
+REQUEST_DEADLINE_SECONDS = 30
+LOCAL_INDEX_CHECK_SECONDS = 30
+RETRIEVER_K = 2
+CONTEXT_TOKEN_BUDGET = 1024
 
 # Logging setup
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-app = FastAPI()
-
 class Body(BaseModel):
     text: str
     temperature: float = 0.5
 
+class BatchBody(BaseModel):
+    questions: List[str]
+    temperature: float = 0.5
+
 # Load environment variables
 load_dotenv()
 
@@ -42,9 +80,22 @@ prompt_template = """
     Assistant:
 """
 
+inference_modifier = {
+    "max_tokens_to_sample": 100,
+    "temperature": 0.5,
+    "top_k": 250,
+    "top_p": 1,
+    "stop_sequences": ["\n\nHuman"],
+}
+
+@lru_cache(maxsize=1)
+def get_secrets_client():
+    """Get the Secrets Manager client, created once and reused."""
+    return session.client(service_name="secretsmanager", region_name=AWS_DEFAULT_REGION)
+
 def get_secret(secret_name):
     """ Get the secret from AWS Secrets Manager."""
-    client = session.client(service_name="secretsmanager", region_name=AWS_DEFAULT_REGION)
+    client = get_secrets_client()
     try:
         get_secret_value_response = client.get_secret_value(SecretId=secret_name)
     except ClientError as e:
@@ -54,11 +105,274 @@ def get_secret(secret_name):
         secret = str(secret)
     return secret
 
+class SecretCache:
+    """TTL cache for Secrets Manager values.
+
+    Fresh values are served from memory. Values older than ``ttl`` are still
+    served for up to ``max_stale`` seconds while a single background task
+    refreshes them. Concurrent misses for the same secret share one fetch.
+    """
+
+    def __init__(
+        self,
+        fetch=None,
+        ttl: float = SECRET_TTL_SECONDS,
+        max_stale: float = SECRET_MAX_STALE_SECONDS,
+    ):
+        self._fetch = fetch or get_secret
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries = {}
+        self._inflight = {}
+
+    async def get(self, secret_name: str) -> str:
+        """Return the cached secret, fetching or refreshing it as needed."""
+        entry = self._entries.get(secret_name)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                return value
+            if age < self.ttl + self.max_stale:
+                self._load(secret_name)
+                return value
+        return await asyncio.shield(self._load(secret_name))
+
+    def peek(self, secret_name: str):
+        """Return the cached secret, fresh or not, without fetching it."""
+        entry = self._entries.get(secret_name)
+        return entry[0] if entry is not None else None
+
+    def invalidate(self, secret_name=None) -> None:
+        """Drop one cached secret, or all of them."""
+        if secret_name is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(secret_name, None)
+
+    def _load(self, secret_name: str) -> asyncio.Future:
+        """Start a fetch for the secret unless one is already in flight."""
+        future = self._inflight.get(secret_name)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_and_store(secret_name))
+            self._inflight[secret_name] = future
+            future.add_done_callback(lambda f: self._on_done(secret_name, f))
+        return future
+
+    async def _fetch_and_store(self, secret_name: str) -> str:
+        value = await asyncio.to_thread(self._fetch, secret_name)
+        self._entries[secret_name] = (value, time.monotonic())
+        return value
+
+    def _on_done(self, secret_name: str, future: asyncio.Future) -> None:
+        self._inflight.pop(secret_name, None)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Error fetching secret {secret_name}: {future.exception()}")
+
+secret_cache = SecretCache()
+
+async def get_qdrant_credentials():
+    """Get the Qdrant URL and API key from the environment or Secrets Manager."""
+    qdrant_url = os.getenv("QDRANT_URL") or await secret_cache.get("prod/qdrant_url")
+    qdrant_api_key = os.getenv("QDRANT_API_KEY") or await secret_cache.get("prod/qdrant_api_key")
+    return qdrant_url, qdrant_api_key
+
+async def get_admin_api_key() -> str:
+    """Get the key of the admin endpoints from the environment or Secrets Manager."""
+    return os.getenv("ADMIN_API_KEY") or await secret_cache.get("prod/admin_api_key")
+
 def get_bedrock_embeddings(model_name: str, bedrock_runtime) -> BedrockEmbeddings:
     """Get the Bedrock embeddings Model"""
     embeddings = BedrockEmbeddings(client=bedrock_runtime, model_id=model_name)
     return embeddings
 
+def build_embedding_cache() -> EmbeddingCache:
+    """Create the query embedding cache, shared through Redis when configured."""
+    shared = None
+    redis_url = os.getenv("EMBEDDING_CACHE_REDIS_URL")
+    if redis_url:
+        shared = RedisEmbeddingBackend(redis_url, ttl=EMBEDDING_CACHE_TTL_SECONDS)
+    return EmbeddingCache(
+        model_id=BEDROCK_EMBEDDINGS_MODEL_NAME,
+        max_size=EMBEDDING_CACHE_SIZE,
+        ttl=EMBEDDING_CACHE_TTL_SECONDS,
+        shared=shared,
+    )
+
+async def build_pipeline() -> QAPipeline:
+    """Create the pooled clients and the QA pipeline shared by all requests."""
+    with timed("secret_fetch"):
+        qdrant_url, qdrant_api_key = await get_qdrant_credentials()
+
+    with timed("client_setup"):
+        return create_pipeline(qdrant_url, qdrant_api_key)
+
+def build_local_index():
+    """Load the snapshot exported with `qdrant_cli.py snapshot-export`, when configured."""
+    path = os.getenv("LOCAL_INDEX_PATH")
+    if not path:
+        return None
+    index = LocalIndex(path)
+    index.reload()
+    return index
+
+def build_search_params():
+    """Search-time settings of the retriever, when configured.
+
+    QDRANT_HNSW_EF is the size of the HNSW search beam, pick it with
+    `qdrant_cli.py tune`. QDRANT_RESCORE and QDRANT_OVERSAMPLING apply to a
+    quantized collection.
+    """
+    hnsw_ef = os.getenv("QDRANT_HNSW_EF")
+    rescore = os.getenv("QDRANT_RESCORE")
+    oversampling = os.getenv("QDRANT_OVERSAMPLING")
+    if hnsw_ef is None and rescore is None and oversampling is None:
+        return None
+    quantization = None
+    if rescore is not None or oversampling is not None:
+        quantization = models.QuantizationSearchParams(
+            rescore=rescore.lower() == "true" if rescore is not None else None,
+            oversampling=float(oversampling) if oversampling is not None else None,
+        )
+    return models.SearchParams(
+        hnsw_ef=int(hnsw_ef) if hnsw_ef is not None else None, quantization=quantization
+    )
+
+def create_qdrant_clients(qdrant_url: str, qdrant_api_key: str):
+    """Create the sync and async Qdrant clients for the given cluster."""
+    async_client = AsyncQdrantClient(
+        url=qdrant_url,
+        api_key=qdrant_api_key,
+        port=6333,
+        grpc_port=6334,
+        timeout=QDRANT_TIMEOUT,
+    )
+
+    client = QdrantClient(
+        url=qdrant_url,
+        api_key=qdrant_api_key,
+        port=6333,
+        grpc_port=6334,
+        timeout=QDRANT_TIMEOUT,
+    )
+
+    logger.info("Qdrant client created successfully")
+    return client, async_client
+
+async def watch_qdrant_credentials(pipeline: QAPipeline, interval: float = SECRET_TTL_SECONDS):
+    """Reconnect the pipeline to Qdrant when the URL or API key secret is rotated.
+
+    The secret cache serves a stale value while it refreshes it in the
+    background, so a rotation is picked up within two intervals.
+    """
+    credentials = (
+        os.getenv("QDRANT_URL") or secret_cache.peek("prod/qdrant_url"),
+        os.getenv("QDRANT_API_KEY") or secret_cache.peek("prod/qdrant_api_key"),
+    )
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            latest = await get_qdrant_credentials()
+            if latest != credentials:
+                logger.info("Qdrant credentials changed, reconnecting")
+                await pipeline.replace_qdrant_clients(
+                    *create_qdrant_clients(*latest), close_delay=QDRANT_CLIENT_CLOSE_DELAY_SECONDS
+                )
+                credentials = latest
+        except Exception as e:
+            logger.error(f"Error refreshing the Qdrant credentials: {e}")
+
+def create_pipeline(qdrant_url: str, qdrant_api_key: str) -> QAPipeline:
+    """Create the pooled clients and the pipeline for the given Qdrant cluster."""
+    bedrock_runtime = session.client(
+        "bedrock-runtime",
+        region_name=AWS_DEFAULT_REGION,
+        # Throttling, connection and server errors are retried by the pipeline with
+        # backoff and jitter within the request deadline, so botocore does not retry.
+        config=Config(
+            max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+            retries={"mode": "standard", "max_attempts": 1},
+        ),
+    )
+
+    client, async_client = create_qdrant_clients(qdrant_url, qdrant_api_key)
+
+    llm = Bedrock(
+        model_id=BEDROCK_MODEL_NAME, client=bedrock_runtime, model_kwargs=inference_modifier
+    )
+
+    return QAPipeline(
+        client=client,
+        async_client=async_client,
+        embeddings=get_bedrock_embeddings(BEDROCK_EMBEDDINGS_MODEL_NAME, bedrock_runtime),
+        llm=llm,
+        prompt=PromptTemplate(template=prompt_template, input_variables=["context", "question"]),
+        collection_name=COLLECTION_NAME,
+        inference_modifier=inference_modifier,
+        k=int(os.getenv("RETRIEVER_K", RETRIEVER_K)),
+        bedrock_runtime=bedrock_runtime,
+        max_workers=BEDROCK_MAX_POOL_CONNECTIONS,
+        embedding_cache=build_embedding_cache(),
+        answer_cache=AnswerCache(
+            threshold=ANSWER_CACHE_SIMILARITY,
+            max_size=ANSWER_CACHE_SIZE,
+            ttl=ANSWER_CACHE_TTL_SECONDS,
+        ),
+        llm_limiter=AdmissionController("llm", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE),
+        embedding_limiter=AdmissionController(
+            "embedding", EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_QUEUE
+        ),
+        local_index=build_local_index(),
+        search_params=build_search_params(),
+        context_assembler=ContextAssembler(
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", CONTEXT_TOKEN_BUDGET))
+        ),
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the pipeline when the worker starts and close it on shutdown."""
+    app.state.pipeline = await build_pipeline()
+    watcher = None
+    if app.state.pipeline.local_index is not None:
+        watcher = asyncio.create_task(
+            app.state.pipeline.watch_local_index(LOCAL_INDEX_CHECK_SECONDS)
+        )
+    elif app.state.pipeline.answer_cache is not None:
+        watcher = asyncio.create_task(app.state.pipeline.watch_collection())
+    credentials_watcher = None
+    # Credentials from the environment never change, the secrets can be rotated.
+    if not (os.getenv("QDRANT_URL") and os.getenv("QDRANT_API_KEY")):
+        credentials_watcher = asyncio.create_task(watch_qdrant_credentials(app.state.pipeline))
+    try:
+        yield
+    finally:
+        for task in (watcher, credentials_watcher):
+            if task is not None:
+                task.cancel()
+        await app.state.pipeline.aclose()
+        app.state.pipeline = None
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ServerTimingMiddleware)
+
+def get_pipeline(request: Request) -> QAPipeline:
+    """Return the pipeline created by the lifespan handler."""
+    pipeline = getattr(request.app.state, "pipeline", None)
+    if pipeline is None:
+        raise HTTPException(status_code=503, detail="Pipeline is not initialized")
+    return pipeline
+
+async def require_admin_key(x_api_key: str = Header(default="")):
+    """Reject the request unless the X-API-Key header holds the admin key."""
+    try:
+        admin_api_key = await get_admin_api_key()
+    except Exception as e:
+        logger.error(f"Error getting the admin API key: {e}")
+        raise HTTPException(status_code=503, detail="Admin API key is not available")
+    if not admin_api_key or not hmac.compare_digest(x_api_key.encode(), admin_api_key.encode()):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Root endpoint."""
@@ -71,94 +385,149 @@ async def root():
     )
 
 @app.get("/collectioninfo")
-async def collection_info():
+async def collection_info(pipeline: QAPipeline = Depends(get_pipeline)):
     """Get the collection info from Qdrant."""
     try:
-        qdrant_url = os.getenv("QDRANT_URL") or get_secret("prod/qdrant_url")
-        qdrant_api_key = os.getenv("QDRANT_API_KEY") or get_secret("prod/qdrant_api_key")
-        
-        async_client = AsyncQdrantClient(
-            url=qdrant_url, 
-            api_key=qdrant_api_key,
-            port=6333, 
-            grpc_port=6334,
-            timeout=10
-        )
-        
-        info = await async_client.get_collection(collection_name=COLLECTION_NAME)
-        
+        info = await pipeline.collection_info()
+
         logger.info(f"Collection info: {info}")
         return {"collection_info": info}
     except Exception as e:
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting collection info:{e}")
 
+@app.get("/cacheinfo")
+async def cache_info(pipeline: QAPipeline = Depends(get_pipeline)):
+    """Get the hit/miss counters of the embedding and answer caches."""
+    return {
+        "embedding_cache": pipeline.embedding_cache and pipeline.embedding_cache.stats(),
+        "answer_cache": pipeline.answer_cache and pipeline.answer_cache.stats(),
+        "coalesced_requests": pipeline.single_flight.coalesced,
+    }
+
+@app.post("/cache/invalidate", dependencies=[Depends(require_admin_key)])
+async def invalidate_cache(pipeline: QAPipeline = Depends(get_pipeline)):
+    """Drop the cached answers, e.g. after the collection is re-indexed."""
+    if pipeline.answer_cache is not None:
+        pipeline.answer_cache.invalidate()
+    return {"invalidated": True}
+
+@app.get("/metrics")
+async def metrics():
+    """Expose the Prometheus metrics."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.post("/ask")
-async def question(body: Body):
+async def question(body: Body, pipeline: QAPipeline = Depends(get_pipeline)):
     """Ask a question and get an answer from the model."""
     try:
         start_time = time.time()
-        
-        qdrant_url = os.getenv("QDRANT_URL") or get_secret("prod/qdrant_url")
-        qdrant_api_key = os.getenv("QDRANT_API_KEY") or get_secret("prod/qdrant_api_key")
+        set_deadline(REQUEST_DEADLINE_SECONDS)
 
-        bedrock_runtime = boto3.client("bedrock-runtime", region_name=AWS_DEFAULT_REGION)
+        answer = await pipeline.ask(body.text, temperature=body.temperature)
+        elapsed_time = time.time() - start_time
 
-        async_client = AsyncQdrantClient(
-            url=qdrant_url, 
-            api_key=qdrant_api_key,
-            port=6333, 
-            grpc_port=6334
-        )
+        logger.info(f"{elapsed_time:.2f} seconds to complete.")
+        timings = current_timings()
+        with timed("serialization"):
+            return JSONResponse(
+                {
+                    "answer": answer,
+                    "time": f"{elapsed_time:.2f} seconds.",
+                    "prompt_tokens": timings and timings.prompt_tokens,
+                }
+            )
+    except Overloaded as e:
+        logger.warning(f"Request shed: {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        client = QdrantClient(
-            url=qdrant_url, 
-            api_key=qdrant_api_key,
-            port=6333, 
-            grpc_port=6334
-        )
-        
-        logger.info("Qdrant client created successfully")
-
-        embeddings = get_bedrock_embeddings(BEDROCK_EMBEDDINGS_MODEL_NAME, bedrock_runtime)
-
-        qdrant = Qdrant(
-            client=client,
-            async_client=async_client,
-            embeddings=embeddings,
-            collection_name=COLLECTION_NAME,
-        ).as_retriever(search_kwargs={"k": 2})
-
-        prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-
-        inference_modifier = {
-            "max_tokens_to_sample": 100,
-            "temperature": body.temperature,
-            "top_k": 250,
-            "top_p": 1,
-            "stop_sequences": ["\n\nHuman"],
-        }
-
-        llm = Bedrock(
-            model_id=BEDROCK_MODEL_NAME, client=bedrock_runtime, model_kwargs=inference_modifier
-        )
-    
-        qa = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=qdrant,
-            return_source_documents=False,
-            chain_type_kwargs={"prompt": prompt, "verbose": False},
-        )
+def format_sse(event: str, data) -> str:
+    """Format a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-        logger.info("Invoking the model")
+def get_sources(docs: List[Document]) -> List[dict]:
+    """Get the source and page of the retrieved chunks."""
+    return [
+        {"source": doc.metadata.get("source"), "page": doc.metadata.get("page")}
+        for doc in docs
+    ]
 
-        result = await qa.ainvoke(input={"query": body.text})
-        answer = result["result"]
-        elapsed_time = time.time() - start_time
+async def stream_answer(body: Body, pipeline: QAPipeline):
+    """Yield the sources, the answer tokens and the timings as Server-Sent Events."""
+    start_time = time.perf_counter()
+    first_token_time = None
+    try:
+        embedding, docs = await pipeline.retrieve(body.text)
+        yield format_sse("sources", get_sources(docs))
 
-        logger.info(f"{elapsed_time:.2f} seconds to complete.")
-        return {"answer": answer,"time": f"{elapsed_time:.2f} seconds."}
+        answer = pipeline.cached_answer(embedding, docs, body.temperature)
+        cached = answer is not None
+        if cached:
+            first_token_time = time.perf_counter() - start_time
+            yield format_sse("token", {"text": answer})
+        else:
+            cache = pipeline.answer_cache
+            generation = cache.generation if cache is not None else None
+            tokens = []
+            prompt = pipeline.build_prompt(body.text, docs)
+            async for token in pipeline.stream(prompt, temperature=body.temperature):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start_time
+                tokens.append(token)
+                yield format_sse("token", {"text": token})
+            pipeline.cache_answer(embedding, docs, body.temperature, "".join(tokens), generation)
+
+        elapsed_time = time.perf_counter() - start_time
+        logger.info(
+            f"{elapsed_time:.2f} seconds to complete, "
+            f"{(first_token_time or elapsed_time):.2f} seconds to first token."
+        )
+        # The headers are already sent, the prompt tokens go in the last event.
+        timings = current_timings()
+        yield format_sse(
+            "done",
+            {
+                "time_to_first_token": round(first_token_time or elapsed_time, 4),
+                "time": round(elapsed_time, 4),
+                "cached": cached,
+                "prompt_tokens": timings and timings.prompt_tokens,
+            },
+        )
     except Exception as e:
         logger.error(f"Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        yield format_sse("error", {"detail": str(e)})
+
+@app.post("/ask/stream")
+async def question_stream(body: Body, pipeline: QAPipeline = Depends(get_pipeline)):
+    """Ask a question and stream the answer as Server-Sent Events."""
+    set_deadline(REQUEST_DEADLINE_SECONDS)
+    if pipeline.llm_limiter is not None:
+        try:
+            pipeline.llm_limiter.check()
+        except Overloaded as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+    return StreamingResponse(
+        stream_answer(body, pipeline),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/ask/batch")
+async def question_batch(body: BatchBody, pipeline: QAPipeline = Depends(get_pipeline)):
+    """Ask many questions and stream the answers as NDJSON in completion order."""
+    async def results():
+        start_time = time.perf_counter()
+        async for result in pipeline.ask_batch(
+            body.questions,
+            temperature=body.temperature,
+            batch_size=BATCH_SIZE,
+            concurrency=BATCH_CONCURRENCY,
+        ):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        elapsed_time = time.perf_counter() - start_time
+        logger.info(f"{len(body.questions)} questions answered in {elapsed_time:.2f} seconds.")
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
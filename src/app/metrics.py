@@ -0,0 +1,147 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Histogram
+
+STAGES = (
+    "secret_fetch",
+    "client_setup",
+    "query_embedding",
+    "vector_search",
+    "prompt_assembly",
+    "llm_generation",
+    "serialization",
+)
+
+STAGE_SECONDS = Histogram(
+    "qa_stage_duration_seconds",
+    "Time spent in each stage of the question answering pipeline.",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+for stage in STAGES:
+    STAGE_SECONDS.labels(stage)
+
+RETRIEVED_CHUNKS = Histogram(
+    "qa_retrieved_chunks",
+    "Number of chunks retrieved for a question.",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64),
+)
+PROMPT_CHARS = Histogram(
+    "qa_prompt_chars",
+    "Size of the prompt sent to the LLM in characters.",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+PROMPT_TOKENS = Histogram(
+    "qa_prompt_tokens",
+    "Estimated size of the prompt sent to the LLM in tokens.",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+
+PROMPT_TOKENS_SAVED = Histogram(
+    "qa_prompt_tokens_saved",
+    "Estimated prompt tokens removed from the retrieved context by context assembly.",
+    buckets=(0, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+
+SHED_REQUESTS = Counter(
+    "qa_shed_requests_total",
+    "Requests rejected by admission control instead of being queued.",
+    ["backend", "status"],
+)
+
+_current_timings: ContextVar[Optional["Timings"]] = ContextVar("timings", default=None)
+
+
+class Timings:
+    """Stage durations of one request, in the order they were recorded."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.prompt_tokens: Optional[Dict[str, int]] = None
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """Format the durations as a Server-Timing header value."""
+        return ", ".join(
+            f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()
+        )
+
+
+def current_timings() -> Optional[Timings]:
+    """Timings of the request being served, if any."""
+    return _current_timings.get()
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record a stage duration in the histogram and in the current request's timings."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.record(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as a pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Claude, about four characters per token."""
+    return (len(text) + 3) // 4
+
+
+def record_prompt(chunk_count: int, prompt: str) -> None:
+    RETRIEVED_CHUNKS.observe(chunk_count)
+    PROMPT_CHARS.observe(len(prompt))
+    PROMPT_TOKENS.observe(estimate_tokens(prompt))
+
+
+def record_context(retrieved_tokens: int, tokens: int) -> None:
+    """Record the context tokens sent and saved, also in the current request's timings."""
+    saved = retrieved_tokens - tokens
+    PROMPT_TOKENS_SAVED.observe(saved)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.prompt_tokens = {"retrieved": retrieved_tokens, "sent": tokens, "saved": saved}
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that collects the stage timings of each HTTP request
+    and returns them in the ``Server-Timing`` response header, and the context
+    tokens of the prompt in the ``X-Prompt-Tokens`` header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = _current_timings.set(timings)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and timings.stages:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode()))
+                if timings.prompt_tokens is not None:
+                    value = ", ".join(f"{k}={v}" for k, v in timings.prompt_tokens.items())
+                    headers.append((b"x-prompt-tokens", value.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
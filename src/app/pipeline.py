@@ -0,0 +1,432 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import BaseLLM
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models
+
+from .admission import AdmissionController, retry_bedrock, retry_delay
+from .cache import AnswerCache, EmbeddingCache, normalize_text
+from .context import ContextAssembler
+from .local_index import LocalIndex
+from .metrics import observe, record_context, record_prompt, timed
+from .singleflight import SingleFlight
+
+logger = logging.getLogger()
+
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_COLLECTION_CHECK_SECONDS = 60
+DEFAULT_LOCAL_INDEX_CHECK_SECONDS = 30
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_BATCH_CONCURRENCY = 8
+
+_STREAM_END = object()
+
+
+def format_docs(docs: List[Document]) -> str:
+    """Join the retrieved documents the same way the "stuff" chain does."""
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def point_to_document(point) -> Document:
+    """Convert a Qdrant point written by langchain's Qdrant vector store to a Document."""
+    payload = point.payload or {}
+    metadata = dict(payload.get("metadata") or {})
+    metadata["_id"] = str(point.id)
+    metadata["_score"] = point.score
+    return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+
+
+def chunk_ids(docs: List[Document]) -> List[str]:
+    """Get the Qdrant point ids of the retrieved chunks."""
+    return [doc.metadata.get("_id") for doc in docs]
+
+
+class QAPipeline:
+    """Retrieval QA pipeline built once per worker and shared by every request.
+
+    The blocking Bedrock calls (query embedding and generation) run on a
+    dedicated, bounded thread pool so they never stall the event loop, and
+    the vector search goes through the async Qdrant client, or runs in process
+    on ``local_index`` when one is given.
+    """
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        async_client: Optional[AsyncQdrantClient],
+        embeddings: Embeddings,
+        llm: BaseLLM,
+        prompt: PromptTemplate,
+        collection_name: str,
+        inference_modifier: Dict[str, Any],
+        k: int = 2,
+        bedrock_runtime: Any = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        llm_limiter: Optional[AdmissionController] = None,
+        embedding_limiter: Optional[AdmissionController] = None,
+        local_index: Optional[LocalIndex] = None,
+        search_params: Optional[models.SearchParams] = None,
+        context_assembler: Optional[ContextAssembler] = None,
+    ):
+        self.client = client
+        self.async_client = async_client
+        self.embeddings = embeddings
+        self.llm = llm
+        self.prompt = prompt
+        self.collection_name = collection_name
+        self.inference_modifier = inference_modifier
+        self.bedrock_runtime = bedrock_runtime
+        self.k = k
+        self.embedding_cache = embedding_cache
+        self.answer_cache = answer_cache
+        self.single_flight = SingleFlight()
+        self.llm_limiter = llm_limiter
+        self.embedding_limiter = embedding_limiter
+        self.local_index = local_index
+        self.search_params = search_params
+        self.context_assembler = context_assembler
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bedrock")
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Run a blocking SDK call on the pipeline's thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def call_bedrock(self, limiter: Optional[AdmissionController], func, *args, **kwargs):
+        """Run a blocking Bedrock call behind its admission limit, retrying transient errors."""
+        async def call():
+            return await self.run_blocking(func, *args, **kwargs)
+
+        if limiter is None:
+            return await retry_bedrock(call)
+        async with limiter.slot():
+            return await retry_bedrock(call)
+
+    async def _embed_query(self, text: str) -> List[float]:
+        return await self.call_bedrock(self.embedding_limiter, self.embeddings.embed_query, text)
+
+    async def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.call_bedrock(
+            self.embedding_limiter, self.embeddings.embed_documents, texts
+        )
+
+    async def embed_query(self, text: str) -> List[float]:
+        """Embed the question, skipping the Bedrock round trip on a cache hit."""
+        with timed("query_embedding"):
+            if self.embedding_cache is None:
+                return await self._embed_query(text)
+            return await self.embedding_cache.get_or_embed(text, self._embed_query)
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of questions, using the cache for the ones already seen."""
+        with timed("query_embedding"):
+            if self.embedding_cache is None:
+                return await self._embed_documents(texts)
+            return await self.embedding_cache.get_or_embed_many(texts, self._embed_documents)
+
+    async def search_batch(self, embeddings: List[List[float]]) -> List[List[Document]]:
+        """Run one Qdrant batch search for many question embeddings."""
+        requests = [
+            models.SearchRequest(
+                vector=embedding, limit=self.k, with_payload=True, params=self.search_params
+            )
+            for embedding in embeddings
+        ]
+        with timed("vector_search"):
+            if self.local_index is not None:
+                results = self.local_index.search_batch(embeddings, self.k)
+            elif self.async_client is not None:
+                results = await self.async_client.search_batch(
+                    collection_name=self.collection_name, requests=requests
+                )
+            else:
+                results = await self.run_blocking(
+                    self.client.search_batch,
+                    collection_name=self.collection_name,
+                    requests=requests,
+                )
+        return [[point_to_document(point) for point in points] for points in results]
+
+    async def search(self, embedding: List[float]) -> List[Document]:
+        """Find the chunks closest to the question embedding."""
+        search_kwargs = dict(
+            collection_name=self.collection_name,
+            query_vector=embedding,
+            limit=self.k,
+            with_payload=True,
+            search_params=self.search_params,
+        )
+        with timed("vector_search"):
+            if self.local_index is not None:
+                # A few milliseconds of NumPy for a small collection, cheaper inline
+                # than a hop to the thread pool.
+                points = self.local_index.search(embedding, self.k)
+            elif self.async_client is not None:
+                points = await self.async_client.search(**search_kwargs)
+            else:
+                points = await self.run_blocking(self.client.search, **search_kwargs)
+        return [point_to_document(point) for point in points]
+
+    def build_prompt(self, text: str, docs: List[Document]) -> str:
+        """Stuff the retrieved chunks and the question into the prompt.
+
+        With a context assembler the chunks are merged, deduplicated and fit
+        to its token budget first.
+        """
+        with timed("prompt_assembly"):
+            if self.context_assembler is not None:
+                context = self.context_assembler.assemble(docs)
+                record_context(context.retrieved_tokens, context.tokens)
+                logger.info(
+                    f"Context of {len(docs)} chunks: {context.tokens} tokens sent, "
+                    f"{context.saved_tokens} saved"
+                )
+                context_text = context.text
+            else:
+                context_text = format_docs(docs)
+            prompt = self.prompt.format(context=context_text, question=text)
+        record_prompt(len(docs), prompt)
+        return prompt
+
+    def model_overrides(self, temperature: Optional[float] = None) -> Dict[str, Any]:
+        """Per-request settings applied on top of the default inference modifier."""
+        overrides = {}
+        if temperature is not None:
+            overrides["temperature"] = temperature
+        return overrides
+
+    async def generate(self, prompt: str, temperature: Optional[float] = None) -> str:
+        """Invoke the LLM with the prompt."""
+        # Per-request settings override the defaults for this call only,
+        # the shared LLM object is never mutated.
+        logger.info("Invoking the model")
+        with timed("llm_generation"):
+            return await self.call_bedrock(
+                self.llm_limiter, self.llm.invoke, prompt, **self.model_overrides(temperature)
+            )
+
+    async def stream(self, prompt: str, temperature: Optional[float] = None) -> AsyncIterator[str]:
+        """Invoke the LLM with the response-stream API and yield tokens as they arrive.
+
+        Throttling and transient errors are retried until the first token is
+        yielded, after that the error is raised to the caller.
+        """
+        loop = asyncio.get_running_loop()
+        overrides = self.model_overrides(temperature)
+
+        def produce(queue: asyncio.Queue, stop: threading.Event):
+            try:
+                for token in self.llm.stream(prompt, **overrides):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, token)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+        slot = self.llm_limiter.slot() if self.llm_limiter is not None else nullcontext()
+        async with slot:
+            logger.info("Invoking the model with streaming")
+            start = time.perf_counter()
+            yielded = False
+            attempt = 0
+            try:
+                while True:
+                    queue = asyncio.Queue()
+                    stop = threading.Event()
+                    loop.run_in_executor(self.executor, produce, queue, stop)
+                    try:
+                        item = await queue.get()
+                        while item is not _STREAM_END and not isinstance(item, Exception):
+                            yielded = True
+                            yield item
+                            item = await queue.get()
+                    finally:
+                        # Stops reading the Bedrock stream when the client goes away.
+                        stop.set()
+                    if item is _STREAM_END:
+                        return
+                    delay = None if yielded else retry_delay(item, attempt)
+                    if delay is None:
+                        raise item
+                    attempt += 1
+                    await asyncio.sleep(delay)
+            finally:
+                observe("llm_generation", time.perf_counter() - start)
+
+    async def retrieve(self, text: str) -> Tuple[List[float], List[Document]]:
+        """Embed the question and retrieve its context."""
+        embedding = await self.embed_query(text)
+        return embedding, await self.search(embedding)
+
+    def cached_answer(
+        self, embedding: List[float], docs: List[Document], temperature: Optional[float]
+    ) -> Optional[str]:
+        """Return the answer to a similar question with the same context, if cached."""
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.lookup(embedding, chunk_ids(docs), temperature)
+
+    def cache_answer(
+        self,
+        embedding: List[float],
+        docs: List[Document],
+        temperature: Optional[float],
+        answer: str,
+        generation: Optional[int],
+    ) -> None:
+        if self.answer_cache is not None:
+            self.answer_cache.store(embedding, chunk_ids(docs), temperature, answer, generation)
+
+    async def ask(self, text: str, temperature: Optional[float] = None) -> str:
+        """Retrieve the context for a question and generate the answer.
+
+        Concurrent calls with the same normalized question and settings share
+        a single execution.
+        """
+        async def run():
+            embedding, docs = await self.retrieve(text)
+            return await self.answer_retrieved(text, embedding, docs, temperature)
+
+        return await self.single_flight.do((normalize_text(text), temperature), run)
+
+    async def answer_retrieved(
+        self,
+        text: str,
+        embedding: List[float],
+        docs: List[Document],
+        temperature: Optional[float] = None,
+    ) -> str:
+        """Generate the answer for an already retrieved context."""
+        answer = self.cached_answer(embedding, docs, temperature)
+        if answer is not None:
+            return answer
+
+        generation = self.answer_cache.generation if self.answer_cache is not None else None
+        answer = await self.generate(self.build_prompt(text, docs), temperature=temperature)
+        self.cache_answer(embedding, docs, temperature, answer, generation)
+        return answer
+
+    async def ask_batch(
+        self,
+        texts: List[str],
+        temperature: Optional[float] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Answer many questions, yielding each result as soon as it completes.
+
+        Questions are embedded and searched one batch at a time. At most
+        ``concurrency`` batches are in flight, so a large job never floods the
+        embedding admission queue, and at most ``concurrency`` LLM calls run
+        at once. Every result carries the index of its question in ``texts``.
+        """
+        results = asyncio.Queue()
+        semaphore = asyncio.Semaphore(concurrency)
+        batches = asyncio.Semaphore(concurrency)
+
+        async def answer(index, text, embedding, docs):
+            async with semaphore:
+                try:
+                    result = {
+                        "index": index,
+                        "answer": await self.answer_retrieved(text, embedding, docs, temperature),
+                    }
+                except Exception as e:
+                    result = {"index": index, "error": str(e)}
+            await results.put(result)
+
+        async def process_batch(start):
+            batch = texts[start:start + batch_size]
+            async with batches:
+                try:
+                    embeddings = await self.embed_documents(batch)
+                    retrieved = await self.search_batch(embeddings)
+                except Exception as e:
+                    for index in range(start, start + len(batch)):
+                        await results.put({"index": index, "error": str(e)})
+                    return
+                await asyncio.gather(*[
+                    answer(start + offset, *question)
+                    for offset, question in enumerate(zip(batch, embeddings, retrieved))
+                ])
+
+        tasks = [
+            asyncio.create_task(process_batch(start)) for start in range(0, len(texts), batch_size)
+        ]
+        try:
+            for _ in range(len(texts)):
+                yield await results.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def watch_collection(self, interval: float = DEFAULT_COLLECTION_CHECK_SECONDS) -> None:
+        """Invalidate the answer cache whenever the collection is re-indexed."""
+        while True:
+            try:
+                info = await self.collection_info()
+                self.answer_cache.check_collection(info.points_count)
+            except Exception as e:
+                logger.error(f"Error checking the collection: {e}")
+            await asyncio.sleep(interval)
+
+    async def watch_local_index(self, interval: float = DEFAULT_LOCAL_INDEX_CHECK_SECONDS) -> None:
+        """Load new snapshots of the local index, invalidating the answer cache."""
+        if self.answer_cache is not None:
+            self.answer_cache.check_collection(self.local_index.version)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.run_blocking(self.local_index.reload) and self.answer_cache:
+                    self.answer_cache.check_collection(self.local_index.version)
+            except Exception as e:
+                logger.error(f"Error reloading the local index: {e}")
+
+    async def collection_info(self):
+        """Get the collection info from Qdrant."""
+        if self.async_client is not None:
+            return await self.async_client.get_collection(collection_name=self.collection_name)
+        return await self.run_blocking(self.client.get_collection, collection_name=self.collection_name)
+
+    async def replace_qdrant_clients(
+        self,
+        client: QdrantClient,
+        async_client: Optional[AsyncQdrantClient],
+        close_delay: float = 0.0,
+    ) -> None:
+        """Search with new Qdrant clients, e.g. after the API key is rotated.
+
+        The old clients are closed after ``close_delay`` seconds, so the
+        searches already running on them can finish.
+        """
+        old_client, old_async_client = self.client, self.async_client
+        self.client, self.async_client = client, async_client
+        await asyncio.sleep(close_delay)
+        if old_async_client is not None:
+            await old_async_client.close()
+        old_client.close()
+
+    async def aclose(self) -> None:
+        """Close the pooled Qdrant and Bedrock connections."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.embedding_cache is not None:
+            await self.embedding_cache.aclose()
+        if self.async_client is not None:
+            await self.async_client.close()
+        self.client.close()
+        if self.bedrock_runtime is not None:
+            self.bedrock_runtime.close()
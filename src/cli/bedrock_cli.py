@@ -1,13 +1,10 @@
-import boto3
 import click
 import json
-from langchain.llms.bedrock import Bedrock
-from langchain_community.vectorstores import Qdrant
-from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
 import os
 from dotenv import load_dotenv
 from utils import (
+	get_bedrock_client,
+	get_bedrock_runtime,
 	get_embeddings,
 	get_client,
 	get_prompt,
@@ -24,12 +21,6 @@ QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
 AWS_REGION = os.environ.get("AWS_DEFAULT_REGION")
 COLLECTION_NAME = os.environ.get("COLLECTION_NAME")
 
-boto_session = boto3.Session(region_name=AWS_REGION)
-
-# bedrock
-bedrock_models = boto3.client("bedrock", region_name=AWS_REGION)
-bedrock_runtime = boto3.client("bedrock-runtime", region_name=AWS_REGION)
-
 
 @click.group()
 def cli():
@@ -44,6 +35,7 @@ def cli():
 	type=click.Choice(["TEXT", "EMBEDDING"], case_sensitive=True),
 )
 def list_foundation_models(by_provider=None, by_output_modality=None):
+	bedrock_models = get_bedrock_client()
 	if by_provider is not None and by_output_modality is None:
 		models = bedrock_models.list_foundation_models(byProvider=by_provider)
 		click.echo(click.style(f"Models: {json.dumps(models, indent=4)}", fg="green"))
@@ -98,11 +90,16 @@ def question(
 	model_name,
 	embedding_model,
 ):
+	from langchain.chains import RetrievalQA
+	from langchain.llms.bedrock import Bedrock
+	from langchain.prompts import PromptTemplate
+	from langchain_community.vectorstores import Qdrant
+
 	client = get_client(url, api_key)
 	retriever = Qdrant(
 		client=client,
 		embeddings=get_embeddings(
-			embedding=Embedding(embeddings=Embeddings.AWS, embedding_model=embedding_model)
+			embedding=Embedding(embeddings=Embeddings.BEDROCK, model_name=embedding_model)
 		),
 		collection_name=collection_name,
 	).as_retriever(search_type="similarity", search_kwargs={"k": 2})
@@ -120,7 +117,9 @@ def question(
 		"stop_sequences": [f"\n\n{stop_sequences}"],
 	}
 
-	llm = Bedrock(model_id=model_name, client=bedrock_runtime, model_kwargs=inference_modifier)
+	llm = Bedrock(
+		model_id=model_name, client=get_bedrock_runtime(), model_kwargs=inference_modifier
+	)
 
 	qa = RetrievalQA.from_chain_type(
 		llm=llm,
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_EMBEDDING_STORE_PATH = "./embeddings/store.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+	model TEXT NOT NULL,
+	text_hash TEXT NOT NULL,
+	vector BLOB NOT NULL,
+	PRIMARY KEY (model, text_hash)
+) WITHOUT ROWID
+"""
+# SQLite limits the number of host parameters of a statement.
+_LOOKUP_BATCH_SIZE = 500
+
+
+def text_hash(text: str) -> str:
+	"""Hash of a chunk, ignoring differences in unicode form and whitespace."""
+	normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+	return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+	"""Persistent embeddings keyed by model name and chunk text hash.
+
+	Vectors are stored as float32 blobs in a single SQLite file, which can be
+	exported and imported to ship a warmed store with the Lambda image.
+	"""
+
+	def __init__(self, path: str = DEFAULT_EMBEDDING_STORE_PATH):
+		self.path = path
+		if path != ":memory:":
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		# Embedding threads share the connection, the lock serializes them.
+		self._conn = sqlite3.connect(path, check_same_thread=False)
+		self._lock = threading.Lock()
+		with self._lock, self._conn:
+			self._conn.execute("PRAGMA journal_mode=WAL")
+			self._conn.execute(_SCHEMA)
+
+	def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+		"""Get the stored embedding of each text, None for the ones not stored."""
+		hashes = [text_hash(text) for text in texts]
+		found: Dict[str, List[float]] = {}
+		unique = list(set(hashes))
+		with self._lock:
+			for start in range(0, len(unique), _LOOKUP_BATCH_SIZE):
+				batch = unique[start : start + _LOOKUP_BATCH_SIZE]
+				rows = self._conn.execute(
+					"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+					f"AND text_hash IN ({', '.join('?' * len(batch))})",
+					[model, *batch],
+				)
+				for key, vector in rows:
+					found[key] = array("f", vector).tolist()
+		return [found.get(key) for key in hashes]
+
+	def put_many(
+		self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]
+	) -> None:
+		rows = [
+			(model, text_hash(text), array("f", vector).tobytes())
+			for text, vector in zip(texts, vectors)
+		]
+		with self._lock, self._conn:
+			self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+
+	def export(self, path: str) -> None:
+		"""Write a consistent copy of the store to ``path``."""
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		target = sqlite3.connect(path)
+		try:
+			with self._lock:
+				self._conn.backup(target)
+		finally:
+			target.close()
+
+	def import_from(self, path: str) -> int:
+		"""Merge the embeddings of another store file, keeping the ones already stored.
+
+		Returns the number of embeddings added.
+		"""
+		with self._lock:
+			before = self._count()
+			self._conn.execute("ATTACH DATABASE ? AS source", (path,))
+			try:
+				with self._conn:
+					self._conn.execute(
+						"INSERT OR IGNORE INTO embeddings SELECT * FROM source.embeddings"
+					)
+			finally:
+				self._conn.execute("DETACH DATABASE source")
+			return self._count() - before
+
+	def _count(self) -> int:
+		return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+	def __len__(self) -> int:
+		with self._lock:
+			return self._count()
+
+	def stats(self) -> Dict[str, int]:
+		with self._lock:
+			rows = self._conn.execute("SELECT model, COUNT(*) FROM embeddings GROUP BY model")
+			return dict(rows.fetchall())
+
+	def close(self) -> None:
+		self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+	"""Embeddings that look chunks up in an EmbeddingStore before calling the model."""
+
+	def __init__(self, embeddings: Embeddings, store: EmbeddingStore, model_name: str):
+		self.embeddings = embeddings
+		self.store = store
+		self.model_name = model_name
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+
+	def embed_documents(self, texts: List[str]) -> List[List[float]]:
+		vectors = self.store.get_many(self.model_name, texts)
+		missing = [i for i, vector in enumerate(vectors) if vector is None]
+		if missing:
+			pending = list(dict.fromkeys(texts[i] for i in missing))
+			embedded = dict(zip(pending, self.embeddings.embed_documents(pending)))
+			self.store.put_many(self.model_name, pending, [embedded[text] for text in pending])
+			for i in missing:
+				vectors[i] = embedded[texts[i]]
+		with self._lock:
+			self.hits += len(texts) - len(missing)
+			self.misses += len(missing)
+		return vectors
+
+	def embed_query(self, text: str) -> List[float]:
+		return self.embed_documents([text])[0]
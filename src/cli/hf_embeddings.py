@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+DTYPES = ("float32", "float16")
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_ONNX_CACHE_DIR = "./models/onnx"
+# Dynamic int8 quantization targeting AVX2, the common denominator of our CPU boxes.
+QUANTIZATION_CONFIG = "avx2"
+QUANTIZED_FILE_NAME = f"onnx/model_qint8_{QUANTIZATION_CONFIG}.onnx"
+
+
+def _sentence_transformers():
+	try:
+		import sentence_transformers
+	except ImportError:
+		raise ImportError(
+			"Install sentence-transformers to embed locally: pip install sentence-transformers"
+			" (and optimum[onnxruntime] for the onnx backends)"
+		)
+	return sentence_transformers
+
+
+class LocalEmbeddings(Embeddings):
+	"""Batched sentence-transformers embeddings for CPU-only ingestion.
+
+	Texts are sorted by length before being cut into batches, so each batch
+	pads to a similar length, and the vectors are put back in input order.
+	With ``processes > 1`` the batches are sharded over a pool of worker
+	processes. The ``onnx`` backends run the model on ONNX Runtime, and
+	``onnx-int8`` with a dynamically quantized copy of it that is exported
+	once to ``onnx_cache_dir``.
+
+	``embed_documents`` returns a 2-D NumPy array of ``dtype`` instead of
+	lists of Python floats.
+	"""
+
+	def __init__(
+		self,
+		model_name: str,
+		batch_size: int = DEFAULT_BATCH_SIZE,
+		processes: int = 1,
+		backend: str = "torch",
+		dtype: str = "float32",
+		normalize: bool = False,
+		onnx_cache_dir: str = DEFAULT_ONNX_CACHE_DIR,
+		model=None,
+	):
+		if backend not in BACKENDS:
+			raise ValueError(f"Invalid backend {backend}, expected one of {BACKENDS}")
+		if dtype not in DTYPES:
+			raise ValueError(f"Invalid dtype {dtype}, expected one of {DTYPES}")
+		self.model_name = model_name
+		self.batch_size = batch_size
+		self.processes = processes
+		self.backend = backend
+		self.dtype = np.dtype(dtype)
+		self.normalize = normalize
+		self.onnx_cache_dir = onnx_cache_dir
+		self._model = model
+		self._pool = None
+		# The ingestion engine embeds from several threads, the model and the
+		# process pool are shared between them.
+		self._lock = threading.Lock()
+
+	@property
+	def cache_key(self) -> str:
+		"""Key of the vectors in an embedding store, they change with backend, dtype and normalization."""
+		normalized = "normalized" if self.normalize else "raw"
+		return f"{self.model_name}|{self.backend}|{self.dtype.name}|{normalized}"
+
+	@property
+	def model(self):
+		if self._model is None:
+			self._model = self.load_model()
+		return self._model
+
+	def load_model(self):
+		st = _sentence_transformers()
+		if self.backend == "torch":
+			return st.SentenceTransformer(self.model_name, device="cpu")
+		if self.backend == "onnx":
+			return st.SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+
+		path = os.path.join(self.onnx_cache_dir, self.model_name.replace("/", "--"))
+		if not os.path.exists(os.path.join(path, QUANTIZED_FILE_NAME)):
+			model = st.SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+			model.save(path)
+			st.export_dynamic_quantized_onnx_model(model, QUANTIZATION_CONFIG, path)
+		return st.SentenceTransformer(
+			path, device="cpu", backend="onnx", model_kwargs={"file_name": QUANTIZED_FILE_NAME}
+		)
+
+	def embed(self, texts: List[str]) -> np.ndarray:
+		"""Embed the texts into a ``(len(texts), dimension)`` array."""
+		if not texts:
+			return np.empty((0, 0), dtype=self.dtype)
+		order = np.argsort([-len(text) for text in texts], kind="stable")
+		sorted_texts = [texts[i] for i in order]
+
+		with self._lock:
+			if self.processes > 1:
+				vectors = self._encode_multi_process(sorted_texts)
+			else:
+				vectors = np.concatenate(
+					[
+						self._encode(sorted_texts[start : start + self.batch_size])
+						for start in range(0, len(sorted_texts), self.batch_size)
+					]
+				)
+
+		embeddings = np.empty(vectors.shape, dtype=self.dtype)
+		embeddings[order] = vectors
+		return embeddings
+
+	def _encode(self, batch: List[str]) -> np.ndarray:
+		return self.model.encode(
+			batch,
+			batch_size=len(batch),
+			convert_to_numpy=True,
+			normalize_embeddings=self.normalize,
+			show_progress_bar=False,
+		)
+
+	def _encode_multi_process(self, texts: List[str]) -> np.ndarray:
+		if self._pool is None:
+			self._pool = self.model.start_multi_process_pool(["cpu"] * self.processes)
+		# Contiguous shards of the sorted texts, so every worker gets similar lengths.
+		chunk_size = max(self.batch_size, -(-len(texts) // self.processes))
+		return self.model.encode_multi_process(
+			texts,
+			self._pool,
+			batch_size=self.batch_size,
+			chunk_size=chunk_size,
+			normalize_embeddings=self.normalize,
+		)
+
+	def embed_documents(self, texts: List[str]) -> np.ndarray:
+		return self.embed(texts)
+
+	def embed_query(self, text: str) -> List[float]:
+		return self.embed([text])[0].tolist()
+
+	def close(self) -> None:
+		"""Stop the worker processes, if any were started."""
+		if self._pool is not None:
+			self.model.stop_multi_process_pool(self._pool)
+			self._pool = None
+
+
+def benchmark(embeddings: Embeddings, texts: List[str], warmup: int = DEFAULT_BATCH_SIZE) -> float:
+	"""Chunks embedded per second, after a warm-up call that loads the model."""
+	embeddings.embed_documents(texts[:warmup])
+	start = time.perf_counter()
+	embeddings.embed_documents(texts)
+	return len(texts) / (time.perf_counter() - start)
@@ -0,0 +1,474 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+try:
+	from .loader import ParseCache, ParsedFile, FileStats, iter_pages
+	from .quantization import quantization_config
+	from .splitter import StreamingTextSplitter
+except ImportError:  # run as a script from src/cli
+	from loader import ParseCache, ParsedFile, FileStats, iter_pages
+	from quantization import quantization_config
+	from splitter import StreamingTextSplitter
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+DOCUMENT_KEY = "document"
+# Shared with the Lambda indexing function so both produce the same point ids.
+POINT_ID_NAMESPACE = uuid.UUID("6fe702a9-4562-4d12-98b1-6caff2356852")
+
+_DONE = object()
+
+
+def document_key(path: str, root: Optional[str] = None) -> str:
+	"""Identify a document by its path relative to the collection's documents folder.
+
+	``download-docs`` mirrors the S3 keys under that folder, so this is the
+	same key the Lambda gets from the S3 key without the documents prefix.
+	Without ``root`` the document is identified by its file name.
+	"""
+	relative = os.path.relpath(path, root if root is not None else os.path.dirname(path))
+	return relative.replace(os.sep, "/")
+
+
+def legacy_document_key(source: str, collection_name: str) -> str:
+	"""Document key of a point stored before points had one, from its ``metadata.source``.
+
+	``create`` stored the path under ``documents/<collection>``, the Lambda
+	only kept the file name.
+	"""
+	source = os.path.normpath(source).replace(os.sep, "/")
+	folder = f"documents/{collection_name}/"
+	return source[len(folder) :] if source.startswith(folder) else os.path.basename(source)
+
+
+def point_id(document: str, content: str, chunk_size: int, chunk_overlap: int) -> str:
+	"""Deterministic point id of a chunk, so re-ingesting it overwrites the same point."""
+	digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+	return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{document}:{chunk_size}:{chunk_overlap}:{digest}"))
+
+
+def existing_point_ids(client: QdrantClient, collection_name: str, document: str) -> Set[str]:
+	"""Get the ids of the points already stored for a document."""
+	ids = set()
+	offset = None
+	while True:
+		points, offset = client.scroll(
+			collection_name=collection_name,
+			scroll_filter=models.Filter(
+				must=[
+					models.FieldCondition(
+						key=f"{METADATA_KEY}.{DOCUMENT_KEY}",
+						match=models.MatchValue(value=document),
+					)
+				]
+			),
+			limit=1000,
+			offset=offset,
+			with_payload=False,
+			with_vectors=False,
+		)
+		ids.update(str(point.id) for point in points)
+		if offset is None:
+			return ids
+
+
+def legacy_point_ids(client: QdrantClient, collection_name: str) -> Dict[str, Set[str]]:
+	"""Get the ids of the points indexed before ids were content hashes, by document.
+
+	``Qdrant.from_documents`` gave those points random ids and no
+	``metadata.document``, so re-indexing never overwrites them. They are
+	matched to their document by ``metadata.source``.
+	"""
+	ids = {}
+	offset = None
+	while True:
+		points, offset = client.scroll(
+			collection_name=collection_name,
+			scroll_filter=models.Filter(
+				must=[
+					models.IsEmptyCondition(
+						is_empty=models.PayloadField(key=f"{METADATA_KEY}.{DOCUMENT_KEY}")
+					)
+				]
+			),
+			limit=1000,
+			offset=offset,
+			with_payload=[f"{METADATA_KEY}.source"],
+			with_vectors=False,
+		)
+		for point in points:
+			source = (point.payload or {}).get(METADATA_KEY, {}).get("source")
+			if source:
+				document = legacy_document_key(source, collection_name)
+				ids.setdefault(document, set()).add(str(point.id))
+		if offset is None:
+			return ids
+
+
+def parse_and_split(
+	path: str,
+	chunk_size: int = CHUNK_SIZE,
+	chunk_overlap: int = CHUNK_OVERLAP,
+	parse_cache_dir: Optional[str] = None,
+	document: Optional[str] = None,
+) -> ParsedFile:
+	"""Parse a file and split its pages into chunks, timing it. Runs in a worker process.
+
+	The chunks are tagged with ``document``, by default the file name. They
+	are returned to the engine all at once, so a worker holds every chunk of
+	the file: its memory grows with the largest file, not with the corpus.
+	The page-at-a-time bound of ``StreamingTextSplitter`` only holds for
+	callers that consume its chunks as they come, like ``split-benchmark``.
+	"""
+	document = document or document_key(path)
+	start = time.perf_counter()
+	stats = FileStats(path)
+	cache = ParseCache(parse_cache_dir) if parse_cache_dir else None
+	docs = []
+	pages = iter_pages(path, cache, stats)
+	for doc in StreamingTextSplitter(chunk_size, chunk_overlap).split_pages(pages):
+		doc.metadata[DOCUMENT_KEY] = document
+		docs.append(doc)
+	stats.chunks = len(docs)
+	stats.seconds = time.perf_counter() - start
+	return ParsedFile(stats, docs)
+
+
+def load_and_split(path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+	"""Parse a file and split its pages into chunks."""
+	return parse_and_split(path, chunk_size, chunk_overlap).docs
+
+
+@dataclass
+class IngestStats:
+	files: int = 0
+	files_parsed: int = 0
+	files_cached: int = 0
+	files_skipped: int = 0
+	chunks: int = 0
+	chunks_embedded: int = 0
+	chunks_upserted: int = 0
+	chunks_skipped: int = 0
+	chunks_deleted: int = 0
+	started_at: float = field(default_factory=time.perf_counter)
+	file_stats: List[FileStats] = field(default_factory=list)
+
+	@property
+	def elapsed(self) -> float:
+		return time.perf_counter() - self.started_at
+
+	@property
+	def throughput(self) -> float:
+		"""Chunks upserted per second."""
+		return self.chunks_upserted / self.elapsed if self.elapsed else 0.0
+
+	def __str__(self) -> str:
+		return (
+			f"Parsed {self.files_parsed}/{self.files} files "
+			f"({self.files_cached} cached, {self.files_skipped} unsupported) | "
+			f"{self.chunks_embedded}/{self.chunks} chunks embedded | "
+			f"{self.chunks_upserted} upserted | "
+			f"{self.chunks_skipped} unchanged | "
+			f"{self.chunks_deleted} deleted | "
+			f"{self.throughput:.1f} chunks/s | {self.elapsed:.1f}s"
+		)
+
+
+class IngestionEngine:
+	"""Pipelined ingestion of documents into a Qdrant collection.
+
+	Files are parsed and chunked in a process pool, from the parse cache when
+	their content was parsed before, chunks are embedded in
+	batches by a pool of threads, and the vectors are upserted to Qdrant in
+	batches. Bounded queues between the stages apply backpressure, so memory
+	stays flat no matter how many files the corpus has. It is still
+	proportional to the largest file, whose chunks are parsed and handed
+	over as a whole, times the files in flight.
+
+	Point ids are derived from the document, the chunk content and the chunk
+	parameters. Chunks already stored are not embedded again, and points of a
+	document that no longer match any of its chunks are deleted at the end.
+	So are the points a document got before ids were content hashes, which
+	migrates a collection one re-indexed document at a time.
+
+	Documents are identified by their path relative to ``documents_dir``, by
+	default the folder the files have in common, so files of the same name in
+	different subfolders are different documents.
+	"""
+
+	def __init__(
+		self,
+		client: QdrantClient,
+		collection_name: str,
+		embeddings: Embeddings,
+		parse_workers: Optional[int] = None,
+		embed_workers: int = 4,
+		embed_batch_size: int = 64,
+		upsert_batch_size: int = 256,
+		queue_size: int = 8,
+		chunk_size: int = CHUNK_SIZE,
+		chunk_overlap: int = CHUNK_OVERLAP,
+		parse_cache_dir: Optional[str] = None,
+		quantization: Optional[str] = None,
+		on_disk: bool = False,
+		hnsw_m: Optional[int] = None,
+		hnsw_ef_construct: Optional[int] = None,
+		documents_dir: Optional[str] = None,
+		progress: Optional[Callable[[IngestStats], None]] = None,
+	):
+		self.client = client
+		self.collection_name = collection_name
+		self.embeddings = embeddings
+		self.parse_workers = parse_workers or os.cpu_count() or 1
+		self.embed_workers = embed_workers
+		self.embed_batch_size = embed_batch_size
+		self.upsert_batch_size = upsert_batch_size
+		self.queue_size = queue_size
+		self.chunk_size = chunk_size
+		self.chunk_overlap = chunk_overlap
+		self.parse_cache_dir = parse_cache_dir
+		self.quantization = quantization
+		self.on_disk = on_disk
+		self.hnsw_m = hnsw_m
+		self.hnsw_ef_construct = hnsw_ef_construct
+		self.documents_dir = documents_dir
+		self.progress = progress
+		self._errors: List[BaseException] = []
+		self._stop = threading.Event()
+		self._collection_ready = False
+		self._stale_ids: List[str] = []
+		self._legacy_ids: Dict[str, Set[str]] = {}
+		self._documents_dir: Optional[str] = None
+
+	def run(self, paths: Iterable[str]) -> IngestStats:
+		"""Ingest the files and return the final stats."""
+		paths = list(paths)
+		stats = IngestStats(files=len(paths))
+		self._documents_dir = self.documents_dir
+		if self._documents_dir is None and paths:
+			self._documents_dir = os.path.commonpath([os.path.dirname(path) for path in paths])
+		if self.collection_exists():
+			self._legacy_ids = legacy_point_ids(self.client, self.collection_name)
+		embed_queue = queue.Queue(maxsize=self.queue_size)
+		upsert_queue = queue.Queue(maxsize=self.queue_size)
+
+		threads = [threading.Thread(target=self._parse, args=(paths, embed_queue, stats))]
+		embedders_left = [self.embed_workers]
+		lock = threading.Lock()
+		for _ in range(self.embed_workers):
+			threads.append(
+				threading.Thread(
+					target=self._embed,
+					args=(embed_queue, upsert_queue, stats, embedders_left, lock),
+				)
+			)
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+
+		self._upsert(upsert_queue, stats)
+		for thread in threads:
+			thread.join()
+		if self._errors:
+			raise self._errors[0]
+
+		# Stale points go only after their replacements are in, so the
+		# document never disappears from search while it is re-indexed.
+		if self._stale_ids:
+			self.client.delete(
+				collection_name=self.collection_name,
+				points_selector=models.PointIdsList(points=self._stale_ids),
+			)
+			stats.chunks_deleted = len(self._stale_ids)
+		return stats
+
+	def point_id(self, doc: Document) -> str:
+		return point_id(
+			doc.metadata[DOCUMENT_KEY], doc.page_content, self.chunk_size, self.chunk_overlap
+		)
+
+	def collection_exists(self) -> bool:
+		collections = self.client.get_collections().collections
+		return self.collection_name in {collection.name for collection in collections}
+
+	def new_chunks(self, chunks: List[Document], stats: IngestStats) -> List[Document]:
+		"""Keep the chunks that are not stored yet and remember the stale points."""
+		if not chunks:
+			return chunks
+		unique = {}
+		for doc in chunks:
+			unique.setdefault(self.point_id(doc), doc)
+		document = chunks[0].metadata[DOCUMENT_KEY]
+		existing = self._legacy_ids.pop(document, set())
+		if self._collection_ready or self.collection_exists():
+			existing |= existing_point_ids(self.client, self.collection_name, document)
+		stats.chunks_skipped += len(chunks) - len(unique.keys() - existing)
+		self._stale_ids.extend(existing - unique.keys())
+		return [doc for point, doc in unique.items() if point not in existing]
+
+	def _fail(self, error: BaseException) -> None:
+		self._errors.append(error)
+		self._stop.set()
+
+	def _put(self, q: queue.Queue, item) -> bool:
+		"""Put an item on a bounded queue, giving up if another stage failed."""
+		while not self._stop.is_set():
+			try:
+				q.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def _parse(self, paths: List[str], embed_queue: queue.Queue, stats: IngestStats) -> None:
+		try:
+			# Spawned workers, because forking a process that already runs threads is unsafe.
+			with ProcessPoolExecutor(
+				max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn")
+			) as executor:
+				pending = set()
+				remaining = iter(paths)
+				while True:
+					# Keep a small window of files in flight so parsed chunks don't pile up.
+					while len(pending) < self.parse_workers * 2:
+						path = next(remaining, None)
+						if path is None:
+							break
+						pending.add(
+							executor.submit(
+								parse_and_split,
+								path,
+								self.chunk_size,
+								self.chunk_overlap,
+								self.parse_cache_dir,
+								document_key(path, self._documents_dir),
+							)
+						)
+					if not pending or self._stop.is_set():
+						break
+					done, pending = wait(pending, return_when=FIRST_COMPLETED)
+					for future in done:
+						parsed = future.result()
+						chunks = parsed.docs
+						stats.files_parsed += 1
+						stats.files_cached += parsed.stats.cached
+						stats.files_skipped += parsed.stats.file_type is None
+						stats.file_stats.append(parsed.stats)
+						stats.chunks += len(chunks)
+						chunks = self.new_chunks(chunks, stats)
+						for start in range(0, len(chunks), self.embed_batch_size):
+							if not self._put(
+								embed_queue, chunks[start : start + self.embed_batch_size]
+							):
+								return
+		except BaseException as e:
+			self._fail(e)
+		finally:
+			for _ in range(self.embed_workers):
+				self._put(embed_queue, _DONE)
+
+	def _embed(self, embed_queue, upsert_queue, stats, embedders_left, lock) -> None:
+		try:
+			while not self._stop.is_set():
+				try:
+					batch = embed_queue.get(timeout=0.1)
+				except queue.Empty:
+					continue
+				if batch is _DONE:
+					break
+				vectors = self.embeddings.embed_documents([doc.page_content for doc in batch])
+				with lock:
+					stats.chunks_embedded += len(batch)
+				if not self._put(upsert_queue, (batch, vectors)):
+					break
+		except BaseException as e:
+			self._fail(e)
+		finally:
+			with lock:
+				embedders_left[0] -= 1
+				last = embedders_left[0] == 0
+			if last:
+				self._put(upsert_queue, _DONE)
+
+	def _upsert(self, upsert_queue: queue.Queue, stats: IngestStats) -> None:
+		points = []
+		try:
+			while not self._stop.is_set():
+				try:
+					item = upsert_queue.get(timeout=0.1)
+				except queue.Empty:
+					continue
+				if item is _DONE:
+					break
+				batch, vectors = item
+				points.extend(self.to_points(batch, vectors))
+				if len(points) >= self.upsert_batch_size:
+					self._flush(points, stats)
+					points = []
+			if points and not self._stop.is_set():
+				self._flush(points, stats)
+		except BaseException as e:
+			self._fail(e)
+
+	def _flush(self, points: List[models.PointStruct], stats: IngestStats) -> None:
+		self.ensure_collection(len(points[0].vector))
+		self.client.upsert(collection_name=self.collection_name, points=points)
+		stats.chunks_upserted += len(points)
+		if self.progress is not None:
+			self.progress(stats)
+
+	def to_points(
+		self, docs: List[Document], vectors: Sequence[Sequence[float]]
+	) -> List[models.PointStruct]:
+		"""Build points with the payload layout langchain's Qdrant vector store reads."""
+		return [
+			models.PointStruct(
+				id=self.point_id(doc),
+				# Local embeddings come back as NumPy rows.
+				vector=vector.tolist() if isinstance(vector, np.ndarray) else vector,
+				payload={CONTENT_KEY: doc.page_content, METADATA_KEY: doc.metadata},
+			)
+			for doc, vector in zip(docs, vectors)
+		]
+
+	def ensure_collection(self, vector_size: int) -> None:
+		"""Create the collection and its document index on the first upsert.
+
+		The quantization, on-disk and HNSW settings only apply to a new collection,
+		unset HNSW settings keep the server defaults.
+		"""
+		if self._collection_ready:
+			return
+		if not self.collection_exists():
+			self.client.create_collection(
+				collection_name=self.collection_name,
+				vectors_config=models.VectorParams(
+					size=vector_size, distance=models.Distance.COSINE, on_disk=self.on_disk
+				),
+				quantization_config=quantization_config(self.quantization),
+				hnsw_config=models.HnswConfigDiff(
+					m=self.hnsw_m, ef_construct=self.hnsw_ef_construct
+				),
+			)
+			self.client.create_payload_index(
+				collection_name=self.collection_name,
+				field_name=f"{METADATA_KEY}.{DOCUMENT_KEY}",
+				field_schema=models.PayloadSchemaType.KEYWORD,
+			)
+		self._collection_ready = True
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+DEFAULT_PARSE_CACHE_DIR = "./parsed"
+# Sniffed from the content first, the extension is only a fallback.
+MAGIC_NUMBERS = {b"%PDF-": "pdf"}
+EXTENSIONS = {".pdf": "pdf", ".txt": "txt", ".md": "txt"}
+
+
+def parse_pdf(path: str) -> Iterator[str]:
+	from pypdf import PdfReader
+
+	with open(path, "rb") as stream:
+		for page in PdfReader(stream).pages:
+			yield page.extract_text()
+
+
+def parse_text(path: str) -> Iterator[str]:
+	with open(path, encoding="utf-8", errors="replace") as stream:
+		yield stream.read()
+
+
+# Parser of each file type and its version, bump the version when the parser
+# changes so the cached text of the old parser is not reused.
+PARSERS: Dict[str, tuple] = {
+	"pdf": (parse_pdf, 1),
+	"txt": (parse_text, 1),
+}
+
+
+def list_files(directory: str) -> List[str]:
+	"""Every file under the directory and its subdirectories, in a stable order."""
+	return sorted(
+		os.path.join(root, name) for root, _, files in os.walk(directory) for name in files
+	)
+
+
+def detect_file_type(path: str) -> Optional[str]:
+	"""Type of the file from its first bytes, falling back to its extension."""
+	with open(path, "rb") as stream:
+		head = stream.read(8)
+	for magic, file_type in MAGIC_NUMBERS.items():
+		if head.startswith(magic):
+			return file_type
+	return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def file_digest(path: str) -> str:
+	digest = hashlib.sha256()
+	with open(path, "rb") as stream:
+		for block in iter(lambda: stream.read(1024 * 1024), b""):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+class ParseCache:
+	"""Extracted page texts on disk, one JSON file per file content hash.
+
+	Files are written atomically, so worker processes parsing the same
+	document at the same time never read a partial entry.
+	"""
+
+	def __init__(self, directory: str = DEFAULT_PARSE_CACHE_DIR):
+		self.directory = directory
+		os.makedirs(directory, exist_ok=True)
+
+	def path(self, key: str) -> str:
+		return os.path.join(self.directory, f"{key}.json")
+
+	def get(self, key: str) -> Optional[List[str]]:
+		try:
+			with open(self.path(key), encoding="utf-8") as stream:
+				return json.load(stream)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return None
+
+	def put(self, key: str, pages: List[str]) -> None:
+		fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+		with os.fdopen(fd, "w", encoding="utf-8") as stream:
+			json.dump(pages, stream, ensure_ascii=False)
+		os.replace(tmp, self.path(key))
+
+
+@dataclass
+class FileStats:
+	path: str
+	file_type: Optional[str] = None
+	pages: int = 0
+	chunks: int = 0
+	seconds: float = 0.0
+	cached: bool = False
+
+
+@dataclass
+class ParsedFile:
+	stats: FileStats
+	docs: List[Document] = field(default_factory=list)
+
+
+def iter_pages(
+	path: str, cache: Optional[ParseCache] = None, stats: Optional[FileStats] = None
+) -> Iterator[Document]:
+	"""Yield the pages of a file as documents, from the parse cache when possible.
+
+	Files of an unknown type, and paths that are not files, yield nothing and
+	leave ``stats.file_type`` None. A file parsed for the parse cache keeps
+	its page texts until the last page, the other pages are not retained.
+	"""
+	stats = stats or FileStats(path)
+	if not os.path.isfile(path):
+		return
+	stats.file_type = detect_file_type(path)
+	if stats.file_type is None:
+		return
+	parse, version = PARSERS[stats.file_type]
+
+	key = f"{file_digest(path)}-{stats.file_type}-v{version}" if cache is not None else None
+	texts = cache.get(key) if cache is not None else None
+	stats.cached = texts is not None
+	pages = texts if stats.cached else parse(path)
+
+	# The texts are only kept to fill the parse cache.
+	parsed = [] if cache is not None and not stats.cached else None
+	for page_number, text in enumerate(pages):
+		if parsed is not None:
+			parsed.append(text)
+		stats.pages = page_number + 1
+		yield Document(page_content=text, metadata={"source": path, "page": page_number})
+	if parsed is not None:
+		cache.put(key, parsed)
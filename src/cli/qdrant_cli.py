@@ -1,15 +1,17 @@
-from langchain_community.vectorstores.qdrant import Qdrant
 import click
-import boto3
+import glob
 import os
+import sys
 from dotenv import load_dotenv
 from utils import (
 	get_embeddings,
-	get_documents_from_pdf,
 	get_client,
 	Embedding,
 	Embeddings,
 	huggingface_embeddings,
+	huggingface_backends,
+	embedding_dtypes,
+	quantizations,
 	aws_embeddings,
 )
 
@@ -21,8 +23,10 @@ AWS_REGION = os.environ.get("AWS_DEFAULT_REGION")
 AWS_S3_BUCKET = os.environ.get("AWS_S3_BUCKET")
 DOCUMENTS_PATH = os.environ.get("DOCUMENTS_PATH")
 COLLECTION_NAME = os.environ.get("COLLECTION_NAME")
-
-boto_session = boto3.Session(region_name=AWS_REGION)
+EMBEDDING_STORE_PATH = os.environ.get("EMBEDDING_STORE_PATH", "./embeddings/store.sqlite3")
+PARSE_CACHE_DIR = os.environ.get("PARSE_CACHE_DIR", "./parsed")
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", "./snapshots/cnu")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
 @click.group()
@@ -32,17 +36,46 @@ def cli():
 
 @cli.command("download-docs")
 @click.option("--collection-name", required=True, prompt=True, help="Collection name")
-@click.option("--bucket", help="S3 bucket")
-def download_files(collection_name, bucket=None):
-	s3 = boto3.resource("s3")
-	if bucket is None:
-		bucket = AWS_S3_BUCKET
-	bucket = s3.Bucket(bucket)
-	for obj in bucket.objects.all():
-		key = obj.key
-		if key.endswith(".pdf"):
-			bucket.download_file(key, f"{DOCUMENTS_PATH}/{collection_name}/{key}")
-			click.echo(click.style(f"Downloaded {key}", fg="green"))
+@click.option("--bucket", default=AWS_S3_BUCKET, help="S3 bucket")
+@click.option("--prefix", default="", help="Only download the keys under this prefix")
+@click.option("--concurrency", default=16, help="Objects downloaded concurrently")
+@click.option("--transfer-concurrency", default=4, help="Parts downloaded concurrently per object")
+@click.option("--multipart-threshold-mb", default=8, help="Size from which objects are multipart")
+@click.option("--multipart-chunksize-mb", default=8, help="Size of each downloaded part")
+def download_files(
+	collection_name,
+	bucket,
+	prefix,
+	concurrency,
+	transfer_concurrency,
+	multipart_threshold_mb,
+	multipart_chunksize_mb,
+):
+	import boto3
+	from boto3.s3.transfer import TransferConfig
+	from botocore.config import Config
+	from s3_sync import MB, S3Sync
+
+	client = boto3.client(
+		"s3", config=Config(max_pool_connections=concurrency * transfer_concurrency)
+	)
+	sync = S3Sync(
+		client,
+		bucket,
+		os.path.join(DOCUMENTS_PATH or "./documents", collection_name),
+		prefix=prefix,
+		concurrency=concurrency,
+		transfer_config=TransferConfig(
+			multipart_threshold=multipart_threshold_mb * MB,
+			multipart_chunksize=multipart_chunksize_mb * MB,
+			max_concurrency=transfer_concurrency,
+		),
+	)
+	stats = sync.run(progress=lambda obj, stats: click.echo(f"Downloaded {obj.key}"))
+	for key, error in sorted(stats.errors.items()):
+		click.echo(click.style(f"Failed {key}: {error}", fg="red"))
+	click.echo(click.style(f"Synced! {stats}", fg="red" if stats.failed else "green"))
+	return stats
 
 
 @cli.command("create")
@@ -56,9 +89,73 @@ def download_files(collection_name, bucket=None):
 	type=click.Choice(huggingface_embeddings + aws_embeddings),
 	help="Embedding model name",
 )
-def create_vectostore(url, api_key, collection_name, embedding_model):
+@click.option("--parse-workers", default=os.cpu_count(), help="Processes parsing documents")
+@click.option("--embed-workers", default=4, help="Threads embedding chunks concurrently")
+@click.option("--embed-batch-size", default=64, help="Chunks per embedding call")
+@click.option("--upsert-batch-size", default=256, help="Points per Qdrant upsert")
+@click.option(
+	"--embedding-store",
+	default=EMBEDDING_STORE_PATH,
+	help="SQLite file caching chunk embeddings across runs, empty to disable",
+)
+@click.option(
+	"--parse-cache",
+	default=PARSE_CACHE_DIR,
+	help="Directory caching the extracted text of documents across runs, empty to disable",
+)
+@click.option(
+	"--hf-backend",
+	default="torch",
+	type=click.Choice(huggingface_backends),
+	help="Runtime of HuggingFace embedding models",
+)
+@click.option("--hf-batch-size", default=64, help="Chunks per HuggingFace model batch")
+@click.option("--hf-processes", default=1, help="Processes sharing the HuggingFace model batches")
+@click.option(
+	"--hf-dtype", default="float32", type=click.Choice(embedding_dtypes), help="Embedding dtype"
+)
+@click.option("--bedrock-concurrency", default=32, help="Most Bedrock embedding requests in flight")
+@click.option(
+	"--quantization",
+	default="none",
+	type=click.Choice(quantizations),
+	help="Quantization of a new collection's vectors, kept in RAM",
+)
+@click.option(
+	"--on-disk/--in-memory", default=False, help="Keep a new collection's original vectors on disk"
+)
+@click.option("--hnsw-m", type=int, help="HNSW m of a new collection, see the tune command")
+@click.option("--hnsw-ef-construct", type=int, help="HNSW ef_construct of a new collection")
+def create_vectostore(
+	url,
+	api_key,
+	collection_name,
+	embedding_model,
+	parse_workers,
+	embed_workers,
+	embed_batch_size,
+	upsert_batch_size,
+	embedding_store,
+	parse_cache,
+	hf_backend,
+	hf_batch_size,
+	hf_processes,
+	hf_dtype,
+	bedrock_concurrency,
+	quantization,
+	on_disk,
+	hnsw_m,
+	hnsw_ef_construct,
+):
+	from embedding_store import CachedEmbeddings, EmbeddingStore
+	from ingest import IngestionEngine
+	from loader import list_files
+	from qdrant_client import QdrantClient
+
 	try:
-		docs = get_documents_from_pdf(collection_name)
+		# Every file, the loader detects the type of each and skips unsupported ones.
+		documents_dir = f"./documents/{collection_name}"
+		paths = list_files(documents_dir)
 
 		if embedding_model in huggingface_embeddings:
 			embedding = Embeddings.HUGGINGFACE
@@ -72,25 +169,311 @@ def create_vectostore(url, api_key, collection_name, embedding_model):
 			raise ValueError("Invalid embedding model name")
 
 		embeddings = get_embeddings(
-			embedding=Embedding(embeddings=embedding, model_name=model_name)
+			embedding=Embedding(embeddings=embedding, model_name=model_name),
+			backend=hf_backend,
+			batch_size=hf_batch_size,
+			processes=hf_processes,
+			dtype=hf_dtype,
+			bedrock_concurrency=bedrock_concurrency,
 		)
-		click.echo(click.style("Creating collection... (15-35 minutes)", fg="green"))
-
-		vectorstore = Qdrant.from_documents(
-			documents=docs,
-			embedding=embeddings,
-			url=url,
-			prefer_grpc=True,
-			api_key=api_key,
+		model = embeddings
+		store = None
+		if embedding_store:
+			store = EmbeddingStore(embedding_store)
+			# Local vectors also depend on the backend and dtype, Bedrock's only on the model.
+			store_key = model.cache_key if embedding == Embeddings.HUGGINGFACE else model_name
+			embeddings = CachedEmbeddings(embeddings, store, store_key)
+		click.echo(click.style(f"Creating collection from {len(paths)} files...", fg="green"))
+
+		client = QdrantClient(url=url, api_key=api_key, prefer_grpc=True)
+		engine = IngestionEngine(
+			client=client,
 			collection_name=collection_name,
-			force_recreate=False,
+			embeddings=embeddings,
+			parse_workers=parse_workers,
+			embed_workers=embed_workers,
+			embed_batch_size=embed_batch_size,
+			upsert_batch_size=upsert_batch_size,
+			parse_cache_dir=parse_cache or None,
+			quantization=quantization,
+			on_disk=on_disk,
+			hnsw_m=hnsw_m,
+			hnsw_ef_construct=hnsw_ef_construct,
+			documents_dir=documents_dir,
+			progress=lambda stats: click.echo(str(stats)),
 		)
-		vectorstore.client.close()
-		click.echo(click.style("Collection created!", fg="green"))
+		stats = engine.run(paths)
+		client.close()
+		echo_file_stats(stats.file_stats)
+		if embedding == Embeddings.BEDROCK:
+			click.echo(click.style(f"Bedrock embeddings: {model.stats()}", fg="green"))
+		model.close()
+		click.echo(click.style(f"Collection created! {stats}", fg="green"))
+		if store is not None:
+			click.echo(
+				click.style(
+					f"Embedding store: {embeddings.hits} hits, {embeddings.misses} misses",
+					fg="green",
+				)
+			)
+			store.close()
 	except Exception as e:
 		click.echo(click.style(f"Error: {e}", fg="red"))
 		return
-	return vectorstore
+	return stats
+
+
+def echo_file_stats(file_stats):
+	click.echo(f"{'file':<40} {'type':<5} {'pages':>6} {'chunks':>7} {'seconds':>8} {'cached':>7}")
+	for file in sorted(file_stats, key=lambda file: file.path):
+		click.echo(
+			f"{os.path.basename(file.path):<40} {file.file_type or '-':<5} {file.pages:>6} "
+			f"{file.chunks:>7} {file.seconds:>8.2f} {'yes' if file.cached else 'no':>7}"
+		)
+
+
+@cli.command("embeddings-benchmark")
+@click.option("--collection-name", required=True, prompt=True, help="Collection of the documents")
+@click.option(
+	"--embedding-model",
+	default=huggingface_embeddings[0],
+	type=click.Choice(huggingface_embeddings),
+	help="HuggingFace embedding model",
+)
+@click.option(
+	"--backends", default="langchain," + ",".join(huggingface_backends), help="Backends to compare"
+)
+@click.option("--batch-size", default=64, help="Chunks per model batch")
+@click.option("--processes", default=1, help="Processes sharing the model batches")
+@click.option("--limit", default=2000, help="Chunks to embed")
+def benchmark_embeddings(collection_name, embedding_model, backends, batch_size, processes, limit):
+	from hf_embeddings import LocalEmbeddings, benchmark
+	from ingest import load_and_split
+	from loader import list_files
+
+	texts = []
+	for path in list_files(f"./documents/{collection_name}"):
+		texts.extend(doc.page_content for doc in load_and_split(path))
+		if len(texts) >= limit:
+			break
+	texts = texts[:limit]
+	click.echo(click.style(f"Embedding {len(texts)} chunks with {embedding_model}", fg="green"))
+
+	for backend in backends.split(","):
+		if backend == "langchain":
+			from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
+
+			embeddings = HuggingFaceEmbeddings(
+				model_name=embedding_model, model_kwargs={"device": "cpu"}
+			)
+		else:
+			embeddings = LocalEmbeddings(
+				embedding_model, batch_size=batch_size, processes=processes, backend=backend
+			)
+		try:
+			click.echo(f"{backend:<10} {benchmark(embeddings, texts, batch_size):>10.1f} chunks/s")
+		except Exception as e:
+			click.echo(click.style(f"{backend:<10} Error: {e}", fg="red"))
+		finally:
+			if isinstance(embeddings, LocalEmbeddings):
+				embeddings.close()
+
+
+@cli.command("split-benchmark")
+@click.option("--collection-name", required=True, prompt=True, help="Collection of the documents")
+def benchmark_split(collection_name):
+	import multiprocessing
+	from concurrent.futures import ProcessPoolExecutor
+
+	from splitter import measure_split
+
+	paths = sorted(glob.glob(f"./documents/{collection_name}/*.pdf"))
+	click.echo(click.style(f"Splitting {len(paths)} files", fg="green"))
+	click.echo(f"{'splitter':<10} {'chunks':>8} {'chunks/s':>10} {'peak RSS MB':>12}")
+	for name, streaming in (("loader", False), ("streaming", True)):
+		# A fresh process per splitter, peak RSS is a process-wide high-water mark.
+		with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+			result = executor.submit(measure_split, paths, streaming).result()
+		click.echo(
+			f"{name:<10} {result['chunks']:>8} {result['chunks_per_second']:>10.1f} "
+			f"{result['peak_rss_mb']:>12.1f}"
+		)
+
+
+@cli.command("embeddings-export")
+@click.option("--store", default=EMBEDDING_STORE_PATH, help="Embedding store to export")
+@click.option("--output", required=True, help="File to write the store to")
+def export_embeddings(store, output):
+	from embedding_store import EmbeddingStore
+
+	store = EmbeddingStore(store)
+	store.export(output)
+	click.echo(click.style(f"Exported {len(store)} embeddings to {output}", fg="green"))
+	store.close()
+
+
+@cli.command("embeddings-import")
+@click.option("--store", default=EMBEDDING_STORE_PATH, help="Embedding store to import into")
+@click.option("--input", "source", required=True, help="Exported store to import")
+def import_embeddings(store, source):
+	from embedding_store import EmbeddingStore
+
+	store = EmbeddingStore(store)
+	added = store.import_from(source)
+	click.echo(click.style(f"Imported {added} embeddings from {source}", fg="green"))
+	store.close()
+
+
+@cli.command("quantization-report")
+@click.option("--url", default=QDRANT_URL, help="Qdrant server URL")
+@click.option("--api-key", default=QDRANT_API_KEY, help="Qdrant API key")
+@click.option("--collection-name", required=True, prompt=True, help="Qdrant collection name")
+@click.option("--queries", default=100, help="Held-out queries, random points of the collection")
+@click.option("--k", default=5, help="Results per search")
+@click.option("--oversampling", default="1,2,4", help="Oversampling factors to rescore with")
+def quantization_report(url, api_key, collection_name, queries, k, oversampling):
+	from quantization import collection_footprint, measure_recall, sample_queries, search_params
+
+	try:
+		client = get_client(url, api_key)
+		footprint = collection_footprint(client, collection_name)
+		click.echo(
+			click.style(
+				f"{collection_name}: {footprint['quantization']} quantization, original vectors "
+				f"{'on disk' if footprint['on_disk'] else 'in RAM'}",
+				fg="green",
+			)
+		)
+		click.echo(
+			f"Vectors: {footprint['original_mb']:.1f} MB original, "
+			f"{footprint['quantized_mb']:.1f} MB quantized, {footprint['ram_mb']:.1f} MB in RAM, "
+			f"{footprint['disk_mb']:.1f} MB on disk (HNSW graph and payloads not included)"
+		)
+
+		params = {"exact": search_params(exact=True), "no rescore": search_params(rescore=False)}
+		for factor in oversampling.split(","):
+			params[f"rescore x{factor}"] = search_params(rescore=True, oversampling=float(factor))
+		report = measure_recall(
+			client, collection_name, sample_queries(client, collection_name, queries), k, params
+		)
+		click.echo(f"{'search':<14} {f'recall@{k}':>10} {'median ms':>10}")
+		for name, result in report.items():
+			click.echo(f"{name:<14} {result['recall']:>10.3f} {result['median_ms']:>10.2f}")
+	except Exception as e:
+		click.echo(click.style(f"Error: {e}", fg="red"))
+
+
+@cli.command("tune")
+@click.option("--url", default=QDRANT_URL, help="Qdrant server URL")
+@click.option("--api-key", default=QDRANT_API_KEY, help="Qdrant API key")
+@click.option("--collection-name", required=True, prompt=True, help="Qdrant collection name")
+@click.option(
+	"--target-url",
+	default="http://localhost:6333",
+	help="Qdrant server where the copies are built, e.g. a local container",
+)
+@click.option("--m", "m_values", default="8,16,32", help="HNSW m values to build")
+@click.option("--ef-construct", default="64,128,256", help="HNSW ef_construct values to build")
+@click.option("--hnsw-ef", default="16,32,64,128", help="Search-time hnsw_ef values to replay")
+@click.option("--queries", default=200, help="Held-out points replayed as queries")
+@click.option("--k", default=2, help="Results per search, the app retrieves 2")
+def tune_index(
+	url, api_key, collection_name, target_url, m_values, ef_construct, hnsw_ef, queries, k
+):
+	from qdrant_client import QdrantClient
+	from tune import tune
+
+	def values(option):
+		return [int(value) for value in option.split(",")]
+
+	try:
+		results = tune(
+			get_client(url, api_key),
+			collection_name,
+			QdrantClient(url=target_url),
+			m_values=values(m_values),
+			ef_construct_values=values(ef_construct),
+			hnsw_ef_values=values(hnsw_ef),
+			queries=queries,
+			k=k,
+			progress=lambda result: click.echo(
+				f"m={result.m} ef_construct={result.ef_construct} hnsw_ef={result.hnsw_ef} done"
+			),
+		)
+		click.echo(
+			f"{'m':>4} {'ef_construct':>12} {'hnsw_ef':>8} {f'recall@{k}':>9} {'p50 ms':>8} "
+			f"{'p99 ms':>8} {'build s':>8}"
+		)
+		for result in sorted(results, key=lambda result: (-result.recall, result.p50_ms)):
+			click.echo(
+				f"{result.m:>4} {result.ef_construct:>12} {result.hnsw_ef:>8} {result.recall:>9.3f} "
+				f"{result.p50_ms:>8.2f} {result.p99_ms:>8.2f} {result.build_seconds:>8.1f}"
+				f"{' *' if result.pareto else ''}"
+			)
+		click.echo(
+			click.style(
+				"* Pareto optimal. Create the collection with its --hnsw-m and --hnsw-ef-construct "
+				"and set QDRANT_HNSW_EF for the app to its hnsw_ef.",
+				fg="green",
+			)
+		)
+	except Exception as e:
+		click.echo(click.style(f"Error: {e}", fg="red"))
+
+
+def local_index_module():
+	# The snapshot format belongs to the app, which loads the snapshots.
+	if REPO_ROOT not in sys.path:
+		sys.path.insert(0, REPO_ROOT)
+	from src.app import local_index
+
+	return local_index
+
+
+@cli.command("snapshot-export")
+@click.option("--url", default=QDRANT_URL, help="Qdrant server URL")
+@click.option("--api-key", default=QDRANT_API_KEY, help="Qdrant API key")
+@click.option("--collection-name", required=True, prompt=True, help="Qdrant collection name")
+@click.option("--output", default=LOCAL_INDEX_PATH, help="Directory of the app's local index")
+def export_snapshot(url, api_key, collection_name, output):
+	try:
+		client = get_client(url, api_key)
+		manifest = local_index_module().export_snapshot(client, collection_name, output)
+		click.echo(
+			click.style(
+				f"Exported {manifest['points']} points of {collection_name} to {output}, "
+				f"snapshot {manifest['version']}",
+				fg="green",
+			)
+		)
+	except Exception as e:
+		click.echo(click.style(f"Error: {e}", fg="red"))
+
+
+@cli.command("local-index-benchmark")
+@click.option("--url", default=QDRANT_URL, help="Qdrant server URL")
+@click.option("--api-key", default=QDRANT_API_KEY, help="Qdrant API key")
+@click.option("--collection-name", required=True, prompt=True, help="Qdrant collection name")
+@click.option("--snapshot", default=LOCAL_INDEX_PATH, help="Directory of the local index")
+@click.option("--queries", default=200, help="Searches to run on each")
+@click.option("--limit", default=2, help="Points per search, the app retrieves 2")
+def benchmark_local_index(url, api_key, collection_name, snapshot, queries, limit):
+	import numpy as np
+
+	local_index = local_index_module()
+	index = local_index.LocalIndex(snapshot)
+	index.reload()
+	# Query vectors near stored chunks, without calling an embedding model.
+	rng = np.random.default_rng(0)
+	vectors = index.vectors_sample(queries, rng)
+	vectors = vectors + rng.normal(0, 0.01, vectors.shape).astype(np.float32)
+
+	client = get_client(url, api_key)
+	report = local_index.compare_latency(client, collection_name, index, vectors.tolist(), limit)
+	click.echo(f"{'backend':<8} {'median ms':>10} {'p95 ms':>10}")
+	for name in ("remote", "local"):
+		click.echo(f"{name:<8} {report[name]['median_ms']:>10.2f} {report[name]['p95_ms']:>10.2f}")
+	click.echo(f"Same points for {report['agreement']['same_ids']:.1%} of the searches")
 
 
 @cli.command("delete")
@@ -0,0 +1,151 @@
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+QUANTIZATIONS = ("none", "scalar", "product", "binary")
+MB = 1024 * 1024
+
+
+def quantization_config(kind: Optional[str], always_ram: bool = True):
+	"""Qdrant quantization of the given kind, the quantized vectors kept in RAM."""
+	if kind in (None, "none"):
+		return None
+	if kind == "scalar":
+		return models.ScalarQuantization(
+			scalar=models.ScalarQuantizationConfig(
+				type=models.ScalarType.INT8, quantile=0.99, always_ram=always_ram
+			)
+		)
+	if kind == "product":
+		return models.ProductQuantization(
+			product=models.ProductQuantizationConfig(
+				compression=models.CompressionRatio.X16, always_ram=always_ram
+			)
+		)
+	if kind == "binary":
+		return models.BinaryQuantization(
+			binary=models.BinaryQuantizationConfig(always_ram=always_ram)
+		)
+	raise ValueError(f"Invalid quantization {kind}, expected one of {QUANTIZATIONS}")
+
+
+def quantization_kind(config) -> str:
+	for kind in QUANTIZATIONS[1:]:
+		if getattr(config, kind, None) is not None:
+			return kind
+	return "none"
+
+
+def quantized_vector_bytes(kind: str, size: int) -> int:
+	"""Bytes of one quantized vector of ``size`` float32 dimensions."""
+	if kind == "scalar":
+		return size
+	if kind == "product":
+		return size * 4 // 16
+	if kind == "binary":
+		return -(-size // 8)
+	return 0
+
+
+def memory_footprint(points: int, size: int, on_disk: bool, kind: str) -> Dict[str, float]:
+	"""Estimated MB of vectors in RAM and on disk, without the HNSW graph and payloads.
+
+	With ``on_disk`` the original vectors are memory-mapped and only the pages
+	being rescored stay in the page cache, the quantized ones are always in RAM.
+	"""
+	original = points * size * 4 / MB
+	quantized = points * quantized_vector_bytes(kind, size) / MB
+	return {
+		"original_mb": original,
+		"quantized_mb": quantized,
+		"ram_mb": quantized + (0 if on_disk else original),
+		"disk_mb": original + quantized,
+	}
+
+
+def collection_footprint(client: QdrantClient, collection_name: str) -> Dict[str, float]:
+	info = client.get_collection(collection_name=collection_name)
+	vectors = info.config.params.vectors
+	kind = quantization_kind(vectors.quantization_config or info.config.quantization_config)
+	return {
+		"quantization": kind,
+		"on_disk": bool(vectors.on_disk),
+		**memory_footprint(info.points_count or 0, vectors.size, bool(vectors.on_disk), kind),
+	}
+
+
+def search_params(
+	rescore: Optional[bool] = None, oversampling: Optional[float] = None, exact: bool = False
+) -> models.SearchParams:
+	"""Search parameters, ``exact`` searches the original vectors without the index."""
+	if exact:
+		return models.SearchParams(
+			exact=True, quantization=models.QuantizationSearchParams(ignore=True)
+		)
+	return models.SearchParams(
+		quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+	)
+
+
+def sample_queries(
+	client: QdrantClient, collection_name: str, count: int, seed: int = 0
+) -> List[Tuple[str, List[float]]]:
+	"""Held-out queries, the vectors of random points that are excluded from their own results."""
+	ids = []
+	offset = None
+	while True:
+		points, offset = client.scroll(
+			collection_name=collection_name, limit=1024, offset=offset, with_payload=False
+		)
+		ids.extend(point.id for point in points)
+		if offset is None:
+			break
+	chosen = np.random.default_rng(seed).choice(len(ids), size=min(count, len(ids)), replace=False)
+	points = client.retrieve(
+		collection_name=collection_name, ids=[ids[i] for i in chosen], with_vectors=True
+	)
+	return [(point.id, point.vector) for point in points]
+
+
+def _search(client, collection_name, query_id, vector, k, params) -> List:
+	return [
+		point.id
+		for point in client.search(
+			collection_name=collection_name,
+			query_vector=vector,
+			query_filter=models.Filter(must_not=[models.HasIdCondition(has_id=[query_id])]),
+			search_params=params,
+			limit=k,
+		)
+	]
+
+
+def measure_recall(
+	client: QdrantClient,
+	collection_name: str,
+	queries: List[Tuple[str, List[float]]],
+	k: int,
+	params: Dict[str, models.SearchParams],
+) -> Dict[str, Dict[str, float]]:
+	"""Recall@k and median latency of each search setting against exact search."""
+	truth = [
+		set(_search(client, collection_name, query_id, vector, k, search_params(exact=True)))
+		for query_id, vector in queries
+	]
+	report = {}
+	for name, setting in params.items():
+		hits, timings = 0, []
+		for (query_id, vector), expected in zip(queries, truth):
+			start = time.perf_counter()
+			found = _search(client, collection_name, query_id, vector, k, setting)
+			timings.append(time.perf_counter() - start)
+			hits += len(expected.intersection(found))
+		report[name] = {
+			"recall": hits / max(1, sum(len(expected) for expected in truth)),
+			"median_ms": statistics.median(timings) * 1000 if timings else 0.0,
+		}
+	return report
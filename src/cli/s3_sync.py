@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from boto3.s3.transfer import TransferConfig
+
+MB = 1024 * 1024
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TRANSFER_CONCURRENCY = 4
+DEFAULT_MULTIPART_THRESHOLD = 8 * MB
+DEFAULT_MULTIPART_CHUNKSIZE = 8 * MB
+MANIFEST_FILE_NAME = ".s3sync.json"
+# The manifest is saved every this many downloads, an interrupted run loses at most these.
+MANIFEST_SAVE_INTERVAL = 32
+
+
+@dataclass
+class RemoteObject:
+	key: str
+	etag: str
+	size: int
+
+
+@dataclass
+class SyncStats:
+	objects: int = 0
+	downloaded: int = 0
+	skipped: int = 0
+	failed: int = 0
+	bytes_downloaded: int = 0
+	seconds: float = 0.0
+	errors: Dict[str, str] = field(default_factory=dict)
+
+	@property
+	def mb_per_second(self) -> float:
+		return self.bytes_downloaded / MB / self.seconds if self.seconds else 0.0
+
+	def __str__(self) -> str:
+		return (
+			f"{self.downloaded} downloaded, {self.skipped} up to date, {self.failed} failed "
+			f"of {self.objects} objects | {self.bytes_downloaded / MB:.1f} MB in "
+			f"{self.seconds:.1f}s ({self.mb_per_second:.1f} MB/s)"
+		)
+
+
+def local_etag(path: str, parts: int = 0, part_size: int = DEFAULT_MULTIPART_CHUNKSIZE) -> str:
+	"""ETag of the file uploaded in a single PUT or, with ``parts``, in parts of ``part_size``."""
+	whole = hashlib.md5()
+	digests = []
+	with open(path, "rb") as stream:
+		for block in iter(lambda: stream.read(part_size), b""):
+			whole.update(block)
+			digests.append(hashlib.md5(block).digest())
+	if not parts:
+		return whole.hexdigest()
+	return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+class S3Sync:
+	"""Download the objects of an S3 prefix to a directory, skipping the ones already there.
+
+	Objects are downloaded concurrently, each with a multipart download when
+	it is larger than ``transfer_config.multipart_threshold``. A download is
+	written to a temporary file and renamed when complete, so a local file
+	is never partial. The ETag and size of every downloaded object are kept
+	in a manifest in the directory, an object whose local copy matches both
+	is skipped, so an interrupted run resumes where it stopped. Local files
+	missing from the manifest are compared by computing their ETag.
+
+	The client is shared between the threads, create it with
+	``max_pool_connections`` of at least ``concurrency`` times the transfer's
+	``max_concurrency``.
+	"""
+
+	def __init__(
+		self,
+		client,
+		bucket: str,
+		directory: str,
+		prefix: str = "",
+		concurrency: int = DEFAULT_CONCURRENCY,
+		transfer_config: Optional[TransferConfig] = None,
+	):
+		self.client = client
+		self.bucket = bucket
+		self.directory = directory
+		self.prefix = prefix
+		self.concurrency = concurrency
+		self.transfer_config = transfer_config or TransferConfig(
+			multipart_threshold=DEFAULT_MULTIPART_THRESHOLD,
+			multipart_chunksize=DEFAULT_MULTIPART_CHUNKSIZE,
+			max_concurrency=DEFAULT_TRANSFER_CONCURRENCY,
+		)
+		self.manifest_path = os.path.join(directory, MANIFEST_FILE_NAME)
+
+	def list_objects(self) -> Iterator[RemoteObject]:
+		paginator = self.client.get_paginator("list_objects_v2")
+		for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+			for obj in page.get("Contents", []):
+				if not obj["Key"].endswith("/"):
+					yield RemoteObject(obj["Key"], obj["ETag"].strip('"'), obj["Size"])
+
+	def local_path(self, key: str) -> str:
+		return os.path.join(self.directory, *key[len(self.prefix) :].lstrip("/").split("/"))
+
+	def load_manifest(self) -> Dict[str, dict]:
+		try:
+			with open(self.manifest_path, encoding="utf-8") as stream:
+				return json.load(stream)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return {}
+
+	def save_manifest(self, manifest: Dict[str, dict]) -> None:
+		fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+		with os.fdopen(fd, "w", encoding="utf-8") as stream:
+			json.dump(manifest, stream, indent=1, sort_keys=True)
+		os.replace(tmp, self.manifest_path)
+
+	def is_up_to_date(self, obj: RemoteObject, manifest: Dict[str, dict]) -> bool:
+		path = self.local_path(obj.key)
+		if not os.path.isfile(path) or os.path.getsize(path) != obj.size:
+			return False
+		if obj.key in manifest:
+			return manifest[obj.key] == {"etag": obj.etag, "size": obj.size}
+		# Downloaded before the manifest existed, the ETag is the MD5 of a single PUT
+		# or of the part MD5s of a multipart upload, for which we assume our part size.
+		parts = int(obj.etag.split("-")[1]) if "-" in obj.etag else 0
+		return local_etag(path, parts, self.transfer_config.multipart_chunksize) == obj.etag
+
+	def download(self, obj: RemoteObject) -> RemoteObject:
+		path = self.local_path(obj.key)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".part")
+		os.close(fd)
+		try:
+			self.client.download_file(self.bucket, obj.key, tmp, Config=self.transfer_config)
+			os.replace(tmp, path)
+		except BaseException:
+			os.remove(tmp)
+			raise
+		return obj
+
+	def run(self, progress=None) -> SyncStats:
+		stats = SyncStats()
+		start = time.perf_counter()
+		os.makedirs(self.directory, exist_ok=True)
+		manifest = self.load_manifest()
+
+		pending: List[RemoteObject] = []
+		for obj in self.list_objects():
+			stats.objects += 1
+			if self.is_up_to_date(obj, manifest):
+				stats.skipped += 1
+				manifest[obj.key] = {"etag": obj.etag, "size": obj.size}
+			else:
+				pending.append(obj)
+
+		try:
+			with ThreadPoolExecutor(self.concurrency, thread_name_prefix="s3-sync") as executor:
+				futures = {executor.submit(self.download, obj): obj for obj in pending}
+				for future in as_completed(futures):
+					obj = futures[future]
+					try:
+						future.result()
+					except Exception as e:
+						stats.failed += 1
+						stats.errors[obj.key] = str(e)
+						continue
+					stats.downloaded += 1
+					stats.bytes_downloaded += obj.size
+					manifest[obj.key] = {"etag": obj.etag, "size": obj.size}
+					if stats.downloaded % MANIFEST_SAVE_INTERVAL == 0:
+						self.save_manifest(manifest)
+					if progress is not None:
+						stats.seconds = time.perf_counter() - start
+						progress(obj, stats)
+		finally:
+			self.save_manifest(manifest)
+			stats.seconds = time.perf_counter() - start
+		return stats
@@ -0,0 +1,97 @@
+import resource
+import time
+from typing import Iterable, Iterator
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+START_INDEX_KEY = "start_index"
+END_INDEX_KEY = "end_index"
+
+
+def iter_pdf_pages(path: str) -> Iterator[Document]:
+	"""Yield the pages of a PDF one at a time, with the metadata PyPDFLoader sets."""
+	from pypdf import PdfReader
+
+	with open(path, "rb") as stream:
+		for page_number, page in enumerate(PdfReader(stream).pages):
+			yield Document(
+				page_content=page.extract_text(), metadata={"source": path, "page": page_number}
+			)
+
+
+class StreamingTextSplitter:
+	"""Split a stream of pages into chunks without materializing either.
+
+	Pages are consumed lazily and split one at a time with the same recursive
+	algorithm as ``RecursiveCharacterTextSplitter``, so the chunk boundaries
+	are identical. Memory is bounded by the largest page instead of by the
+	document, as long as the caller does not collect the chunks. Each chunk keeps its page's metadata and gets the character
+	offsets of the chunk in the page text.
+	"""
+
+	def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+		self.splitter = RecursiveCharacterTextSplitter(
+			chunk_size=chunk_size, chunk_overlap=chunk_overlap
+		)
+
+	def split_text(self, text: str) -> Iterator[tuple]:
+		"""Yield ``(chunk, start, end)`` with the chunk's offsets in ``text``."""
+		start = -1
+		for chunk in self.splitter.split_text(text):
+			# Chunks come in order and overlap, so the next one starts after the previous start.
+			start = text.find(chunk, start + 1)
+			yield chunk, start, start + len(chunk)
+
+	def split_pages(self, pages: Iterable[Document]) -> Iterator[Document]:
+		for page in pages:
+			for chunk, start, end in self.split_text(page.page_content):
+				yield Document(
+					page_content=chunk,
+					metadata={**page.metadata, START_INDEX_KEY: start, END_INDEX_KEY: end},
+				)
+
+	def split_pdf(self, path: str) -> Iterator[Document]:
+		return self.split_pages(iter_pdf_pages(path))
+
+
+def _peak_rss_mb() -> float:
+	# ru_maxrss is in kilobytes on Linux.
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_split(paths: Iterable[str], streaming: bool) -> dict:
+	"""Split the PDFs the streaming way or the way PyPDFLoader does, and report the cost.
+
+	Run it in a fresh process, peak RSS is the high-water mark of the whole process.
+	"""
+	# Imported in both modes so the RSS difference comes from splitting alone.
+	from langchain_community.document_loaders import PyPDFLoader
+
+	start = time.perf_counter()
+	chunks = 0
+	characters = 0
+	if streaming:
+		splitter = StreamingTextSplitter()
+		for path in paths:
+			for doc in splitter.split_pdf(path):
+				chunks += 1
+				characters += len(doc.page_content)
+	else:
+		splitter = RecursiveCharacterTextSplitter(
+			chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+		)
+		pages = [page for path in paths for page in PyPDFLoader(path).load()]
+		docs = splitter.split_documents(pages)
+		chunks = len(docs)
+		characters = sum(len(doc.page_content) for doc in docs)
+	elapsed = time.perf_counter() - start
+	return {
+		"chunks": chunks,
+		"characters": characters,
+		"seconds": elapsed,
+		"chunks_per_second": chunks / elapsed if elapsed else 0.0,
+		"peak_rss_mb": _peak_rss_mb(),
+	}
@@ -0,0 +1,199 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+DEFAULT_M = (8, 16, 32)
+DEFAULT_EF_CONSTRUCT = (64, 128, 256)
+DEFAULT_HNSW_EF = (16, 32, 64, 128)
+UPLOAD_BATCH_SIZE = 256
+POLL_SECONDS = 0.5
+
+
+@dataclass
+class TuneResult:
+	m: int
+	ef_construct: int
+	hnsw_ef: int
+	recall: float
+	p50_ms: float
+	p99_ms: float
+	build_seconds: float
+	pareto: bool = False
+
+
+def read_points(
+	client: QdrantClient, collection_name: str
+) -> Tuple[List, np.ndarray, models.Distance]:
+	"""Every point id and vector of the collection, and its distance."""
+	info = client.get_collection(collection_name=collection_name)
+	ids, vectors = [], []
+	offset = None
+	while True:
+		points, offset = client.scroll(
+			collection_name=collection_name,
+			limit=1024,
+			offset=offset,
+			with_payload=False,
+			with_vectors=True,
+		)
+		for point in points:
+			ids.append(point.id)
+			vectors.append(point.vector)
+		if offset is None:
+			break
+	return ids, np.asarray(vectors, dtype=np.float32), info.config.params.vectors.distance
+
+
+def hold_out(
+	ids: List, vectors: np.ndarray, count: int, seed: int = 0
+) -> Tuple[List, np.ndarray, np.ndarray]:
+	"""Split off ``count`` random vectors as queries, the rest are indexed.
+
+	At least one point is always left to index.
+	"""
+	if count < 1:
+		raise ValueError(f"At least one query is needed, got {count}")
+	if len(ids) < 2:
+		raise ValueError(
+			f"The collection has {len(ids)} points, at least 2 are needed to hold out queries"
+		)
+	held_out = np.zeros(len(ids), dtype=bool)
+	held_out[np.random.default_rng(seed).choice(len(ids), min(count, len(ids) - 1), False)] = True
+	indexed = [point_id for point_id, out in zip(ids, held_out) if not out]
+	return indexed, vectors[~held_out], vectors[held_out]
+
+
+def build_copy(
+	client: QdrantClient,
+	collection_name: str,
+	ids: List,
+	vectors: np.ndarray,
+	distance: models.Distance,
+	m: int,
+	ef_construct: int,
+	timeout: float = 600.0,
+) -> float:
+	"""Index the vectors in a collection with the HNSW parameters, return the seconds it took.
+
+	The indexing threshold is lowered so even a small collection gets its HNSW
+	graph, instead of being searched by full scan. The collection can be GREEN
+	before the optimizer starts indexing, so the build is only done once every
+	point is in the index.
+	"""
+	start = time.perf_counter()
+	client.recreate_collection(
+		collection_name=collection_name,
+		vectors_config=models.VectorParams(size=vectors.shape[1], distance=distance),
+		hnsw_config=models.HnswConfigDiff(m=m, ef_construct=ef_construct, full_scan_threshold=1),
+		optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1),
+	)
+	for offset in range(0, len(ids), UPLOAD_BATCH_SIZE):
+		client.upsert(
+			collection_name=collection_name,
+			points=models.Batch(
+				ids=ids[offset : offset + UPLOAD_BATCH_SIZE],
+				vectors=vectors[offset : offset + UPLOAD_BATCH_SIZE].tolist(),
+			),
+		)
+	while True:
+		info = client.get_collection(collection_name=collection_name)
+		indexed = info.indexed_vectors_count or 0
+		if info.status == models.CollectionStatus.GREEN and indexed >= len(ids):
+			return time.perf_counter() - start
+		if time.perf_counter() - start > timeout:
+			raise TimeoutError(
+				f"{collection_name} indexed {indexed} of {len(ids)} vectors in {timeout} seconds"
+			)
+		time.sleep(POLL_SECONDS)
+
+
+def replay(
+	client: QdrantClient,
+	collection_name: str,
+	queries: np.ndarray,
+	k: int,
+	params: models.SearchParams,
+) -> Tuple[List[List], List[float]]:
+	"""Run every query, return the ids found and the latency of each search."""
+	found, latencies = [], []
+	for query in queries:
+		start = time.perf_counter()
+		points = client.search(
+			collection_name=collection_name,
+			query_vector=query.tolist(),
+			limit=k,
+			search_params=params,
+		)
+		latencies.append(time.perf_counter() - start)
+		found.append([point.id for point in points])
+	return found, latencies
+
+
+def pareto_front(results: Sequence[TuneResult]) -> None:
+	"""Flag the results no other result beats on both recall and p50 latency."""
+	for result in results:
+		result.pareto = not any(
+			other.recall >= result.recall
+			and other.p50_ms <= result.p50_ms
+			and (other.recall > result.recall or other.p50_ms < result.p50_ms)
+			for other in results
+		)
+
+
+def tune(
+	source: QdrantClient,
+	collection_name: str,
+	target: QdrantClient,
+	m_values: Sequence[int] = DEFAULT_M,
+	ef_construct_values: Sequence[int] = DEFAULT_EF_CONSTRUCT,
+	hnsw_ef_values: Sequence[int] = DEFAULT_HNSW_EF,
+	queries: int = 200,
+	k: int = 2,
+	progress: Optional[Callable[[TuneResult], None]] = None,
+) -> List[TuneResult]:
+	"""Sweep HNSW parameters on copies of a collection built in ``target``.
+
+	Held-out points of the collection are the queries, every other point is
+	indexed once per ``m`` and ``ef_construct`` pair, and the queries are
+	replayed for every ``hnsw_ef``. Recall@k is against exact search on the
+	same copy. The copies are deleted afterwards.
+	"""
+	ids, vectors, distance = read_points(source, collection_name)
+	ids, vectors, query_vectors = hold_out(ids, vectors, queries)
+	copy_name = f"{collection_name}-tune"
+	results = []
+	try:
+		for m in m_values:
+			for ef_construct in ef_construct_values:
+				build_seconds = build_copy(
+					target, copy_name, ids, vectors, distance, m, ef_construct
+				)
+				truth, _ = replay(
+					target, copy_name, query_vectors, k, models.SearchParams(exact=True)
+				)
+				expected = sum(len(point_ids) for point_ids in truth)
+				for hnsw_ef in hnsw_ef_values:
+					found, latencies = replay(
+						target, copy_name, query_vectors, k, models.SearchParams(hnsw_ef=hnsw_ef)
+					)
+					hits = sum(len(set(a).intersection(b)) for a, b in zip(truth, found))
+					result = TuneResult(
+						m=m,
+						ef_construct=ef_construct,
+						hnsw_ef=hnsw_ef,
+						recall=hits / max(1, expected),
+						p50_ms=float(np.percentile(latencies, 50)) * 1000,
+						p99_ms=float(np.percentile(latencies, 99)) * 1000,
+						build_seconds=build_seconds,
+					)
+					results.append(result)
+					if progress is not None:
+						progress(result)
+	finally:
+		target.delete_collection(collection_name=copy_name)
+	pareto_front(results)
+	return results
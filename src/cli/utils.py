@@ -1,27 +1,20 @@
 from enum import Enum
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from functools import lru_cache
 import click
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
-from langchain_community.embeddings import BedrockEmbeddings
-import boto3
 from dataclasses import dataclass
 from dotenv import load_dotenv
 import os
-from qdrant_client import QdrantClient
+
+# Only what every command needs is imported here. langchain, qdrant_client,
+# the embedding backends and boto3 are imported inside the functions that use
+# them, so `--help` and light commands start fast.
 
 load_dotenv()
 
 QDRANT_URL = os.environ.get("QDRANT_URL")
 QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
 AWS_REGION = os.environ.get("AWS_DEFAULT_REGION")
-
-boto_session = boto3.Session(region_name=AWS_REGION)
-credentials = boto_session.get_credentials()
-
-# bedrock
-bedrock_models = boto3.client("bedrock", region_name=AWS_REGION)
-bedrock_runtime = boto3.client("bedrock-runtime", region_name=AWS_REGION)
+BEDROCK_MAX_CONCURRENCY = 32
 
 
 class Embeddings(Enum):
@@ -52,47 +45,70 @@ aws_embeddings = ["amazon.titan-embed-text-v1"]
 
 aws_llm = ["anthropic.claude-v2"]
 
+huggingface_backends = ["torch", "onnx", "onnx-int8"]
 
-def get_huggingface_embeddings(model_name: str) -> HuggingFaceEmbeddings:
-	model_kwargs = {"device": "cpu"}
-	encode_kwargs = {"normalize_embeddings": False}
-	embeddings = HuggingFaceEmbeddings(
-		model_name=model_name, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
-	)
+embedding_dtypes = ["float32", "float16"]
+
+quantizations = ["none", "scalar", "product", "binary"]
+
+
+@lru_cache
+def get_bedrock_client():
+	import boto3
+
+	return boto3.client("bedrock", region_name=AWS_REGION)
+
+
+@lru_cache
+def get_bedrock_runtime():
+	import boto3
+
+	return boto3.client("bedrock-runtime", region_name=AWS_REGION)
+
+
+def get_huggingface_embeddings(model_name: str, **options):
+	from hf_embeddings import LocalEmbeddings
+
+	embeddings = LocalEmbeddings(model_name, normalize=False, **options)
 	click.echo(click.style("Embedding finished!", fg="green"))
 	return embeddings
 
 
-def get_bedrock_embeddings(model_name: str) -> BedrockEmbeddings:
-	embeddings = BedrockEmbeddings(client=bedrock_runtime, model_id=model_name)
+def get_bedrock_embeddings(model_name: str, max_concurrency: int = BEDROCK_MAX_CONCURRENCY):
+	import boto3
+	from bedrock_embeddings import BedrockBulkEmbeddings
+	from botocore.config import Config
+
+	# A pool large enough for every concurrent request, retries are done by the embeddings.
+	client = boto3.client(
+		"bedrock-runtime",
+		region_name=AWS_REGION,
+		config=Config(
+			max_pool_connections=max_concurrency,
+			retries={"mode": "standard", "max_attempts": 1},
+		),
+	)
+	embeddings = BedrockBulkEmbeddings(client, model_name, max_concurrency=max_concurrency)
 	click.echo(click.style("Embedding finished!", fg="green"))
 	return embeddings
 
 
-def get_embeddings(embedding: Embedding):
+def get_embeddings(
+	embedding: Embedding, bedrock_concurrency: int = BEDROCK_MAX_CONCURRENCY, **huggingface_options
+):
 	click.echo(click.style(f"Embedding model: {embedding.model_name}", fg="green"))
 	click.echo(click.style(f"Embedding type: {embedding.embeddings}", fg="green"))
 	if embedding.embeddings == Embeddings.HUGGINGFACE:
-		return get_huggingface_embeddings(embedding.model_name)
+		return get_huggingface_embeddings(embedding.model_name, **huggingface_options)
 	elif embedding.embeddings == Embeddings.BEDROCK:
-		return get_bedrock_embeddings(embedding.model_name)
+		return get_bedrock_embeddings(embedding.model_name, max_concurrency=bedrock_concurrency)
 	else:
 		raise ValueError("Invalid embedding type")
 
 
-def get_documents_from_pdf(collection_name: str) -> list:
-	# Load documents
-	loader = PyPDFDirectoryLoader(f"./documents/{collection_name}")
-	documents = loader.load()
-
-	# Split documents
-	text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-	docs = text_splitter.split_documents(documents)
-	click.echo(click.style(f"Number of documents after split: {len(docs)}", fg="green"))
-	return docs
-
+def get_client(url: str, api_key: str):
+	from qdrant_client import QdrantClient
 
-def get_client(url: str, api_key: str) -> QdrantClient:
 	return QdrantClient(url=url, api_key=api_key)
 
 
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+LAMBDA_SRC = os.path.join(os.path.dirname(os.path.dirname(__file__)), "lambda_functions", "src")
+LAMBDA_MODULES = ("utils", "bedrock_embeddings", "embedding_store", "create_vector_store", "main")
+
+
+def write_pdf(path, pages):
+	"""Write a minimal PDF with one page of Helvetica text per entry in ``pages``."""
+	objects = [
+		"<< /Type /Catalog /Pages 2 0 R >>",
+		None,
+		"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+	]
+	page_ids = []
+	for text in pages:
+		lines = [
+			line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+			for line in text.split("\n")
+		]
+		stream = (
+			"BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+		)
+		objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+		objects.append(
+			f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+			f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+		)
+		page_ids.append(len(objects))
+	kids = " ".join(f"{i} 0 R" for i in page_ids)
+	objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+	data = b"%PDF-1.4\n"
+	offsets = []
+	for number, body in enumerate(objects, start=1):
+		offsets.append(len(data))
+		data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+	xref = len(data)
+	data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+	data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+	data += (
+		f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+	)
+	path.write_bytes(data)
+	return path
+
+
+@pytest.fixture
+def pdf_dir(tmp_path):
+	"""A directory with a few small editais."""
+	for number in range(3):
+		pages = [
+			"\n".join(
+				f"Edital {number} pagina {page} item {line} da prova objetiva."
+				for line in range(40)
+			)
+			for page in range(3)
+		]
+		write_pdf(tmp_path / f"edital-{number}.pdf", pages)
+	return tmp_path
+
+
+@pytest.fixture
+def aws_credentials(monkeypatch):
+	"""Fake credentials so boto3 never reaches a real AWS account."""
+	monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+	monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+	monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+	monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+
+@pytest.fixture
+def s3(aws_credentials):
+	with mock_aws():
+		yield boto3.client("s3", region_name="us-east-1")
+
+
+@pytest.fixture
+def lambda_src(monkeypatch, tmp_path):
+	"""Make the Lambda modules importable the way the Lambda runtime imports them."""
+	monkeypatch.syspath_prepend(LAMBDA_SRC)
+	monkeypatch.setenv("EMBEDDING_STORE_PATH", str(tmp_path / "embedding_store.sqlite3"))
+	monkeypatch.setenv("EMBEDDING_STORE_SEED", str(tmp_path / "seed.sqlite3"))
+	for name in LAMBDA_MODULES:
+		monkeypatch.delitem(sys.modules, name, raising=False)
+	yield
+	for name in LAMBDA_MODULES:
+		sys.modules.pop(name, None)
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+from fastapi.testclient import TestClient
+
+from src.app import admission, main
+from src.app.admission import AdmissionController, Overloaded, retry_bedrock, set_deadline
+from tests.test_pipeline import TEXTS, make_pipeline
+
+
+def throttling_error():
+	return ClientError(
+		{"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "InvokeModel"
+	)
+
+
+def test_admission_rejects_when_queue_is_full():
+	limiter = AdmissionController("llm", max_concurrency=1, max_queue=1)
+
+	async def hold(seconds):
+		async with limiter.slot():
+			await asyncio.sleep(seconds)
+
+	async def run():
+		first = asyncio.create_task(hold(0.1))
+		second = asyncio.create_task(hold(0.1))
+		await asyncio.sleep(0.01)
+		with pytest.raises(Overloaded) as error:
+			await hold(0)
+		await asyncio.gather(first, second)
+		return error.value
+
+	error = asyncio.run(run())
+	assert error.status_code == 429
+	assert error.headers["Retry-After"] == "1"
+	assert limiter.rejected == 1
+
+
+def test_admission_sheds_requests_that_would_miss_their_deadline():
+	limiter = AdmissionController("llm", max_concurrency=1, max_queue=10)
+
+	async def hold(seconds):
+		async with limiter.slot():
+			await asyncio.sleep(seconds)
+
+	async def run():
+		await hold(0.2)
+		first = asyncio.create_task(hold(0.2))
+		await asyncio.sleep(0.01)
+		set_deadline(0.05)
+		with pytest.raises(Overloaded) as error:
+			await hold(0)
+		await first
+		return error.value
+
+	assert asyncio.run(run()).status_code == 503
+
+
+def test_retry_bedrock_backs_off_then_succeeds(monkeypatch):
+	delays = []
+
+	async def fake_sleep(delay):
+		delays.append(delay)
+
+	monkeypatch.setattr(admission.asyncio, "sleep", fake_sleep)
+	calls = []
+
+	async def invoke():
+		calls.append(1)
+		if len(calls) < 3:
+			raise throttling_error()
+		return "answer"
+
+	assert asyncio.run(retry_bedrock(invoke, base=1, cap=10)) == "answer"
+	assert len(calls) == 3
+	assert 0 <= delays[0] <= 1 and 0 <= delays[1] <= 2
+
+
+def test_retry_bedrock_gives_up_with_503(monkeypatch):
+	async def fake_sleep(delay):
+		pass
+
+	monkeypatch.setattr(admission.asyncio, "sleep", fake_sleep)
+
+	async def invoke():
+		raise ValueError("Error raised by bedrock service: ThrottlingException")
+
+	with pytest.raises(Overloaded) as error:
+		asyncio.run(retry_bedrock(invoke, attempts=3))
+	assert error.value.status_code == 503
+
+
+def test_retry_bedrock_retries_transient_errors(monkeypatch):
+	async def fake_sleep(delay):
+		pass
+
+	monkeypatch.setattr(admission.asyncio, "sleep", fake_sleep)
+	errors = [
+		ClientError(
+			{"Error": {"Code": "ValidationException"}, "ResponseMetadata": {"HTTPStatusCode": 400}},
+			"InvokeModel",
+		),
+		ClientError(
+			{
+				"Error": {"Code": "InternalServerException"},
+				"ResponseMetadata": {"HTTPStatusCode": 500},
+			},
+			"InvokeModel",
+		),
+		ReadTimeoutError(endpoint_url="https://bedrock-runtime"),
+	]
+
+	async def invoke():
+		error = errors.pop()
+		try:
+			raise error
+		except Exception as e:
+			# How langchain reports the errors of the Bedrock client.
+			raise ValueError(f"Error raised by bedrock service: {e}")
+
+	with pytest.raises(ValueError, match="ValidationException"):
+		asyncio.run(retry_bedrock(invoke))
+	assert errors == []
+
+
+def test_ask_returns_429_with_retry_after_when_overloaded(monkeypatch):
+	limiter = AdmissionController("llm", max_concurrency=1, max_queue=0)
+
+	async def build_pipeline():
+		return make_pipeline(llm_limiter=limiter)
+
+	monkeypatch.setattr(main, "build_pipeline", build_pipeline)
+	with TestClient(main.app) as client:
+		limiter.active = 1
+		response = client.post("/ask", json={"text": TEXTS[0]})
+		stream = client.post("/ask/stream", json={"text": TEXTS[0]})
+
+	assert response.status_code == 429
+	assert response.headers["retry-after"] == "1"
+	assert stream.status_code == 429
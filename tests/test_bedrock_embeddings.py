@@ -0,0 +1,155 @@
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+from src.cli import bedrock_embeddings
+from src.cli.bedrock_embeddings import AdaptiveLimiter, BedrockBulkEmbeddings
+from tests.conftest import LAMBDA_SRC
+
+MODEL = "amazon.titan-embed-text-v1"
+
+
+class ThrottlingBedrock:
+	"""bedrock-runtime stub that throttles when too many requests are in flight."""
+
+	def __init__(self, capacity, latency=0.01, always_throttle=False):
+		self.capacity = capacity
+		self.latency = latency
+		self.always_throttle = always_throttle
+		self.in_flight = 0
+		self.peak = 0
+		self.calls = 0
+		self.throttled = 0
+		self.lock = threading.Lock()
+
+	def invoke_model(self, body, modelId, accept, contentType):
+		text = json.loads(body)["inputText"]
+		with self.lock:
+			self.calls += 1
+			self.in_flight += 1
+			self.peak = max(self.peak, self.in_flight)
+			throttle = self.always_throttle or self.in_flight > self.capacity
+			self.throttled += throttle
+		try:
+			time.sleep(self.latency)
+			if throttle:
+				raise ClientError(
+					{"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+					"InvokeModel",
+				)
+			embedding = [float(len(text)), float(text.count(" "))]
+			return {"body": io.BytesIO(json.dumps({"embedding": embedding}).encode())}
+		finally:
+			with self.lock:
+				self.in_flight -= 1
+
+
+def embeddings_for(client, **kwargs):
+	return BedrockBulkEmbeddings(client, MODEL, backoff_base=0.001, backoff_cap=0.01, **kwargs)
+
+
+def test_embeddings_are_concurrent_and_in_order():
+	client = ThrottlingBedrock(capacity=100)
+	embeddings = embeddings_for(client, max_concurrency=16, initial_concurrency=16)
+	texts = [" ".join(["prova"] * (i % 7 + 1)) for i in range(200)]
+
+	vectors = embeddings.embed_documents(texts)
+
+	assert vectors == [[float(len(text)), float(text.count(" "))] for text in texts]
+	assert 1 < client.peak <= 16
+	assert client.throttled == 0
+
+
+def test_concurrency_adapts_to_throttling():
+	client = ThrottlingBedrock(capacity=8)
+	embeddings = embeddings_for(client, max_concurrency=32, initial_concurrency=32)
+	texts = [f"edital {i}" for i in range(300)]
+
+	vectors = embeddings.embed_documents(texts)
+
+	assert vectors == [[float(len(text)), 1.0] for text in texts]
+	assert client.throttled > 0
+	assert embeddings.stats()["throttled"] == client.throttled
+	assert embeddings.stats()["requests"] == client.calls == len(texts) + client.throttled
+	# The limit settles around the capacity instead of staying at the maximum,
+	# where about three of every four requests would be throttled.
+	assert embeddings.limiter.limit < 16
+	assert client.throttled < len(texts) / 2
+
+
+def test_gives_up_after_max_attempts():
+	client = ThrottlingBedrock(capacity=1, always_throttle=True)
+	embeddings = embeddings_for(client, max_attempts=3)
+
+	with pytest.raises(ClientError, match="ThrottlingException"):
+		embeddings.embed_documents(["prova"])
+	assert client.calls == 3
+	# The last throttle counts too, and backs the limiter off instead of raising it.
+	assert embeddings.stats()["throttled"] == 3
+	assert embeddings.limiter.limit == 1
+
+
+def test_transient_errors_are_retried_without_lowering_the_limit():
+	class FlakyBedrock(ThrottlingBedrock):
+		errors = [
+			ReadTimeoutError(endpoint_url="https://bedrock-runtime"),
+			EndpointConnectionError(endpoint_url="https://bedrock-runtime"),
+			ClientError(
+				{
+					"Error": {"Code": "InternalServerException"},
+					"ResponseMetadata": {"HTTPStatusCode": 500},
+				},
+				"InvokeModel",
+			),
+		]
+
+		def invoke_model(self, **kwargs):
+			with self.lock:
+				error = self.errors.pop() if self.errors else None
+				self.calls += error is not None
+			if error is not None:
+				raise error
+			return super().invoke_model(**kwargs)
+
+	client = FlakyBedrock(capacity=100)
+	embeddings = embeddings_for(client, initial_concurrency=4)
+
+	assert embeddings.embed_documents(["prova"] * 4) == [[5.0, 0.0]] * 4
+	assert client.calls == 4 + 3
+	assert embeddings.stats()["throttled"] == 0
+	assert embeddings.limiter.limit > 4
+
+
+def test_other_errors_are_not_retried():
+	class FailingBedrock(ThrottlingBedrock):
+		def invoke_model(self, **kwargs):
+			self.calls += 1
+			raise ClientError({"Error": {"Code": "ValidationException"}}, "InvokeModel")
+
+	client = FailingBedrock(capacity=1)
+	with pytest.raises(ClientError, match="ValidationException"):
+		embeddings_for(client).embed_query("prova")
+	assert client.calls == 1
+
+
+def test_limiter_halves_once_per_round():
+	limiter = AdaptiveLimiter(initial=8, maximum=8)
+	started = [limiter.acquire() for _ in range(4)]
+	for started_at in started:
+		limiter.release(started_at, throttled=True)
+	assert limiter.limit == 4
+
+	limiter.release(limiter.acquire(), throttled=False)
+	assert limiter.limit == 4.25
+
+
+def test_lambda_copy_matches():
+	with open(bedrock_embeddings.__file__, encoding="utf-8") as stream:
+		cli = stream.read().expandtabs(4)
+	with open(os.path.join(LAMBDA_SRC, "bedrock_embeddings.py"), encoding="utf-8") as stream:
+		assert stream.read() == cli
@@ -0,0 +1,122 @@
+import asyncio
+
+from src.app.cache import AnswerCache, EmbeddingCache, LRUCache, normalize_text
+
+
+class DictBackend:
+	"""Shared backend stand-in for Redis."""
+
+	def __init__(self):
+		self.store = {}
+
+	async def get(self, key):
+		return self.store.get(key)
+
+	async def set(self, key, embedding):
+		self.store[key] = embedding
+
+	async def aclose(self):
+		pass
+
+
+class CountingEmbed:
+	def __init__(self):
+		self.calls = 0
+
+	async def __call__(self, text):
+		self.calls += 1
+		return [float(len(text)), 1.0]
+
+
+def test_normalize_text():
+	assert normalize_text("  Qual a  data da\nPROVA? ") == "qual a data da prova?"
+
+
+def test_lru_cache_evicts_least_recently_used():
+	cache = LRUCache(max_size=2, ttl=60)
+	cache.set("a", 1)
+	cache.set("b", 2)
+	cache.get("a")
+	cache.set("c", 3)
+	assert cache.get("b") is None
+	assert cache.get("a") == 1
+	assert cache.get("c") == 3
+
+
+def test_lru_cache_expires_entries():
+	cache = LRUCache(max_size=2, ttl=0)
+	cache.set("a", 1)
+	assert cache.get("a") is None
+	assert len(cache) == 0
+
+
+def test_embedding_cache_hits_skip_the_model():
+	cache = EmbeddingCache(model_id="amazon.titan-embed-text-v1")
+	embed = CountingEmbed()
+
+	async def run():
+		first = await cache.get_or_embed("Qual a data da prova?", embed)
+		second = await cache.get_or_embed("qual a data  da prova?", embed)
+		return first, second
+
+	first, second = asyncio.run(run())
+	assert first == second
+	assert embed.calls == 1
+	assert cache.stats()["hits"] == 1
+	assert cache.stats()["misses"] == 1
+
+
+def test_embedding_cache_keys_include_model_id():
+	titan = EmbeddingCache(model_id="amazon.titan-embed-text-v1")
+	other = EmbeddingCache(model_id="amazon.titan-embed-text-v2")
+	assert titan.key("prova") != other.key("prova")
+
+
+def test_embedding_cache_shares_entries_across_workers():
+	shared = DictBackend()
+	worker_1 = EmbeddingCache(model_id="amazon.titan-embed-text-v1", shared=shared)
+	worker_2 = EmbeddingCache(model_id="amazon.titan-embed-text-v1", shared=shared)
+	embed = CountingEmbed()
+
+	asyncio.run(worker_1.get_or_embed("Qual a data da prova?", embed))
+	asyncio.run(worker_2.get_or_embed("Qual a data da prova?", embed))
+
+	assert embed.calls == 1
+	assert worker_2.hits == 1
+
+
+def test_answer_cache_matches_similar_questions_with_same_chunks():
+	cache = AnswerCache(threshold=0.95)
+	cache.store([1.0, 0.0, 0.1], ["a", "b"], 0.5, "5 de maio")
+
+	assert cache.lookup([0.99, 0.02, 0.1], ["a", "b"], 0.5) == "5 de maio"
+	assert cache.lookup([0.0, 1.0, 0.0], ["a", "b"], 0.5) is None
+	assert cache.lookup([1.0, 0.0, 0.1], ["a", "c"], 0.5) is None
+	assert cache.lookup([1.0, 0.0, 0.1], ["a", "b"], 0.9) is None
+
+
+def test_answer_cache_evicts_by_size_and_age():
+	cache = AnswerCache(max_size=1)
+	cache.store([1.0, 0.0], ["a"], 0.5, "first")
+	cache.store([0.0, 1.0], ["b"], 0.5, "second")
+	assert cache.lookup([1.0, 0.0], ["a"], 0.5) is None
+	assert cache.lookup([0.0, 1.0], ["b"], 0.5) == "second"
+
+	expired = AnswerCache(ttl=0)
+	expired.store([1.0, 0.0], ["a"], 0.5, "first")
+	assert expired.lookup([1.0, 0.0], ["a"], 0.5) is None
+	assert expired.stats()["size"] == 0
+
+
+def test_answer_cache_invalidated_when_collection_changes():
+	cache = AnswerCache()
+	cache.check_collection(100)
+	generation = cache.generation
+	cache.store([1.0, 0.0], ["a"], 0.5, "first")
+
+	assert cache.check_collection(120) is True
+	assert cache.lookup([1.0, 0.0], ["a"], 0.5) is None
+
+	# Answers generated before the re-index are not cached afterwards.
+	cache.store([1.0, 0.0], ["a"], 0.5, "stale", generation=generation)
+	assert cache.lookup([1.0, 0.0], ["a"], 0.5) is None
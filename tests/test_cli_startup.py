@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+CLI_SRC = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src", "cli")
+# Generous next to the ~30 ms it takes today, tight enough to catch an eager heavy import.
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("CLI_IMPORT_TIME_BUDGET_MS", 200))
+HEAVY_PACKAGES = {
+	"boto3",
+	"botocore",
+	"langchain",
+	"langchain_community",
+	"langchain_core",
+	"numpy",
+	"pypdf",
+	"qdrant_client",
+	"sentence_transformers",
+	"torch",
+}
+
+
+def import_times(module):
+	"""Cumulative import time in microseconds of every module imported by ``module``."""
+	env = {key: value for key, value in os.environ.items() if not key.startswith("AWS_")}
+	result = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", f"import {module}"],
+		cwd=CLI_SRC,
+		env=env,
+		capture_output=True,
+		text=True,
+		check=True,
+	)
+	times = {}
+	for line in result.stderr.splitlines():
+		if line.startswith("import time:") and "|" in line:
+			_, cumulative, name = line.split("|")
+			if cumulative.strip().isdigit():
+				times[name.strip()] = int(cumulative)
+	return times
+
+
+@pytest.mark.parametrize("module", ["qdrant_cli", "bedrock_cli"])
+def test_cli_import_stays_light(module):
+	times = import_times(module)
+
+	assert not {name.split(".")[0] for name in times} & HEAVY_PACKAGES
+	assert times[module] / 1000 < IMPORT_TIME_BUDGET_MS
@@ -0,0 +1,99 @@
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+from src.app import main
+from src.app.context import ContextAssembler
+from src.app.metrics import estimate_tokens
+from src.cli.splitter import StreamingTextSplitter
+from tests.test_pipeline import TEXTS, make_pipeline
+
+PAGE = " ".join(
+	f"O candidato {number} deve apresentar o documento de identidade na sala {number % 9}."
+	for number in range(60)
+)
+
+
+def chunks(source="edital.pdf", page=0):
+	pages = [Document(page_content=PAGE, metadata={"source": source, "page": page})]
+	return list(StreamingTextSplitter(chunk_size=500, chunk_overlap=100).split_pages(pages))
+
+
+def without_offsets(docs):
+	return [
+		Document(page_content=doc.page_content, metadata={"source": doc.metadata["source"]})
+		for doc in docs
+	]
+
+
+def test_overlapping_chunks_are_merged_by_offsets():
+	docs = chunks()
+	retrieved = [docs[2], docs[0], docs[1], docs[5]]
+	context = ContextAssembler(token_budget=4096).assemble(retrieved)
+
+	assert context.merged == 2
+	assert [doc.page_content for doc in context.docs] == [
+		PAGE[docs[0].metadata["start_index"] : docs[2].metadata["end_index"]],
+		docs[5].page_content,
+	]
+	assert context.docs[0].metadata["start_index"] == docs[0].metadata["start_index"]
+	assert 0 < context.tokens < context.retrieved_tokens
+
+
+def test_overlapping_chunks_are_merged_by_text_without_offsets():
+	docs = chunks()
+	context = ContextAssembler(token_budget=4096).assemble(without_offsets([docs[1], docs[0]]))
+	assert context.merged == 1
+	assert context.text == PAGE[docs[0].metadata["start_index"] : docs[1].metadata["end_index"]]
+
+
+def test_chunks_of_other_pages_are_not_merged():
+	first, second = chunks(page=0)[0], chunks(page=1)[1]
+	context = ContextAssembler(token_budget=4096).assemble([first, second])
+	assert context.merged == 0 and len(context.docs) == 2
+
+
+def test_near_duplicates_are_dropped():
+	docs = chunks()
+	copy = Document(
+		page_content=docs[3].page_content.replace("sala", "Sala"),
+		metadata={"source": "edital-retificado.pdf"},
+	)
+	context = ContextAssembler(token_budget=4096).assemble([docs[3], copy])
+	assert context.duplicates == 1
+	assert [doc.page_content for doc in context.docs] == [docs[3].page_content]
+
+
+def test_context_fits_the_token_budget():
+	docs = chunks()[::2]
+	context = ContextAssembler(token_budget=300).assemble(docs)
+	assert context.tokens <= 300
+	assert context.truncated == 1 and context.dropped == len(docs) - len(context.docs)
+	assert context.docs[0].page_content == docs[0].page_content
+	assert docs[len(context.docs) - 1].page_content.startswith(context.docs[-1].page_content)
+	assert context.saved_tokens == context.retrieved_tokens - estimate_tokens(context.text)
+
+
+def test_prompt_tokens_are_reported_per_request(monkeypatch):
+	pipeline = make_pipeline(context_assembler=ContextAssembler(token_budget=8))
+
+	async def build_pipeline():
+		return pipeline
+
+	monkeypatch.setattr(main, "build_pipeline", build_pipeline)
+	with TestClient(main.app) as client:
+		response = client.post("/ask", json={"text": TEXTS[0]})
+
+	assert response.status_code == 200
+	tokens = response.json()["prompt_tokens"]
+	assert tokens["saved"] == tokens["retrieved"] - tokens["sent"] > 0
+	assert response.headers["x-prompt-tokens"] == (
+		f"retrieved={tokens['retrieved']}, sent={tokens['sent']}, saved={tokens['saved']}"
+	)
+	assert "qa_prompt_tokens_saved_sum" in client.get("/metrics").text
+
+
+def test_best_passage_is_kept_under_a_tiny_budget():
+	docs = chunks()
+	context = ContextAssembler(token_budget=8).assemble(docs[:2])
+	assert len(context.docs) == 1 and context.truncated == 1
+	assert docs[0].page_content.startswith(context.text) and context.tokens <= 8
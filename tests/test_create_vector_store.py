@@ -0,0 +1,303 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import uuid
+
+import pytest
+from langchain_community.embeddings.fake import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from tests.conftest import LAMBDA_SRC, write_pdf
+
+EMBEDDING_MODEL = "amazon.titan-embed-text-v1"
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+	calls: list = []
+
+	def embed_documents(self, texts):
+		self.calls.append(len(texts))
+		return super().embed_documents(texts)
+
+
+def edital(version, name="Edital"):
+	return [
+		"\n".join(
+			f"{name} versao {version if page == 2 else 1} pagina {page} item {line}."
+			for line in range(40)
+		)
+		for page in range(3)
+	]
+
+
+@pytest.fixture
+def indexing(lambda_src, s3, monkeypatch):
+	"""The Lambda modules wired to moto S3, in-memory Qdrant and fake embeddings."""
+	create_vector_store = importlib.import_module("create_vector_store")
+	client = QdrantClient(":memory:")
+	monkeypatch.setattr(client, "close", lambda: None)
+	monkeypatch.setattr(create_vector_store, "get_client", lambda url, api_key: client)
+	monkeypatch.setattr(create_vector_store, "get_s3_client", lambda: s3)
+	embeddings = CountingEmbeddings(size=16, calls=[])
+	monkeypatch.setattr(create_vector_store, "get_embeddings", lambda **kwargs: embeddings)
+	monkeypatch.setattr(create_vector_store, "DOCUMENTS_PREFIX", "cnu/")
+	s3.create_bucket(Bucket="editais")
+	return create_vector_store, client, embeddings
+
+
+def index(create_vector_store, key):
+	return create_vector_store.create_vectorstore(
+		url=None,
+		api_key=None,
+		bucket_name="editais",
+		object_key=key,
+		collection_name="cnu",
+		region_name="us-east-1",
+		embedding_model=EMBEDDING_MODEL,
+	)
+
+
+def test_reindexing_only_pays_for_the_delta(indexing, s3, tmp_path):
+	create_vector_store, client, embeddings = indexing
+
+	def upload_and_index(version):
+		path = write_pdf(tmp_path / "edital.pdf", edital(version))
+		s3.upload_file(str(path), "editais", "cnu/edital.pdf")
+		embeddings.calls.clear()
+		stats = index(create_vector_store, "cnu/edital.pdf")
+		points = client.scroll("cnu", limit=1000)[0]
+		return stats, sum(embeddings.calls), {point.payload["page_content"] for point in points}
+
+	stats, embedded, first = upload_and_index(1)
+	assert embedded == stats["upserted"] == len(first) > 0
+
+	stats, embedded, second = upload_and_index(1)
+	assert embedded == stats["upserted"] == 0
+	assert second == first
+
+	stats, embedded, third = upload_and_index(2)
+	changed = third - first
+	assert 0 < embedded == len(changed) < len(third)
+	assert stats["deleted"] == len(first - third)
+	assert not any("versao 1 pagina 2" in content for content in third)
+	assert client.count("cnu").count == len(third)
+
+
+def test_points_without_content_hash_ids_are_replaced(indexing, s3, tmp_path):
+	create_vector_store, client, _ = indexing
+	s3.upload_file(str(write_pdf(tmp_path / "edital.pdf", edital(1))), "editais", "cnu/edital.pdf")
+	# What the function stored before point ids were content hashes.
+	client.create_collection(
+		"cnu", vectors_config=models.VectorParams(size=16, distance=models.Distance.COSINE)
+	)
+	client.upsert(
+		"cnu",
+		[
+			models.PointStruct(
+				id=str(uuid.uuid4()),
+				vector=[1.0] * 16,
+				payload={"page_content": "old", "metadata": {"source": source, "page": 0}},
+			)
+			for source in ("/tmp/edital.pdf", "/tmp/edital.pdf", "/tmp/outro.pdf")
+		],
+	)
+
+	stats = index(create_vector_store, "cnu/edital.pdf")
+
+	assert stats["deleted"] == 2
+	assert client.count("cnu").count == stats["chunks"] + 1
+
+
+def test_documents_with_the_same_file_name_are_kept_apart(indexing, s3, tmp_path):
+	create_vector_store, client, _ = indexing
+	for folder in ("a", "b"):
+		path = write_pdf(tmp_path / f"{folder}.pdf", edital(1, name=f"Edital {folder}"))
+		s3.upload_file(str(path), "editais", f"cnu/{folder}/edital.pdf")
+	first = index(create_vector_store, "cnu/a/edital.pdf")
+	second = index(create_vector_store, "cnu/b/edital.pdf")
+
+	assert (first["document"], second["document"]) == ("a/edital.pdf", "b/edital.pdf")
+	assert second["deleted"] == 0
+	assert index(create_vector_store, "cnu/a/edital.pdf")["deleted"] == 0
+	assert client.count("cnu").count == first["chunks"] + second["chunks"]
+
+
+def test_point_ids_match_the_cli(lambda_src, monkeypatch):
+	from src.cli import ingest
+
+	create_vector_store = importlib.import_module("create_vector_store")
+	assert create_vector_store.POINT_ID_NAMESPACE == ingest.POINT_ID_NAMESPACE
+	for prefix in ("", "editais/"):
+		monkeypatch.setattr(create_vector_store, "DOCUMENTS_PREFIX", prefix)
+		for key in ("edital.pdf", "anexos/edital.pdf"):
+			document = create_vector_store.document_key(prefix + key)
+			# download-docs --prefix stores the key without the prefix under the folder.
+			path = os.path.join("documents", "cnu", *key.split("/"))
+			assert document == ingest.document_key(path, "documents/cnu") == key
+			assert create_vector_store.point_id(document, "Edital item 1.") == ingest.point_id(
+				document, "Edital item 1.", ingest.CHUNK_SIZE, ingest.CHUNK_OVERLAP
+			)
+	for source in ("/tmp/edital.pdf", "documents/cnu/anexos/edital.pdf"):
+		assert create_vector_store.legacy_document_key(source, "cnu") == ingest.legacy_document_key(
+			source, "cnu"
+		)
+	assert (create_vector_store.CHUNK_SIZE, create_vector_store.CHUNK_OVERLAP) == (
+		ingest.CHUNK_SIZE,
+		ingest.CHUNK_OVERLAP,
+	)
+
+
+def test_new_collection_uses_the_configured_quantization(indexing, s3, tmp_path, monkeypatch):
+	create_vector_store, client, _ = indexing
+	created = []
+	create_collection = client.create_collection
+	monkeypatch.setattr(
+		client,
+		"create_collection",
+		lambda **kwargs: created.append(kwargs) or create_collection(**kwargs),
+	)
+	monkeypatch.setattr(create_vector_store, "QDRANT_QUANTIZATION", "binary")
+	monkeypatch.setattr(create_vector_store, "QDRANT_ON_DISK", True)
+	s3.upload_file(str(write_pdf(tmp_path / "edital.pdf", edital(1))), "editais", "edital.pdf")
+
+	index(create_vector_store, "edital.pdf")
+	assert created[0]["vectors_config"].on_disk
+	assert created[0]["quantization_config"].binary.always_ram
+
+
+def test_large_objects_are_read_with_ranged_requests(indexing, s3, tmp_path, monkeypatch):
+	create_vector_store, _, _ = indexing
+	path = write_pdf(tmp_path / "edital.pdf", edital(1))
+	s3.upload_file(str(path), "editais", "cnu/edital.pdf")
+	in_memory = [
+		(doc.page_content, doc.metadata)
+		for doc in create_vector_store.get_documents_from_pdf("editais", "cnu/edital.pdf")
+	]
+
+	readers = []
+	reader_class = create_vector_store.S3RangeReader
+	monkeypatch.setattr(
+		create_vector_store,
+		"S3RangeReader",
+		lambda *args: readers.append(reader_class(*args)) or readers[-1],
+	)
+	monkeypatch.setattr(create_vector_store, "IN_MEMORY_MAX_BYTES", 0)
+	monkeypatch.setattr(create_vector_store, "RANGE_SIZE", 512)
+	ranged = [
+		(doc.page_content, doc.metadata)
+		for doc in create_vector_store.get_documents_from_pdf("editais", "cnu/edital.pdf")
+	]
+
+	assert ranged == in_memory
+	assert in_memory[0][1] == {
+		"source": "s3://editais/cnu/edital.pdf",
+		"page": 0,
+		"start_index": 0,
+		"end_index": len(in_memory[0][0]),
+		"document": "edital.pdf",
+	}
+	assert readers[0].requests > 1
+
+
+def test_handler_indexes_every_record(indexing, s3, tmp_path, monkeypatch):
+	create_vector_store, client, _ = indexing
+	main = importlib.import_module("main")
+	keys = [f"cnu/edital {number}.pdf" for number in range(5)]
+	for number, key in enumerate(keys):
+		path = write_pdf(tmp_path / f"{number}.pdf", edital(1, name=f"Edital {number}"))
+		s3.upload_file(str(path), "editais", key)
+
+	event = {
+		"Records": [
+			# S3 notifications url-encode the object key.
+			{"s3": {"bucket": {"name": "editais"}, "object": {"key": key.replace(" ", "+")}}}
+			for key in keys
+		]
+	}
+	response = main.lambda_handler(event, None)
+
+	assert response["statusCode"] == 200
+	results = json.loads(response["body"])
+	assert [result["document"] for result in results] == [key.split("/")[1] for key in keys]
+	assert client.count("cnu").count == sum(result["upserted"] for result in results)
+	for result in results:
+		stored = create_vector_store.existing_point_ids(client, "cnu", result["document"])
+		assert len(stored) == result["chunks"] > 0
+
+
+def test_handler_fails_when_a_record_fails(indexing, s3, tmp_path):
+	main = importlib.import_module("main")
+	s3.upload_file(str(write_pdf(tmp_path / "edital.pdf", edital(1))), "editais", "edital.pdf")
+	event = {
+		"Records": [
+			{"s3": {"bucket": {"name": "editais"}, "object": {"key": key}}}
+			for key in ("edital.pdf", "missing.pdf")
+		]
+	}
+
+	with pytest.raises(Exception, match="404"):
+		main.lambda_handler(event, None)
+
+	_, client, _ = indexing
+	assert client.count("cnu").count > 0
+
+
+def test_seeded_embedding_store_skips_the_model(indexing, s3, tmp_path):
+	from src.cli.embedding_store import CachedEmbeddings, EmbeddingStore
+
+	create_vector_store, client, embeddings = indexing
+	path = write_pdf(tmp_path / "edital.pdf", edital(1))
+	s3.upload_file(str(path), "editais", "cnu/edital.pdf")
+
+	# Warm a store the way the CLI does and export it as the image seed.
+	docs = list(create_vector_store.get_documents_from_pdf("editais", "cnu/edital.pdf"))
+	warm = CachedEmbeddings(
+		CountingEmbeddings(size=16, calls=[]),
+		EmbeddingStore(str(tmp_path / "cli.sqlite3")),
+		EMBEDDING_MODEL,
+	)
+	warm.embed_documents([doc.page_content for doc in docs])
+	warm.store.export(str(tmp_path / "seed.sqlite3"))
+
+	stats = index(create_vector_store, "cnu/edital.pdf")
+
+	assert embeddings.calls == []
+	assert stats["embedding_store_hits"] == stats["upserted"]
+	assert client.count("cnu").count == len({doc.page_content for doc in docs})
+
+
+def test_handler_init_defers_heavy_imports():
+	loaded = subprocess.run(
+		[
+			sys.executable,
+			"-c",
+			"import json, sys; import main; "
+			"print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))",
+		],
+		cwd=LAMBDA_SRC,
+		capture_output=True,
+		text=True,
+		check=True,
+	)
+	modules = set(json.loads(loaded.stdout))
+	assert "boto3" in modules
+	assert not modules & {"langchain", "langchain_community", "langchain_core", "pypdf"}
+	assert "qdrant_client" not in modules
+
+
+def test_clients_are_reused_across_invocations(indexing, s3, tmp_path):
+	create_vector_store, _, _ = indexing
+	utils = importlib.import_module("utils")
+	s3.upload_file(str(write_pdf(tmp_path / "edital.pdf", edital(1))), "editais", "edital.pdf")
+
+	index(create_vector_store, "edital.pdf")
+	store = create_vector_store.get_embedding_store()
+	index(create_vector_store, "edital.pdf")
+
+	assert create_vector_store.get_embedding_store() is store
+	embeddings = utils.get_bedrock_embeddings(EMBEDDING_MODEL, region_name="us-east-1")
+	assert utils.get_bedrock_embeddings(EMBEDDING_MODEL, region_name="us-east-1") is embeddings
+	assert embeddings.client is utils.get_bedrock_runtime("us-east-1")
@@ -0,0 +1,66 @@
+import pytest
+from qdrant_client import QdrantClient
+
+from src.cli.embedding_store import CachedEmbeddings, EmbeddingStore, text_hash
+from src.cli.ingest import IngestionEngine
+from tests.test_ingest import CountingEmbeddings
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def test_text_hash_ignores_whitespace_and_unicode_form():
+	assert text_hash("Edital  do\nconcurso") == text_hash("Edital do concurso")
+	assert text_hash("inscrição") == text_hash("inscrição")
+	assert text_hash("Edital") != text_hash("edital")
+
+
+def test_store_keeps_embeddings_per_model(tmp_path):
+	store = EmbeddingStore(str(tmp_path / "store.sqlite3"))
+	store.put_many(MODEL, ["prova", "edital"], [[0.5, 1.0], [0.25, -2.0]])
+
+	assert store.get_many(MODEL, ["edital", "inscricao", "prova"]) == [
+		[0.25, -2.0],
+		None,
+		[0.5, 1.0],
+	]
+	assert store.get_many("amazon.titan-embed-text-v1", ["prova"]) == [None]
+	store.close()
+
+	reopened = EmbeddingStore(str(tmp_path / "store.sqlite3"))
+	assert reopened.stats() == {MODEL: 2}
+
+
+def test_cached_embeddings_only_embed_misses(tmp_path):
+	model = CountingEmbeddings(size=16, calls=[])
+	embeddings = CachedEmbeddings(model, EmbeddingStore(str(tmp_path / "store.sqlite3")), MODEL)
+
+	first = embeddings.embed_documents(["prova", "edital", "prova"])
+	second = embeddings.embed_documents(["edital", "inscricao", "prova"])
+
+	assert model.calls == [2, 1]
+	assert second[0] == pytest.approx(first[1]) and second[2] == pytest.approx(first[0])
+	assert (embeddings.hits, embeddings.misses) == (2, 4)
+
+
+def test_export_and_import(tmp_path):
+	store = EmbeddingStore(str(tmp_path / "store.sqlite3"))
+	store.put_many(MODEL, ["prova", "edital"], [[1.0], [2.0]])
+	store.export(str(tmp_path / "export" / "seed.sqlite3"))
+
+	other = EmbeddingStore(str(tmp_path / "other.sqlite3"))
+	other.put_many(MODEL, ["prova"], [[3.0]])
+	assert other.import_from(str(tmp_path / "export" / "seed.sqlite3")) == 1
+	assert other.get_many(MODEL, ["prova", "edital"]) == [[3.0], [2.0]]
+
+
+def test_rebuilding_a_collection_reuses_the_store(pdf_dir, tmp_path):
+	model = CountingEmbeddings(size=16, calls=[])
+	embeddings = CachedEmbeddings(model, EmbeddingStore(str(tmp_path / "store.sqlite3")), MODEL)
+	paths = sorted(str(path) for path in pdf_dir.glob("*.pdf"))
+
+	for collection in ("cnu", "cnu_rebuilt"):
+		engine = IngestionEngine(QdrantClient(":memory:"), collection, embeddings, parse_workers=1)
+		stats = engine.run(paths)
+
+	assert sum(model.calls) == embeddings.misses == stats.chunks_upserted
+	assert embeddings.hits == stats.chunks_upserted
@@ -0,0 +1,119 @@
+import sys
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+
+from src.cli.embedding_store import CachedEmbeddings, EmbeddingStore
+from src.cli.hf_embeddings import LocalEmbeddings
+from src.cli.ingest import IngestionEngine
+
+MODEL = "BAAI/bge-small-en"
+TEXTS = ["prova", "edital do concurso unificado", "cnu", "inscricoes abertas em janeiro", "vaga"]
+
+
+class FakeSentenceTransformer:
+	"""Stands in for sentence_transformers.SentenceTransformer."""
+
+	def __init__(self, dimension=4):
+		self.dimension = dimension
+		self.batches = []
+		self.pools = []
+
+	def vector(self, text):
+		return [len(text), text.count(" "), ord(text[0]), 1.0][: self.dimension]
+
+	def encode(self, sentences, batch_size, convert_to_numpy, normalize_embeddings, **kwargs):
+		assert convert_to_numpy and batch_size == len(sentences)
+		self.batches.append(list(sentences))
+		return np.array([self.vector(text) for text in sentences], dtype=np.float32)
+
+	def start_multi_process_pool(self, target_devices):
+		self.pools.append(target_devices)
+		return {"devices": target_devices}
+
+	def encode_multi_process(self, sentences, pool, batch_size, chunk_size, **kwargs):
+		for start in range(0, len(sentences), chunk_size):
+			self.batches.append(list(sentences[start : start + chunk_size]))
+		return np.array([self.vector(text) for text in sentences], dtype=np.float32)
+
+	def stop_multi_process_pool(self, pool):
+		self.pools.remove(pool["devices"])
+
+
+def test_embeddings_keep_input_order_and_batch_by_length():
+	model = FakeSentenceTransformer()
+	embeddings = LocalEmbeddings(MODEL, batch_size=2, model=model)
+
+	vectors = embeddings.embed_documents(TEXTS)
+
+	assert isinstance(vectors, np.ndarray) and vectors.dtype == np.float32
+	np.testing.assert_array_equal(vectors, [model.vector(text) for text in TEXTS])
+	assert model.batches == [
+		["inscricoes abertas em janeiro", "edital do concurso unificado"],
+		["prova", "vaga"],
+		["cnu"],
+	]
+	assert embeddings.embed_query("cnu") == model.vector("cnu")
+
+
+def test_float16_output():
+	embeddings = LocalEmbeddings(MODEL, dtype="float16", model=FakeSentenceTransformer())
+	assert embeddings.embed_documents(TEXTS).dtype == np.float16
+
+
+def test_multi_process_shards_sorted_texts():
+	model = FakeSentenceTransformer()
+	embeddings = LocalEmbeddings(MODEL, batch_size=1, processes=2, model=model)
+
+	vectors = embeddings.embed_documents(TEXTS)
+	embeddings.embed_documents(TEXTS)
+
+	np.testing.assert_array_equal(vectors, [model.vector(text) for text in TEXTS])
+	assert model.pools == [["cpu", "cpu"]]
+	assert [len(batch) for batch in model.batches[:2]] == [3, 2]
+	embeddings.close()
+	assert model.pools == []
+
+
+def test_invalid_options():
+	with pytest.raises(ValueError, match="backend"):
+		LocalEmbeddings(MODEL, backend="tensorrt")
+	with pytest.raises(ValueError, match="dtype"):
+		LocalEmbeddings(MODEL, dtype="int8")
+
+
+def test_missing_sentence_transformers(monkeypatch):
+	monkeypatch.setitem(sys.modules, "sentence_transformers", None)
+	with pytest.raises(ImportError, match="pip install sentence-transformers"):
+		LocalEmbeddings(MODEL).embed_documents(TEXTS)
+
+
+def test_cache_key_depends_on_backend_dtype_and_normalize():
+	keys = {
+		LocalEmbeddings(MODEL, **options).cache_key
+		for options in (
+			{},
+			{"backend": "onnx"},
+			{"backend": "onnx-int8"},
+			{"dtype": "float16"},
+			{"normalize": True},
+		)
+	}
+	assert len(keys) == 5
+	assert LocalEmbeddings(MODEL, batch_size=8).cache_key == LocalEmbeddings(MODEL).cache_key
+
+
+def test_ingestion_with_numpy_embeddings(pdf_dir, tmp_path):
+	local = LocalEmbeddings(MODEL, dtype="float16", model=FakeSentenceTransformer())
+	embeddings = CachedEmbeddings(
+		local, EmbeddingStore(str(tmp_path / "store.sqlite3")), local.cache_key
+	)
+	client = QdrantClient(":memory:")
+	paths = sorted(str(path) for path in pdf_dir.glob("*.pdf"))
+
+	stats = IngestionEngine(client, "cnu", embeddings, parse_workers=1).run(paths)
+
+	assert client.count("cnu").count == stats.chunks_upserted > 0
+	point = client.scroll("cnu", limit=1, with_vectors=True)[0][0]
+	assert len(point.vector) == 4
@@ -0,0 +1,155 @@
+import pytest
+from langchain_community.embeddings.fake import DeterministicFakeEmbedding
+from langchain_community.vectorstores.qdrant import Qdrant
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from src.cli.ingest import IngestionEngine, load_and_split
+from tests.conftest import write_pdf
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+	calls: list = []
+
+	def embed_documents(self, texts):
+		self.calls.append(len(texts))
+		return super().embed_documents(texts)
+
+
+class FailingEmbeddings(DeterministicFakeEmbedding):
+	def embed_documents(self, texts):
+		raise RuntimeError("ThrottlingException")
+
+
+def test_ingestion_engine_indexes_every_chunk(pdf_dir):
+	paths = sorted(str(path) for path in pdf_dir.glob("*.pdf"))
+	expected = sum(len(load_and_split(path)) for path in paths)
+	client = QdrantClient(":memory:")
+	progress = []
+
+	engine = IngestionEngine(
+		client=client,
+		collection_name="cnu",
+		embeddings=DeterministicFakeEmbedding(size=16),
+		parse_workers=2,
+		embed_workers=3,
+		embed_batch_size=4,
+		upsert_batch_size=8,
+		queue_size=2,
+		progress=progress.append,
+	)
+	stats = engine.run(paths)
+
+	assert stats.files_parsed == 3
+	assert stats.chunks == stats.chunks_embedded == stats.chunks_upserted == expected
+	assert client.count("cnu").count == expected
+	assert progress and progress[-1].chunks_upserted == expected
+
+	point = client.scroll("cnu", limit=1)[0][0]
+	assert point.payload["metadata"]["source"] in paths
+	assert point.payload["page_content"]
+
+
+def test_ingestion_engine_stops_on_embedding_errors(pdf_dir):
+	paths = [str(path) for path in pdf_dir.glob("*.pdf")]
+	engine = IngestionEngine(
+		client=QdrantClient(":memory:"),
+		collection_name="cnu",
+		embeddings=FailingEmbeddings(size=16),
+		parse_workers=1,
+		queue_size=1,
+	)
+	with pytest.raises(RuntimeError, match="ThrottlingException"):
+		engine.run(paths)
+
+
+def test_ingestion_engine_reindexes_incrementally(tmp_path):
+	def edital(version):
+		return [
+			"\n".join(
+				f"Edital versao {version if page == 0 else 1} pagina {page} item {line}."
+				for line in range(40)
+			)
+			for page in range(3)
+		]
+
+	path = str(write_pdf(tmp_path / "edital.pdf", edital(1)))
+	client = QdrantClient(":memory:")
+
+	def ingest():
+		embeddings = CountingEmbeddings(size=16, calls=[])
+		engine = IngestionEngine(client, "cnu", embeddings, parse_workers=1, embed_batch_size=4)
+		return engine.run([path]), sum(embeddings.calls)
+
+	stats, embedded = ingest()
+	total = client.count("cnu").count
+	assert embedded == stats.chunks_upserted == total
+
+	stats, embedded = ingest()
+	assert embedded == 0
+	assert stats.chunks_skipped == total
+	assert client.count("cnu").count == total
+
+	write_pdf(tmp_path / "edital.pdf", edital(2))
+	stats, embedded = ingest()
+	assert 0 < embedded < total
+	assert stats.chunks_deleted == embedded
+	assert client.count("cnu").count == total
+
+
+def test_ingestion_engine_keeps_documents_of_the_same_name_apart(tmp_path):
+	paths = []
+	for folder in ("a", "b"):
+		(tmp_path / folder).mkdir()
+		pages = [f"Edital {folder} pagina {page} item da prova objetiva." for page in range(3)]
+		paths.append(str(write_pdf(tmp_path / folder / "edital.pdf", pages)))
+	client = QdrantClient(":memory:")
+
+	def ingest(paths):
+		embeddings = DeterministicFakeEmbedding(size=16)
+		engine = IngestionEngine(
+			client, "cnu", embeddings, parse_workers=1, documents_dir=str(tmp_path)
+		)
+		return engine.run(paths)
+
+	total = ingest(paths).chunks_upserted
+	assert ingest(paths[:1]).chunks_deleted == 0
+	points = client.scroll("cnu", limit=100)[0]
+	assert len(points) == total
+	assert {point.payload["metadata"]["document"] for point in points} == {
+		"a/edital.pdf",
+		"b/edital.pdf",
+	}
+
+
+def test_ingestion_engine_replaces_points_without_content_hash_ids(tmp_path):
+	pages = [
+		"\n".join(f"Edital pagina {page} item {line}." for line in range(40)) for page in range(3)
+	]
+	path = str(write_pdf(tmp_path / "edital.pdf", pages))
+	# What `create` stored before point ids were content hashes.
+	legacy = Qdrant.from_documents(
+		[
+			Document(page_content=text, metadata={"source": source, "page": page})
+			for source in ("documents/cnu/edital.pdf", "documents/cnu/outro.pdf")
+			for page, text in enumerate(pages)
+		],
+		DeterministicFakeEmbedding(size=16),
+		location=":memory:",
+		collection_name="cnu",
+	)
+	client = legacy.client
+
+	engine = IngestionEngine(client, "cnu", CountingEmbeddings(size=16, calls=[]), parse_workers=1)
+	stats = engine.run([path])
+
+	assert stats.chunks_deleted == 3
+	without_document = models.Filter(
+		must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="metadata.document"))]
+	)
+	remaining = client.scroll("cnu", scroll_filter=without_document, limit=100)[0]
+	assert {point.payload["metadata"]["source"] for point in remaining} == {
+		"documents/cnu/outro.pdf"
+	}
+	assert client.count("cnu").count == stats.chunks_upserted + 3
@@ -0,0 +1,98 @@
+from langchain_community.embeddings.fake import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+
+from src.cli import loader
+from src.cli.ingest import IngestionEngine
+from src.cli.loader import ParseCache, detect_file_type, iter_pages, list_files
+from tests.conftest import write_pdf
+
+
+def test_detects_pdfs_by_content(tmp_path):
+	path = write_pdf(tmp_path / "edital.txt", ["Edital do concurso."])
+	assert detect_file_type(str(path)) == "pdf"
+	assert [page.page_content.strip() for page in iter_pages(str(path))] == ["Edital do concurso."]
+
+
+def test_parses_text_files(tmp_path):
+	path = tmp_path / "notes.md"
+	path.write_text("Cronograma das provas.", encoding="utf-8")
+	assert detect_file_type(str(path)) == "txt"
+	pages = list(iter_pages(str(path)))
+	assert [page.page_content for page in pages] == ["Cronograma das provas."]
+	assert pages[0].metadata == {"source": str(path), "page": 0}
+
+
+def test_skips_unsupported_files(tmp_path):
+	path = tmp_path / "logo.png"
+	path.write_bytes(b"\x89PNG\r\n\x1a\n")
+	stats = loader.FileStats(str(path))
+	assert list(iter_pages(str(path), stats=stats)) == []
+	assert stats.file_type is None
+
+
+def test_lists_the_files_of_subdirectories(tmp_path):
+	write_pdf(tmp_path / "edital.pdf", ["Edital do concurso."])
+	(tmp_path / "anexos").mkdir()
+	write_pdf(tmp_path / "anexos" / "anexo-1.pdf", ["Anexo do edital."])
+	(tmp_path / "anexos" / "vazio").mkdir()
+	assert list_files(str(tmp_path)) == [
+		str(tmp_path / "anexos" / "anexo-1.pdf"),
+		str(tmp_path / "edital.pdf"),
+	]
+
+	stats = loader.FileStats(str(tmp_path / "anexos"))
+	assert list(iter_pages(str(tmp_path / "anexos"), stats=stats)) == []
+	assert stats.file_type is None
+
+
+def test_second_parse_comes_from_the_cache(tmp_path, monkeypatch):
+	path = str(write_pdf(tmp_path / "edital.pdf", ["Pagina um.", "Pagina dois."]))
+	cache = ParseCache(str(tmp_path / "parsed"))
+	first = loader.FileStats(path)
+	texts = [page.page_content for page in iter_pages(path, cache, first)]
+	assert not first.cached and first.pages == 2
+
+	def fail(path):
+		raise AssertionError("parsed again")
+
+	monkeypatch.setitem(loader.PARSERS, "pdf", (fail, 1))
+	second = loader.FileStats(path)
+	assert [page.page_content for page in iter_pages(path, cache, second)] == texts
+	assert second.cached and second.pages == 2
+
+
+def test_parser_version_invalidates_the_cache(tmp_path, monkeypatch):
+	path = str(write_pdf(tmp_path / "edital.pdf", ["Pagina um."]))
+	cache = ParseCache(str(tmp_path / "parsed"))
+	list(iter_pages(path, cache))
+
+	monkeypatch.setitem(loader.PARSERS, "pdf", (lambda path: iter(["Novo parser."]), 2))
+	stats = loader.FileStats(path)
+	assert [page.page_content for page in iter_pages(path, cache, stats)] == ["Novo parser."]
+	assert not stats.cached
+
+
+def test_ingestion_engine_reports_every_file(tmp_path):
+	write_pdf(tmp_path / "edital.txt", ["Edital do concurso publico nacional."])
+	(tmp_path / "notes.txt").write_text("Cronograma das provas.", encoding="utf-8")
+	(tmp_path / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+	paths = sorted(str(path) for path in tmp_path.iterdir())
+
+	def ingest():
+		return IngestionEngine(
+			client=QdrantClient(":memory:"),
+			collection_name="cnu",
+			embeddings=DeterministicFakeEmbedding(size=16),
+			parse_workers=1,
+			parse_cache_dir=str(tmp_path / "parsed"),
+		).run(paths)
+
+	stats = ingest()
+	files = {file.path: file for file in stats.file_stats}
+	assert stats.files_parsed == 3 and stats.files_skipped == 1 and stats.files_cached == 0
+	assert files[str(tmp_path / "edital.txt")].file_type == "pdf"
+	assert files[str(tmp_path / "notes.txt")].file_type == "txt"
+	assert stats.chunks == 2
+
+	stats = ingest()
+	assert stats.files_cached == 2
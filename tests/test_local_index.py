@@ -0,0 +1,108 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from langchain_community.embeddings.fake import DeterministicFakeEmbedding
+from langchain_community.vectorstores.qdrant import Qdrant
+
+from src.app import main
+from src.app.cache import AnswerCache
+from src.app.local_index import LocalIndex, compare_latency, export_snapshot
+from tests.test_pipeline import TEXTS, make_pipeline
+
+CHUNKS = [f"Item {number} do edital, paragrafo {number % 7}." for number in range(300)]
+
+
+@pytest.fixture
+def collection():
+	embeddings = DeterministicFakeEmbedding(size=32)
+	return Qdrant.from_texts(
+		CHUNKS, embeddings, location=":memory:", collection_name=main.COLLECTION_NAME
+	).client
+
+
+def queries(count=50, size=32):
+	return np.random.default_rng(0).normal(size=(count, size)).tolist()
+
+
+def test_same_results_as_the_collection(collection, tmp_path):
+	manifest = export_snapshot(collection, main.COLLECTION_NAME, str(tmp_path))
+	assert manifest["points"] == len(CHUNKS) and manifest["distance"] == "Cosine"
+	index = LocalIndex(str(tmp_path))
+	assert index.reload() and len(index) == len(CHUNKS)
+
+	vectors = queries()
+	batches = index.search_batch(vectors, 5)
+	for vector, batch in zip(vectors, batches):
+		remote = collection.search(main.COLLECTION_NAME, query_vector=vector, limit=5)
+		local = index.search(vector, 5)
+		assert [point.id for point in local] == [point.id for point in remote]
+		assert [point.score for point in local] == pytest.approx(
+			[point.score for point in remote], abs=1e-5
+		)
+		assert [point.payload for point in local] == [point.payload for point in remote]
+		assert [point.id for point in batch] == [point.id for point in local]
+
+	report = compare_latency(collection, main.COLLECTION_NAME, index, vectors[:10])
+	assert report["agreement"]["same_ids"] == 1.0
+	assert report["local"]["median_ms"] > 0
+
+
+def test_vectors_sample_has_no_repeats(collection, tmp_path):
+	export_snapshot(collection, main.COLLECTION_NAME, str(tmp_path))
+	index = LocalIndex(str(tmp_path))
+	index.reload()
+	sample = index.vectors_sample(len(CHUNKS) * 2, np.random.default_rng(0))
+	assert len(np.unique(sample, axis=0)) == len(sample) == len(CHUNKS)
+
+
+def test_reload_picks_up_new_snapshots(collection, tmp_path):
+	export_snapshot(collection, main.COLLECTION_NAME, str(tmp_path))
+	index = LocalIndex(str(tmp_path))
+	index.reload()
+	first = index.version
+	assert not index.reload()
+
+	for _ in range(2):
+		export_snapshot(collection, main.COLLECTION_NAME, str(tmp_path))
+	assert index.reload() and index.version != first
+	# The files of the latest snapshot and of the previous one are kept.
+	assert len([name for name in os.listdir(tmp_path) if name.endswith(".npy")]) == 2
+
+
+def test_pipeline_searches_the_local_index(tmp_path):
+	pipeline = make_pipeline(answer_cache=AnswerCache(threshold=0.95))
+	export_snapshot(pipeline.client, main.COLLECTION_NAME, str(tmp_path))
+	remote = asyncio.run(pipeline.retrieve(TEXTS[0]))[1]
+
+	def unreachable(*args, **kwargs):
+		raise ConnectionError("Qdrant is unreachable")
+
+	pipeline.client.search = pipeline.client.search_batch = unreachable
+	pipeline.local_index = LocalIndex(str(tmp_path))
+	pipeline.local_index.reload()
+	embedding, docs = asyncio.run(pipeline.retrieve(TEXTS[0]))
+	assert [doc.metadata["_id"] for doc in docs] == [doc.metadata["_id"] for doc in remote]
+	assert [doc.page_content for doc in docs] == [doc.page_content for doc in remote]
+	assert asyncio.run(pipeline.ask(TEXTS[0])) == "answer"
+	assert len(asyncio.run(pipeline.search_batch([embedding, embedding]))) == 2
+
+
+def test_watcher_reloads_and_invalidates_the_answer_cache(tmp_path):
+	pipeline = make_pipeline(answer_cache=AnswerCache(threshold=0.95))
+	export_snapshot(pipeline.client, main.COLLECTION_NAME, str(tmp_path))
+	pipeline.local_index = LocalIndex(str(tmp_path))
+	pipeline.local_index.reload()
+
+	async def run():
+		await pipeline.ask(TEXTS[0])
+		watcher = asyncio.create_task(pipeline.watch_local_index(interval=0.01))
+		await asyncio.sleep(0.05)
+		export_snapshot(pipeline.client, main.COLLECTION_NAME, str(tmp_path))
+		await asyncio.sleep(0.1)
+		watcher.cancel()
+		await pipeline.ask(TEXTS[0])
+
+	asyncio.run(run())
+	assert len(pipeline.llm.calls) == 2
@@ -12,6 +12,7 @@ def test_root_endpoint():
 
 
 def test_question_endpoint():
-	response = client.post("/ask", json={"text": "What is AWS?", "temperature": 0.5})
+	with TestClient(app) as client:
+		response = client.post("/ask", json={"text": "What is AWS?", "temperature": 0.5})
 	assert response.status_code == 200
 	assert "answer" in response.json()
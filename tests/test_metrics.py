@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+
+from src.app import main
+from src.app.metrics import Timings, estimate_tokens
+from tests.test_pipeline import TEXTS, make_pipeline
+
+
+def test_server_timing_format():
+	timings = Timings()
+	timings.record("vector_search", 0.0123)
+	timings.record("llm_generation", 1.5)
+	assert timings.server_timing() == "vector_search;dur=12.3, llm_generation;dur=1500.0"
+
+
+def test_estimate_tokens():
+	assert estimate_tokens("") == 0
+	assert estimate_tokens("a" * 400) == 100
+
+
+def test_ask_reports_stage_timings(monkeypatch):
+	async def build_pipeline():
+		return make_pipeline()
+
+	monkeypatch.setattr(main, "build_pipeline", build_pipeline)
+	with TestClient(main.app) as client:
+		response = client.post("/ask", json={"text": TEXTS[0]})
+		metrics = client.get("/metrics")
+
+	stages = [item.split(";")[0] for item in response.headers["server-timing"].split(", ")]
+	assert stages == [
+		"query_embedding",
+		"vector_search",
+		"prompt_assembly",
+		"llm_generation",
+		"serialization",
+	]
+
+	assert metrics.status_code == 200
+	assert 'qa_stage_duration_seconds_count{stage="llm_generation"}' in metrics.text
+	assert "qa_retrieved_chunks_count" in metrics.text
+	assert "qa_prompt_tokens_sum" in metrics.text
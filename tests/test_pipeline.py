@@ -0,0 +1,241 @@
+import asyncio
+import json
+import time
+from typing import Any, List, Optional
+
+from fastapi.testclient import TestClient
+from langchain.prompts import PromptTemplate
+from langchain_community.embeddings.fake import DeterministicFakeEmbedding
+from langchain_community.vectorstores.qdrant import Qdrant
+from langchain_core.language_models.llms import LLM
+
+from src.app import main
+from src.app.admission import AdmissionController
+from src.app.cache import AnswerCache
+from src.app.pipeline import QAPipeline
+
+TEXTS = [
+	"A prova objetiva sera aplicada no dia 5 de maio.",
+	"As inscricoes vao de 19 de janeiro a 9 de fevereiro.",
+	"A taxa de inscricao e de 60 reais para nivel superior.",
+]
+
+
+class RecordingLLM(LLM):
+	"""Fake LLM that records the prompts and per-call settings it receives."""
+
+	calls: List[dict] = []
+
+	@property
+	def _llm_type(self) -> str:
+		return "recording"
+
+	def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+		self.calls.append({"prompt": prompt, **kwargs})
+		return "answer"
+
+
+class SlowLLM(RecordingLLM):
+	"""Fake LLM that blocks like a synchronous Bedrock invoke."""
+
+	def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+		time.sleep(0.3)
+		return super()._call(prompt, stop, run_manager, **kwargs)
+
+
+def make_pipeline(llm=None, **kwargs) -> QAPipeline:
+	embeddings = DeterministicFakeEmbedding(size=16)
+	vectorstore = Qdrant.from_texts(
+		TEXTS, embeddings, location=":memory:", collection_name=main.COLLECTION_NAME
+	)
+	return QAPipeline(
+		client=vectorstore.client,
+		async_client=None,
+		embeddings=embeddings,
+		llm=llm or RecordingLLM(calls=[]),
+		prompt=PromptTemplate(
+			template=main.prompt_template, input_variables=["context", "question"]
+		),
+		collection_name=main.COLLECTION_NAME,
+		inference_modifier=main.inference_modifier,
+		**kwargs,
+	)
+
+
+def test_pipeline_applies_temperature_per_request():
+	pipeline = make_pipeline()
+	asyncio.run(pipeline.ask(TEXTS[0], temperature=0.1))
+	asyncio.run(pipeline.ask(TEXTS[0], temperature=0.9))
+
+	assert [call["temperature"] for call in pipeline.llm.calls] == [0.1, 0.9]
+	assert TEXTS[0] in pipeline.llm.calls[0]["prompt"]
+
+
+def test_lifespan_builds_pipeline_once(monkeypatch):
+	built = []
+
+	async def build_pipeline():
+		built.append(make_pipeline())
+		return built[-1]
+
+	monkeypatch.setattr(main, "build_pipeline", build_pipeline)
+	with TestClient(main.app) as client:
+		for _ in range(3):
+			response = client.post("/ask", json={"text": TEXTS[1], "temperature": 0.2})
+			assert response.status_code == 200
+			assert response.json()["answer"] == "answer"
+		response = client.get("/collectioninfo")
+		assert response.status_code == 200
+
+	assert len(built) == 1
+	assert len(built[0].llm.calls) == 3
+	assert main.app.state.pipeline is None
+
+
+def test_ask_without_pipeline_returns_503():
+	client = TestClient(main.app)
+	response = client.post("/ask", json={"text": TEXTS[0]})
+	assert response.status_code == 503
+
+
+def test_blocking_llm_calls_do_not_serialize_requests():
+	pipeline = make_pipeline(SlowLLM(calls=[]))
+
+	async def run():
+		start = time.perf_counter()
+		questions = [f"{text} ({i})" for i, text in enumerate(TEXTS * 3)]
+		answers = await asyncio.gather(*[pipeline.ask(question) for question in questions])
+		return answers, time.perf_counter() - start
+
+	answers, elapsed = asyncio.run(run())
+	assert answers == ["answer"] * 9
+	# Nine sequential 0.3s calls would take 2.7s.
+	assert elapsed < 1.5
+
+
+def test_answer_cache_skips_llm_for_repeated_questions():
+	pipeline = make_pipeline(answer_cache=AnswerCache(threshold=0.95))
+
+	async def run():
+		await pipeline.ask(TEXTS[0], temperature=0.5)
+		await pipeline.ask(TEXTS[0], temperature=0.52)
+		await pipeline.ask(TEXTS[0], temperature=0.9)
+
+	asyncio.run(run())
+	assert len(pipeline.llm.calls) == 2
+	assert pipeline.answer_cache.stats()["hits"] == 1
+
+
+def test_ask_batch_searches_once_per_batch_and_tags_results():
+	pipeline = make_pipeline(SlowLLM(calls=[]))
+	searches = []
+	search_batch = pipeline.search_batch
+
+	async def counting_search_batch(embeddings):
+		searches.append(len(embeddings))
+		return await search_batch(embeddings)
+
+	pipeline.search_batch = counting_search_batch
+	questions = [f"{text} ({i})" for i, text in enumerate(TEXTS * 4)]
+
+	async def run():
+		start = time.perf_counter()
+		results = [r async for r in pipeline.ask_batch(questions, batch_size=5, concurrency=12)]
+		return results, time.perf_counter() - start
+
+	results, elapsed = asyncio.run(run())
+	assert sorted(result["index"] for result in results) == list(range(12))
+	assert all(result["answer"] == "answer" for result in results)
+	assert searches == [5, 5, 2]
+	# Twelve sequential 0.3s calls would take 3.6s.
+	assert elapsed < 1.5
+
+
+def test_ask_batch_stays_within_the_embedding_admission_queue():
+	class SlowEmbedding(DeterministicFakeEmbedding):
+		def embed_documents(self, texts):
+			time.sleep(0.02)
+			return super().embed_documents(texts)
+
+	limiter = AdmissionController("embedding", max_concurrency=2, max_queue=2)
+	pipeline = make_pipeline(embedding_limiter=limiter)
+	pipeline.embeddings = SlowEmbedding(size=16)
+	# Ten times more batches than the limiter admits at once.
+	questions = [f"{TEXTS[i % 3]} ({i})" for i in range(10 * (2 + 2) * 3)]
+
+	async def run():
+		return [r async for r in pipeline.ask_batch(questions, batch_size=3, concurrency=4)]
+
+	results = asyncio.run(run())
+	assert [result for result in results if "error" in result] == []
+	assert sorted(result["index"] for result in results) == list(range(len(questions)))
+	assert limiter.rejected == 0
+
+
+def test_cache_invalidation_needs_the_admin_key(monkeypatch):
+	pipeline = make_pipeline(answer_cache=AnswerCache(threshold=0.95))
+
+	async def build_pipeline():
+		return pipeline
+
+	monkeypatch.setattr(main, "build_pipeline", build_pipeline)
+	monkeypatch.setenv("ADMIN_API_KEY", "secret")
+	with TestClient(main.app) as client:
+		assert client.post("/ask", json={"text": TEXTS[0]}).status_code == 200
+		for headers in [{}, {"X-API-Key": "wrong"}]:
+			response = client.post("/cache/invalidate", headers=headers)
+			assert response.status_code == 401
+		assert pipeline.answer_cache.stats()["size"] == 1
+
+		response = client.post("/cache/invalidate", headers={"X-API-Key": "secret"})
+		assert response.json() == {"invalidated": True}
+		assert pipeline.answer_cache.stats()["size"] == 0
+
+
+def test_ask_batch_endpoint_streams_ndjson(monkeypatch):
+	async def build_pipeline():
+		return make_pipeline()
+
+	monkeypatch.setattr(main, "build_pipeline", build_pipeline)
+	with TestClient(main.app) as client:
+		response = client.post("/ask/batch", json={"questions": TEXTS})
+
+	assert response.headers["content-type"].startswith("application/x-ndjson")
+	lines = [json.loads(line) for line in response.text.splitlines()]
+	assert sorted(line["index"] for line in lines) == [0, 1, 2]
+
+
+def test_identical_concurrent_questions_share_one_execution():
+	pipeline = make_pipeline(SlowLLM(calls=[]))
+
+	async def run():
+		return await asyncio.gather(
+			*[pipeline.ask(TEXTS[0]) for _ in range(5)],
+			pipeline.ask(f"  {TEXTS[0].upper()} "),
+			pipeline.ask(TEXTS[0], temperature=0.9),
+		)
+
+	assert asyncio.run(run()) == ["answer"] * 7
+	assert len(pipeline.llm.calls) == 2
+	assert pipeline.single_flight.coalesced == 5
+
+
+def test_search_params_come_from_the_environment(monkeypatch):
+	monkeypatch.delenv("QDRANT_RESCORE", raising=False)
+	monkeypatch.delenv("QDRANT_OVERSAMPLING", raising=False)
+	monkeypatch.delenv("QDRANT_HNSW_EF", raising=False)
+	assert main.build_search_params() is None
+
+	monkeypatch.setenv("QDRANT_HNSW_EF", "64")
+	params = main.build_search_params()
+	assert params.hnsw_ef == 64 and params.quantization is None
+
+	monkeypatch.setenv("QDRANT_RESCORE", "true")
+	monkeypatch.setenv("QDRANT_OVERSAMPLING", "2")
+	params = main.build_search_params()
+	assert params.quantization.rescore and params.quantization.oversampling == 2.0
+
+	pipeline = make_pipeline(search_params=params)
+	docs = asyncio.run(pipeline.retrieve(TEXTS[0]))[1]
+	assert len(docs) == 2
+	assert len(asyncio.run(pipeline.search_batch([[0.1] * 16]))[0]) == 2
@@ -0,0 +1,92 @@
+import pytest
+from langchain_community.embeddings.fake import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from src.cli.ingest import IngestionEngine
+from src.cli.quantization import (
+	measure_recall,
+	memory_footprint,
+	quantization_config,
+	quantization_kind,
+	sample_queries,
+	search_params,
+)
+
+
+@pytest.mark.parametrize("kind", ["scalar", "product", "binary"])
+def test_quantization_config(kind):
+	config = quantization_config(kind)
+	assert quantization_kind(config) == kind
+	assert getattr(config, kind).always_ram
+
+
+def test_no_quantization():
+	assert quantization_config("none") is None
+	assert quantization_kind(None) == "none"
+	with pytest.raises(ValueError):
+		quantization_config("int4")
+
+
+def test_memory_footprint_of_titan_vectors():
+	full = memory_footprint(10_000, 1536, on_disk=False, kind="none")
+	assert full["ram_mb"] == pytest.approx(58.6, abs=0.1)
+
+	scalar = memory_footprint(10_000, 1536, on_disk=True, kind="scalar")
+	assert scalar["ram_mb"] == pytest.approx(full["ram_mb"] / 4, abs=0.1)
+	binary = memory_footprint(10_000, 1536, on_disk=True, kind="binary")
+	assert binary["ram_mb"] == pytest.approx(full["ram_mb"] / 32, abs=0.1)
+	assert binary["disk_mb"] > full["ram_mb"]
+
+
+def test_engine_creates_quantized_on_disk_collection(pdf_dir, monkeypatch):
+	client = QdrantClient(":memory:")
+	created = []
+	create_collection = client.create_collection
+
+	def recording_create_collection(**kwargs):
+		created.append(kwargs)
+		return create_collection(**kwargs)
+
+	monkeypatch.setattr(client, "create_collection", recording_create_collection)
+	IngestionEngine(
+		client=client,
+		collection_name="cnu",
+		embeddings=DeterministicFakeEmbedding(size=16),
+		parse_workers=1,
+		quantization="scalar",
+		on_disk=True,
+		hnsw_m=32,
+	).run(sorted(str(path) for path in pdf_dir.glob("*.pdf")))
+
+	assert len(created) == 1
+	assert created[0]["vectors_config"].on_disk
+	assert created[0]["quantization_config"].scalar.type == models.ScalarType.INT8
+	assert created[0]["hnsw_config"].m == 32 and created[0]["hnsw_config"].ef_construct is None
+
+
+def test_recall_against_exact_search():
+	client = QdrantClient(":memory:")
+	client.create_collection(
+		"cnu", vectors_config=models.VectorParams(size=16, distance=models.Distance.COSINE)
+	)
+	embeddings = DeterministicFakeEmbedding(size=16)
+	client.upsert(
+		"cnu",
+		points=[
+			models.PointStruct(id=i, vector=embeddings.embed_query(f"chunk {i}"))
+			for i in range(200)
+		],
+	)
+	queries = sample_queries(client, "cnu", 20)
+	assert len({query_id for query_id, _ in queries}) == 20
+
+	report = measure_recall(
+		client,
+		"cnu",
+		queries,
+		5,
+		{"exact": search_params(exact=True), "rescore x2": search_params(True, 2.0)},
+	)
+	assert report["exact"]["recall"] == 1.0
+	assert report["rescore x2"]["recall"] == 1.0
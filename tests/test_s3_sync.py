@@ -0,0 +1,93 @@
+import io
+import os
+
+from boto3.s3.transfer import TransferConfig
+
+from src.cli.s3_sync import MANIFEST_FILE_NAME, MB, S3Sync, local_etag
+
+BUCKET = "editais"
+OBJECTS = 300
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=5 * MB, multipart_chunksize=5 * MB)
+
+
+def fill_bucket(s3):
+	"""Many small editais, one larger than the multipart threshold and a folder marker."""
+	s3.create_bucket(Bucket=BUCKET)
+	for number in range(OBJECTS):
+		s3.put_object(Bucket=BUCKET, Key=f"cnu/edital-{number}.pdf", Body=f"%PDF-{number}".encode())
+	large = os.urandom(11 * MB)
+	s3.upload_fileobj(io.BytesIO(large), BUCKET, "cnu/large.pdf", Config=TRANSFER_CONFIG)
+	s3.put_object(Bucket=BUCKET, Key="cnu/anexos/", Body=b"")
+	return large
+
+
+def sync(s3, tmp_path, **kwargs):
+	return S3Sync(
+		s3, BUCKET, str(tmp_path), prefix="cnu/", transfer_config=TRANSFER_CONFIG, **kwargs
+	)
+
+
+def test_downloads_every_object_then_skips_them(s3, tmp_path):
+	large = fill_bucket(s3)
+
+	stats = sync(s3, tmp_path, concurrency=8).run()
+	assert stats.objects == stats.downloaded == OBJECTS + 1
+	assert stats.failed == 0 and stats.mb_per_second > 0
+	assert (tmp_path / "edital-7.pdf").read_bytes() == b"%PDF-7"
+	assert (tmp_path / "large.pdf").read_bytes() == large
+	assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+	stats = sync(s3, tmp_path).run()
+	assert stats.skipped == OBJECTS + 1 and stats.downloaded == 0
+
+	s3.put_object(Bucket=BUCKET, Key="cnu/edital-7.pdf", Body=b"%PDF-retificado")
+	stats = sync(s3, tmp_path).run()
+	assert stats.downloaded == 1
+	assert (tmp_path / "edital-7.pdf").read_bytes() == b"%PDF-retificado"
+
+
+def test_compares_files_missing_from_the_manifest_by_etag(s3, tmp_path):
+	fill_bucket(s3)
+	sync(s3, tmp_path).run()
+	os.remove(tmp_path / MANIFEST_FILE_NAME)
+	(tmp_path / "edital-1.pdf").write_bytes(b"%PDF-X")
+
+	stats = sync(s3, tmp_path).run()
+	assert stats.downloaded == 1
+	assert (tmp_path / "edital-1.pdf").read_bytes() == b"%PDF-1"
+
+
+def test_resumes_an_interrupted_sync(s3, tmp_path, monkeypatch):
+	fill_bucket(s3)
+	download = S3Sync.download
+
+	def flaky(self, obj):
+		if obj.key.endswith("3.pdf"):
+			raise ConnectionError("connection reset")
+		return download(self, obj)
+
+	monkeypatch.setattr(S3Sync, "download", flaky)
+	stats = sync(s3, tmp_path).run()
+	assert stats.failed == OBJECTS // 10
+	assert stats.downloaded == OBJECTS + 1 - stats.failed
+	assert not (tmp_path / "edital-3.pdf").exists()
+
+	monkeypatch.setattr(S3Sync, "download", download)
+	stats = sync(s3, tmp_path).run()
+	assert stats.downloaded == OBJECTS // 10 and stats.failed == 0
+
+
+def test_local_etag_matches_s3(s3, tmp_path):
+	s3.create_bucket(Bucket=BUCKET)
+	path = tmp_path / "large.pdf"
+	path.write_bytes(os.urandom(11 * MB))
+	s3.upload_file(str(path), BUCKET, "large.pdf", Config=TRANSFER_CONFIG)
+	s3.put_object(Bucket=BUCKET, Key="small.pdf", Body=b"%PDF-1")
+
+	etag = s3.head_object(Bucket=BUCKET, Key="large.pdf")["ETag"].strip('"')
+	assert etag.endswith("-3")
+	assert local_etag(str(path), 3, 5 * MB) == etag
+	(tmp_path / "small.pdf").write_bytes(b"%PDF-1")
+	assert local_etag(str(tmp_path / "small.pdf")) == s3.head_object(
+		Bucket=BUCKET, Key="small.pdf"
+	)["ETag"].strip('"')
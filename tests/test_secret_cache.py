@@ -0,0 +1,114 @@
+import asyncio
+import threading
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from src.app import main
+
+
+@pytest.fixture
+def secretsmanager(monkeypatch):
+	monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+	monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+	monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+	monkeypatch.setattr(main, "session", boto3.Session(region_name=main.AWS_DEFAULT_REGION))
+	with mock_aws():
+		main.get_secrets_client.cache_clear()
+		client = boto3.client("secretsmanager", region_name=main.AWS_DEFAULT_REGION)
+		client.create_secret(Name="prod/qdrant_url", SecretString="http://qdrant:6333")
+		yield client
+	main.get_secrets_client.cache_clear()
+
+
+class CountingFetch:
+	"""Wraps get_secret and counts the Secrets Manager round trips."""
+
+	def __init__(self):
+		self.calls = 0
+		self.lock = threading.Lock()
+
+	def __call__(self, secret_name):
+		with self.lock:
+			self.calls += 1
+		return main.get_secret(secret_name)
+
+
+def test_secret_cache_serves_from_memory_when_fresh(secretsmanager):
+	fetch = CountingFetch()
+	cache = main.SecretCache(fetch=fetch, ttl=60)
+
+	async def run():
+		return [await cache.get("prod/qdrant_url") for _ in range(5)]
+
+	assert asyncio.run(run()) == ["http://qdrant:6333"] * 5
+	assert fetch.calls == 1
+
+
+def test_secret_cache_coalesces_concurrent_misses(secretsmanager):
+	fetch = CountingFetch()
+	cache = main.SecretCache(fetch=fetch, ttl=60)
+
+	async def run():
+		return await asyncio.gather(*[cache.get("prod/qdrant_url") for _ in range(20)])
+
+	assert set(asyncio.run(run())) == {"http://qdrant:6333"}
+	assert fetch.calls == 1
+
+
+def test_secret_cache_serves_stale_value_while_refreshing(secretsmanager):
+	fetch = CountingFetch()
+	cache = main.SecretCache(fetch=fetch, ttl=0, max_stale=60)
+
+	async def run():
+		first = await cache.get("prod/qdrant_url")
+		secretsmanager.put_secret_value(SecretId="prod/qdrant_url", SecretString="http://new:6333")
+		stale = await cache.get("prod/qdrant_url")
+		await asyncio.sleep(0.2)
+		return first, stale, cache._entries["prod/qdrant_url"][0]
+
+	first, stale, refreshed = asyncio.run(run())
+	assert first == stale == "http://qdrant:6333"
+	assert refreshed == "http://new:6333"
+	assert fetch.calls == 2
+
+
+def test_secret_cache_raises_missing_secret(secretsmanager):
+	cache = main.SecretCache(ttl=60)
+	with pytest.raises(Exception, match="ResourceNotFoundException"):
+		asyncio.run(cache.get("prod/missing"))
+
+
+def test_rotated_qdrant_secret_reconnects_the_pipeline(secretsmanager, monkeypatch):
+	from qdrant_client import QdrantClient
+
+	from tests.test_pipeline import make_pipeline
+
+	monkeypatch.delenv("QDRANT_URL", raising=False)
+	monkeypatch.delenv("QDRANT_API_KEY", raising=False)
+	monkeypatch.setattr(main, "secret_cache", main.SecretCache(ttl=0, max_stale=60))
+	monkeypatch.setattr(main, "QDRANT_CLIENT_CLOSE_DELAY_SECONDS", 0)
+	secretsmanager.create_secret(Name="prod/qdrant_api_key", SecretString="old-key")
+	created = []
+
+	def create_qdrant_clients(url, api_key):
+		created.append((url, api_key))
+		return QdrantClient(":memory:"), None
+
+	monkeypatch.setattr(main, "create_qdrant_clients", create_qdrant_clients)
+	pipeline = make_pipeline()
+	old_client = pipeline.client
+
+	async def run():
+		await main.get_qdrant_credentials()
+		watcher = asyncio.create_task(main.watch_qdrant_credentials(pipeline, interval=0.05))
+		await asyncio.sleep(0.2)
+		assert created == []
+		secretsmanager.put_secret_value(SecretId="prod/qdrant_api_key", SecretString="new-key")
+		await asyncio.sleep(0.5)
+		watcher.cancel()
+
+	asyncio.run(run())
+	assert created == [("http://qdrant:6333", "new-key")]
+	assert pipeline.client is not old_client
@@ -0,0 +1,68 @@
+import asyncio
+
+from src.app.singleflight import SingleFlight
+
+
+def test_single_flight_shares_result_and_errors():
+	flight = SingleFlight()
+	calls = []
+
+	async def work():
+		calls.append(1)
+		await asyncio.sleep(0.05)
+		return "answer"
+
+	async def failing():
+		await asyncio.sleep(0.05)
+		raise ValueError("bedrock down")
+
+	async def run():
+		results = await asyncio.gather(*[flight.do("q", work) for _ in range(4)])
+		errors = await asyncio.gather(
+			*[flight.do("f", failing) for _ in range(3)], return_exceptions=True
+		)
+		return results, errors
+
+	results, errors = asyncio.run(run())
+	assert results == ["answer"] * 4
+	assert len(calls) == 1
+	assert all(isinstance(error, ValueError) for error in errors)
+	assert flight.coalesced == 5
+	assert len(flight) == 0
+
+
+def test_single_flight_survives_first_caller_disconnecting():
+	flight = SingleFlight()
+
+	async def work():
+		await asyncio.sleep(0.1)
+		return "answer"
+
+	async def run():
+		first = asyncio.create_task(flight.do("q", work))
+		second = asyncio.create_task(flight.do("q", work))
+		await asyncio.sleep(0.01)
+		first.cancel()
+		return await second, first.cancelled()
+
+	assert asyncio.run(run()) == ("answer", True)
+
+
+def test_single_flight_cancels_work_when_every_caller_leaves():
+	flight = SingleFlight()
+	finished = []
+
+	async def work():
+		await asyncio.sleep(0.1)
+		finished.append(1)
+
+	async def run():
+		callers = [asyncio.create_task(flight.do("q", work)) for _ in range(2)]
+		await asyncio.sleep(0.01)
+		for caller in callers:
+			caller.cancel()
+		await asyncio.sleep(0.15)
+		return len(flight)
+
+	assert asyncio.run(run()) == 0
+	assert finished == []
@@ -0,0 +1,79 @@
+import glob
+
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+from src.cli.splitter import StreamingTextSplitter, iter_pdf_pages, measure_split
+
+DOCUMENTS = sorted(glob.glob("documents/*/*.pdf"))
+
+
+def loader_chunks(paths):
+	pages = [page for path in paths for page in PyPDFLoader(path).load()]
+	docs = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100).split_documents(pages)
+	return [(doc.page_content, doc.metadata) for doc in docs]
+
+
+def streaming_chunks(paths):
+	splitter = StreamingTextSplitter(chunk_size=500, chunk_overlap=100)
+	return [
+		(
+			doc.page_content,
+			{key: value for key, value in doc.metadata.items() if key in ("source", "page")},
+		)
+		for path in paths
+		for doc in splitter.split_pdf(path)
+	]
+
+
+def test_same_chunks_as_the_loader(pdf_dir):
+	paths = sorted(str(path) for path in pdf_dir.glob("*.pdf"))
+	assert streaming_chunks(paths) == loader_chunks(paths)
+
+
+@pytest.mark.skipif(not DOCUMENTS, reason="no documents downloaded")
+@pytest.mark.parametrize("path", DOCUMENTS)
+def test_same_chunks_as_the_loader_on_the_editais(path):
+	assert streaming_chunks([path]) == loader_chunks([path])
+
+
+def test_chunks_carry_their_offsets_in_the_page(pdf_dir):
+	path = str(sorted(pdf_dir.glob("*.pdf"))[0])
+	pages = [page.page_content for page in iter_pdf_pages(path)]
+
+	docs = list(StreamingTextSplitter(chunk_size=120, chunk_overlap=30).split_pdf(path))
+
+	assert len(docs) > len(pages)
+	for doc in docs:
+		page = pages[doc.metadata["page"]]
+		assert page[doc.metadata["start_index"] : doc.metadata["end_index"]] == doc.page_content
+	starts = [doc.metadata["start_index"] for doc in docs if doc.metadata["page"] == 0]
+	assert starts == sorted(starts) and starts[0] == 0
+
+
+def test_pages_are_consumed_lazily():
+	consumed = []
+
+	def pages():
+		for number in range(1000):
+			consumed.append(number)
+			text = " ".join(f"pagina {number} linha {line}" for line in range(50))
+			yield Document(page_content=text, metadata={"page": number})
+
+	chunks = StreamingTextSplitter(chunk_size=200, chunk_overlap=20).split_pages(pages())
+	first = next(chunks)
+
+	assert first.metadata["page"] == 0
+	assert consumed == [0]
+
+
+def test_measure_split_reports_both_splitters(pdf_dir):
+	paths = sorted(str(path) for path in pdf_dir.glob("*.pdf"))
+	loader = measure_split(paths, streaming=False)
+	streaming = measure_split(paths, streaming=True)
+
+	assert loader["chunks"] == streaming["chunks"] > 0
+	assert loader["characters"] == streaming["characters"]
+	assert streaming["chunks_per_second"] > 0 and streaming["peak_rss_mb"] > 0
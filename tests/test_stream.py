@@ -0,0 +1,117 @@
+import json
+import time
+
+from fastapi.testclient import TestClient
+from langchain_community.llms.bedrock import Bedrock
+
+from src.app import main
+from tests.test_pipeline import make_pipeline
+
+FIRST_TOKEN_DELAY = 0.3
+
+
+class FakeBedrockStream:
+	"""Fake bedrock-runtime client that streams Claude completions chunk by chunk."""
+
+	def __init__(self, tokens, first_token_delay=FIRST_TOKEN_DELAY, token_delay=0.01):
+		self.tokens = tokens
+		self.first_token_delay = first_token_delay
+		self.token_delay = token_delay
+		self.bodies = []
+
+	def _events(self):
+		time.sleep(self.first_token_delay)
+		for token in self.tokens:
+			yield {"chunk": {"bytes": json.dumps({"completion": token}).encode()}}
+			time.sleep(self.token_delay)
+
+	def invoke_model_with_response_stream(self, body, modelId, accept, contentType):
+		self.bodies.append(json.loads(body))
+		return {"body": self._events()}
+
+
+def parse_sse(text):
+	events = []
+	for block in text.strip().split("\n\n"):
+		lines = dict(line.split(": ", 1) for line in block.split("\n"))
+		events.append((lines["event"], json.loads(lines["data"])))
+	return events
+
+
+def stream_client(monkeypatch, bedrock):
+	llm = Bedrock(
+		model_id=main.BEDROCK_MODEL_NAME, client=bedrock, model_kwargs=main.inference_modifier
+	)
+
+	async def build_pipeline():
+		return make_pipeline(llm)
+
+	monkeypatch.setattr(main, "build_pipeline", build_pipeline)
+	return TestClient(main.app)
+
+
+def test_stream_sends_sources_then_tokens_then_timings(monkeypatch):
+	bedrock = FakeBedrockStream([" A prova", " sera", " em maio."])
+	with stream_client(monkeypatch, bedrock) as client:
+		response = client.post(
+			"/ask/stream", json={"text": "Quando e a prova?", "temperature": 0.1}
+		)
+
+	assert response.status_code == 200
+	assert response.headers["content-type"].startswith("text/event-stream")
+
+	events = parse_sse(response.text)
+	assert [name for name, _ in events] == ["sources", "token", "token", "token", "done"]
+	assert len(events[0][1]) == 2
+	assert "".join(data["text"] for name, data in events if name == "token") == (
+		" A prova sera em maio."
+	)
+	assert bedrock.bodies[0]["temperature"] == 0.1
+
+	timings = events[-1][1]
+	assert FIRST_TOKEN_DELAY <= timings["time_to_first_token"] < timings["time"]
+
+
+def test_stream_reports_bedrock_errors_as_event(monkeypatch):
+	class FailingBedrock(FakeBedrockStream):
+		def invoke_model_with_response_stream(self, **kwargs):
+			raise RuntimeError("ValidationException")
+
+	with stream_client(monkeypatch, FailingBedrock([])) as client:
+		response = client.post("/ask/stream", json={"text": "Quando e a prova?"})
+
+	events = parse_sse(response.text)
+	assert [name for name, _ in events] == ["sources", "error"]
+	assert "ValidationException" in events[-1][1]["detail"]
+
+
+def test_stream_retries_throttling_until_the_first_token(monkeypatch):
+	class ThrottledOnceBedrock(FakeBedrockStream):
+		def invoke_model_with_response_stream(self, **kwargs):
+			if not self.bodies:
+				self.bodies.append(None)
+				raise RuntimeError("ThrottlingException")
+			return super().invoke_model_with_response_stream(**kwargs)
+
+	bedrock = ThrottledOnceBedrock([" A prova", " sera", " em maio."], first_token_delay=0)
+	with stream_client(monkeypatch, bedrock) as client:
+		response = client.post("/ask/stream", json={"text": "Quando e a prova?"})
+
+	events = parse_sse(response.text)
+	assert [name for name, _ in events] == ["sources", "token", "token", "token", "done"]
+	assert len(bedrock.bodies) == 2
+
+
+def test_stream_does_not_retry_after_the_first_token(monkeypatch):
+	class DroppedBedrock(FakeBedrockStream):
+		def _events(self):
+			yield from list(super()._events())[:1]
+			raise RuntimeError("ThrottlingException")
+
+	bedrock = DroppedBedrock([" A prova", " sera"], first_token_delay=0)
+	with stream_client(monkeypatch, bedrock) as client:
+		response = client.post("/ask/stream", json={"text": "Quando e a prova?"})
+
+	events = parse_sse(response.text)
+	assert [name for name, _ in events] == ["sources", "token", "error"]
+	assert len(bedrock.bodies) == 1
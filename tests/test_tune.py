@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from langchain_community.embeddings.fake import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from src.cli import tune as tune_module
+from src.cli.tune import TuneResult, hold_out, pareto_front, read_points, tune
+
+
+class IndexingQdrant(QdrantClient):
+	"""In-memory client reporting GREEN a few polls before the vectors are indexed."""
+
+	def __init__(self, polls: int):
+		super().__init__(":memory:")
+		self.polls = polls
+		self.pending = {}
+
+	def upsert(self, collection_name, points, **kwargs):
+		self.pending[collection_name] = self.polls
+		return super().upsert(collection_name, points, **kwargs)
+
+	def get_collection(self, collection_name):
+		info = super().get_collection(collection_name)
+		if self.pending.get(collection_name):
+			self.pending[collection_name] -= 1
+			return info.model_copy(update={"indexed_vectors_count": 0})
+		return info.model_copy(update={"indexed_vectors_count": info.points_count})
+
+
+@pytest.fixture
+def source():
+	client = QdrantClient(":memory:")
+	client.create_collection(
+		"cnu", vectors_config=models.VectorParams(size=16, distance=models.Distance.COSINE)
+	)
+	embeddings = DeterministicFakeEmbedding(size=16)
+	client.upsert(
+		"cnu",
+		points=[
+			models.PointStruct(id=i, vector=embeddings.embed_query(f"chunk {i}"))
+			for i in range(150)
+		],
+	)
+	return client
+
+
+def result(recall, p50_ms):
+	return TuneResult(16, 128, 64, recall, p50_ms, p50_ms * 2, 1.0)
+
+
+def test_pareto_front():
+	results = [result(0.90, 1.0), result(0.95, 2.0), result(0.93, 3.0), result(0.99, 4.0)]
+	pareto_front(results)
+	assert [result.pareto for result in results] == [True, True, False, True]
+
+
+def test_held_out_queries_are_not_indexed(source):
+	ids, vectors, distance = read_points(source, "cnu")
+	assert distance == models.Distance.COSINE
+	indexed, indexed_vectors, queries = hold_out(ids, vectors, 20)
+	assert len(indexed) == len(indexed_vectors) == 130 and len(queries) == 20
+	assert not any((indexed_vectors == query).all(axis=1).any() for query in queries)
+
+
+@pytest.mark.parametrize(
+	"points, queries, error",
+	[(0, 20, "has 0 points"), (1, 20, "has 1 points"), (10, 0, "At least one query")],
+)
+def test_hold_out_rejects_what_it_cannot_split(points, queries, error):
+	with pytest.raises(ValueError, match=error):
+		hold_out(list(range(points)), np.zeros((points, 16)), queries)
+
+
+def test_tune_sweeps_every_combination(source, monkeypatch):
+	monkeypatch.setattr(tune_module, "POLL_SECONDS", 0)
+	target = IndexingQdrant(polls=3)
+	progress = []
+	results = tune(
+		source,
+		"cnu",
+		target,
+		m_values=[8, 16],
+		ef_construct_values=[64],
+		hnsw_ef_values=[16, 64],
+		queries=20,
+		k=2,
+		progress=progress.append,
+	)
+	assert [(r.m, r.ef_construct, r.hnsw_ef) for r in results] == [
+		(8, 64, 16),
+		(8, 64, 64),
+		(16, 64, 16),
+		(16, 64, 64),
+	]
+	assert progress == results
+	# The local mode searches exhaustively, on a server recall depends on the parameters.
+	assert all(r.recall == 1.0 and r.p99_ms >= r.p50_ms > 0 for r in results)
+	assert any(r.pareto for r in results)
+	assert not target.get_collections().collections
+	# GREEN alone did not end the wait, every copy waited for its vectors to be indexed.
+	assert set(target.pending.values()) == {0}
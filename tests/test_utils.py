@@ -1,6 +1,7 @@
+import importlib
+
 import pytest
-from lambda_functions.src.utils import get_embeddings, Embedding, Embeddings
-from langchain_community.embeddings import BedrockEmbeddings
+from lambda_functions.src.utils import Embedding, Embeddings
 
 
 def test_embedding_invalid():
@@ -14,8 +15,11 @@ def test_embedding_valid():
 	assert embedding.embeddings == Embeddings.BEDROCK
 
 
-def test_get_embeddings_bedrock():
-	embedding = Embedding(Embeddings.BEDROCK, "amazon.titan-embed-text-v1")
-	result = get_embeddings(embedding, "us-east-1")
-	assert isinstance(result, BedrockEmbeddings)
+def test_get_embeddings_bedrock(lambda_src, aws_credentials):
+	utils = importlib.import_module("utils")
+	bedrock_embeddings = importlib.import_module("bedrock_embeddings")
+	embedding = utils.Embedding(utils.Embeddings.BEDROCK, "amazon.titan-embed-text-v1")
+	result = utils.get_embeddings(embedding, "us-east-1")
+	assert isinstance(result, bedrock_embeddings.BedrockBulkEmbeddings)
 	assert result.model_id == "amazon.titan-embed-text-v1"
+	assert result.client.meta.config.max_pool_connections == utils.BEDROCK_MAX_CONCURRENCY